@@ -0,0 +1,48 @@
+# -*- encoding: utf8 -*-
+"""Compare evaluation of related expressions compiled independently and
+together with common subexpression elimination.
+
+Run from the repository root:
+
+    python benchmarks/bench_batch.py
+"""
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expressions.evaluator import PythonCodeCompiler
+
+
+MEASURES = [
+    "revenue - cost",
+    "(revenue - cost) / revenue",
+    "(revenue - cost) * fx.rate",
+    "(revenue - cost) * fx.rate / units",
+    "sqrt((revenue - cost) * fx.rate / units) + 1",
+    "max(revenue - cost, 0) * fx.rate",
+]
+
+ROW = {"revenue": 120.0, "cost": 80.0, "fx.rate": 1.1, "units": 7}
+
+
+def main(number=300000):
+    compiler = PythonCodeCompiler()
+    evaluators = [compiler.compile(text) for text in MEASURES]
+    batch = compiler.compile_many(MEASURES)
+
+    independent = min(timeit.repeat(
+        lambda: [evaluator(ROW) for evaluator in evaluators],
+        number=number, repeat=3))
+    shared = min(timeit.repeat(lambda: batch(ROW), number=number, repeat=3))
+
+    print("{} measures".format(len(MEASURES)))
+    print("independent: {:6.0f} ns/row".format(independent / number * 1e9))
+    print("compile_many: {:5.0f} ns/row".format(shared / number * 1e9))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
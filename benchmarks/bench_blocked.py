@@ -0,0 +1,65 @@
+# -*- encoding: utf8 -*-
+"""Compare peak memory and throughput of whole-array and blocked vectorized
+evaluation.
+
+Run from the repository root:
+
+    python benchmarks/bench_blocked.py [ROWS]
+"""
+from __future__ import print_function
+
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy
+
+from expressions.vectorized import NumpyCompiler
+
+
+EXPRESSIONS = [
+    "a * b + c * d - e",
+    "max(a * b, c) / (d + 1) + sqrt(e) * 2",
+]
+
+
+def measure(function):
+    # Tracing slows down allocations, measure time separately
+    start = time.time()
+    function()
+    elapsed = time.time() - start
+
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main(rows=10000000):
+    columns = dict((name, numpy.random.random(rows)) for name in "abcde")
+    out = numpy.empty(rows)
+    compiler = NumpyCompiler()
+
+    print("{} rows".format(rows))
+    for text in EXPRESSIONS:
+        plan = compiler.compile(text)
+
+        print(text)
+        whole_time, whole_peak = measure(lambda: plan.execute(columns))
+        print("  whole array: {:8.1f} MB peak, {:6.1f} M rows/s"
+              .format(whole_peak / 1e6, rows / whole_time / 1e6))
+
+        for block_size in [4096, 16384, 65536]:
+            elapsed, peak = measure(
+                lambda: plan.execute_blocked(columns, out=out,
+                                             block_size=block_size))
+            print("  blocks {:6}: {:8.1f} MB peak, {:6.1f} M rows/s"
+                  .format(block_size, peak / 1e6, rows / elapsed / 1e6))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,52 @@
+# -*- encoding: utf8 -*-
+"""Compare compiling the same expressions with and without the parsed
+expression cache.
+
+Run from the repository root:
+
+    python benchmarks/bench_cache.py
+"""
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expressions import Compiler, ExpressionCache, ExpressionInspector
+
+
+EXPRESSIONS = [
+    "(amount / transactions) * 2",
+    "date.year == 2010 and amount > 10",
+    "sum(price * quantity) / count() - discount.rate ^ 2",
+    "not (a < b or c >= d) and e in f and 'text' != g.h.i",
+] + ["revenue_{0} - cost_{0} * fx.rate_{0}".format(i) for i in range(100)]
+
+
+def measure(compiler_class, cache, number):
+    def run():
+        for text in EXPRESSIONS:
+            compiler = compiler_class()
+            compiler.cache = cache
+            compiler.compile(text)
+    return min(timeit.repeat(run, number=number, repeat=3)) / number
+
+
+def main(number=50):
+    for compiler_class in [Compiler, ExpressionInspector]:
+        cache = ExpressionCache()
+        uncached = measure(compiler_class, None, number)
+        cached = measure(compiler_class, cache, number)
+
+        print("{}:".format(compiler_class.__name__))
+        print("  parse every time: {:8.1f} us per expression"
+              .format(uncached * 1e6 / len(EXPRESSIONS)))
+        print("  cached:           {:8.1f} us per expression ({:.1f}x)"
+              .format(cached * 1e6 / len(EXPRESSIONS), uncached / cached))
+        print("  {}".format(cache.info()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# -*- encoding: utf8 -*-
+"""Measure throughput of `inspect_catalogue()` on a catalogue of formulas
+with duplicates and invalid expressions, compared with compiling the
+formulas one by one.
+
+Run from the repository root:
+
+    python benchmarks/bench_catalogue.py [EXPRESSIONS]
+"""
+from __future__ import print_function
+
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expressions import ExpressionError, ExpressionInspector
+from expressions.catalogue import inspect_catalogue
+
+from bench_nodes import random_expression, VARIABLES, FUNCTIONS
+
+
+def catalogue(count):
+    random.seed(0)
+    texts = []
+    for i in range(count):
+        if texts and random.random() < 0.2:
+            texts.append(random.choice(texts))
+        elif random.random() < 0.01:
+            texts.append(random_expression(4) + " +")
+        else:
+            texts.append(random_expression(5))
+    return texts
+
+
+def one_by_one(texts):
+    allowed = set(VARIABLES)
+    invalid = 0
+    for text in texts:
+        inspector = ExpressionInspector()
+        inspector.cache = None
+        try:
+            variables, _ = inspector.compile(text)
+        except ExpressionError:
+            invalid += 1
+        else:
+            invalid += bool(variables - allowed)
+    return invalid
+
+
+def main(count=50000):
+    texts = catalogue(count)
+    cpus = multiprocessing.cpu_count()
+
+    start = time.time()
+    one_by_one(texts)
+    baseline = time.time() - start
+    print("one by one:            {:6.2f} s  {:8.0f} expressions/s"
+          .format(baseline, count / baseline))
+
+    for workers in sorted(set([1, cpus])):
+        start = time.time()
+        report = inspect_catalogue(texts, variables=VARIABLES,
+                                   functions=FUNCTIONS, workers=workers)
+        elapsed = time.time() - start
+        print("catalogue, {:2} workers: {:6.2f} s  {:8.0f} expressions/s "
+              "({:.1f}x)".format(workers, elapsed, count / elapsed,
+                                 baseline / elapsed))
+
+    print("{} expressions, {} distinct, {} invalid"
+          .format(len(report), report.distinct, len(report.invalid)))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,55 @@
+# -*- encoding: utf8 -*-
+"""Measure parsing of deeply nested expressions and of long flat chains of
+operators. Times are per nesting level or per term.
+
+Run from the repository root:
+
+    python benchmarks/bench_deep.py [DEPTH]
+"""
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expressions import Compiler, parse_expression
+
+
+def shapes(depth):
+    return [
+        ("parentheses", depth, "(" * depth + "a" + ")" * depth),
+        ("unary minus", depth, "-" * depth + "a"),
+        ("not", depth, "not " * depth + "a"),
+        ("function calls", depth, "f(" * depth + "a" + ")" * depth),
+        ("power", depth, "^".join(["a"] * depth)),
+        ("nested sums", depth, "(a + " * depth + "b" + ")" * depth),
+        ("flat chain", 10 * depth, " + ".join(["a"] * (10 * depth))),
+    ]
+
+
+def measure(function, text):
+    best = None
+    for _ in range(3):
+        start = time.time()
+        function(text)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(depth=10000):
+    compiler = Compiler(cache=False)
+    print("{:16} {:>8} {:>12} {:>12}".format("", "size", "compile",
+                                             "parse only"))
+    for name, size, text in shapes(depth):
+        compiled = measure(compiler.compile, text)
+        parsed = measure(parse_expression, text)
+        print("{:16} {:8} {:9.2f} us {:9.2f} us"
+              .format(name, size, compiled * 1e6 / size,
+                      parsed * 1e6 / size))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,90 @@
+# -*- encoding: utf8 -*-
+"""Compare evaluation of an expression compiled into a Python function with
+a naive recursive interpreter of the default semantic graph.
+
+Run from the repository root:
+
+    python benchmarks/bench_evaluator.py
+"""
+from __future__ import print_function
+from __future__ import division
+
+import operator
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expressions import Compiler, Variable, BinaryOperator, UnaryOperator
+from expressions import Function
+from expressions.evaluator import PythonCodeCompiler, default_functions
+
+
+BINARY = {
+    "+": operator.add, "-": operator.sub, "*": operator.mul,
+    "/": operator.truediv, "//": operator.floordiv, "%": operator.mod,
+    "^": operator.pow, "<": operator.lt, "<=": operator.le,
+    "==": operator.eq, "!=": operator.ne, ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+def interpret(node, row):
+    if isinstance(node, Variable):
+        return row[node.name]
+    elif isinstance(node, BinaryOperator):
+        left = interpret(node.left, row)
+        if node.operator == "and":
+            return left and interpret(node.right, row)
+        elif node.operator == "or":
+            return left or interpret(node.right, row)
+        return BINARY[node.operator](left, interpret(node.right, row))
+    elif isinstance(node, UnaryOperator):
+        operand = interpret(node.operand, row)
+        if node.operator == "not":
+            return not operand
+        elif node.operator == "-":
+            return -operand
+        return operand
+    elif isinstance(node, Function):
+        args = [interpret(arg, row) for arg in node.args]
+        return default_functions[node.name](*args)
+    else:
+        return node
+
+
+EXPRESSIONS = [
+    "(amount / transactions) * 2",
+    "max(price * quantity - discount, 0) / 100",
+    "amount > 10 and transactions < 100 or amount == 0",
+]
+
+ROWS = [{"amount": i, "transactions": i % 7 + 1, "price": i * 0.5,
+         "quantity": i % 13, "discount": 3} for i in range(100000)]
+
+
+def main():
+    for text in EXPRESSIONS:
+        graph = Compiler().compile(text)
+        evaluator = PythonCodeCompiler().compile(text)
+
+        assert [interpret(graph, row) for row in ROWS[:100]] \
+                == list(evaluator.evaluate(ROWS[:100]))
+
+        interpreted = min(timeit.repeat(
+            lambda: [interpret(graph, row) for row in ROWS],
+            number=1, repeat=3))
+        compiled = min(timeit.repeat(
+            lambda: list(evaluator.evaluate(ROWS)),
+            number=1, repeat=3))
+
+        print(text)
+        print("  interpreter: {:6.3f} us per row".format(
+            interpreted * 1e6 / len(ROWS)))
+        print("  compiled:    {:6.3f} us per row ({:.1f}x)".format(
+            compiled * 1e6 / len(ROWS), interpreted / compiled))
+
+
+if __name__ == "__main__":
+    main()
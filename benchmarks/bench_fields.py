@@ -0,0 +1,70 @@
+# -*- encoding: utf8 -*-
+"""Measure incremental recomputation of calculated fields by
+`FieldValues.update()` compared with evaluation of all the fields after
+every change of an input.
+
+Run from the repository root:
+
+    python benchmarks/bench_fields.py [FIELDS]
+"""
+from __future__ import print_function
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expressions.fields import FieldGraph
+
+
+def fields(count, inputs):
+    """Return layered fields: every field combines two earlier fields or
+    inputs of the same group of inputs."""
+    random.seed(0)
+    groups = 20
+    names = [["in{}.{}".format(group, i) for i in range(inputs // groups)]
+             for group in range(groups)]
+    result = []
+    for i in range(count):
+        group = names[i % groups]
+        name = "f{}.{}".format(i % groups, i)
+        text = "{} * 2 + {} - 1".format(random.choice(group),
+                                        random.choice(group))
+        result.append((name, text))
+        group.append(name)
+    return result
+
+
+def main(count=2000, updates=200):
+    inputs = 200
+    graph = FieldGraph(fields(count, inputs))
+    values = dict((name, 1) for name in graph.inputs)
+    names = sorted(graph.inputs)
+    changes = [{random.choice(names): i} for i in range(updates)]
+
+    start = time.time()
+    for change in changes:
+        values.update(change)
+        graph.evaluate(values)
+    full = time.time() - start
+
+    state = graph.values(values)
+    start = time.time()
+    for change in changes:
+        state.update(change)
+    incremental = time.time() - start
+
+    print("{} fields, {} inputs, {} updates of one input"
+          .format(count, len(names), updates))
+    print("full evaluation: {:8.2f} ms per update"
+          .format(full * 1e3 / updates))
+    print("incremental:     {:8.2f} ms per update, {:.1f} fields evaluated"
+          " ({:.1f}x)".format(incremental * 1e3 / updates,
+                              float(state.evaluations) / updates,
+                              full / incremental))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,55 @@
+# -*- encoding: utf8 -*-
+"""Compare collecting variable and function names by parsing the expressions
+with `ExpressionInspector` and by scanning the tokens with `scan_names()`.
+
+Run from the repository root:
+
+    python benchmarks/bench_inspect.py [EXPRESSIONS]
+"""
+from __future__ import print_function
+
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expressions import ExpressionCache, ExpressionInspector
+from expressions.parser import scan_names
+
+from bench_nodes import random_expression
+
+
+def measure(function, texts, number=3):
+    def run():
+        for text in texts:
+            function(text)
+    return min(timeit.repeat(run, number=number, repeat=3)) / number
+
+
+def main(count=5000):
+    random.seed(0)
+    texts = [random_expression(5) for _ in range(count)]
+
+    uncached = ExpressionInspector()
+    uncached.cache = None
+    cached = ExpressionInspector()
+    cached.cache = ExpressionCache(count)
+    for text in texts:
+        cached.compile(text)
+
+    results = [
+        ("inspector, parse", measure(uncached.compile, texts)),
+        ("inspector, cached", measure(cached.compile, texts)),
+        ("scan_names", measure(scan_names, texts)),
+    ]
+
+    slowest = results[0][1]
+    for name, seconds in results:
+        print("{:20} {:8.2f} us per expression ({:.1f}x)"
+              .format(name, seconds * 1e6 / count, slowest / seconds))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
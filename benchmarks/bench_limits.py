@@ -0,0 +1,60 @@
+# -*- encoding: utf8 -*-
+"""Measure how long it takes to reject hostile expressions with `Limits`
+compared with compiling them without limits.
+
+Run from the repository root:
+
+    python benchmarks/bench_limits.py
+"""
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expressions import ExpressionError, Limits
+from expressions.evaluator import PythonCodeCompiler
+
+
+LIMITS = Limits(max_length=4096, max_depth=64, max_nodes=512,
+                max_arguments=32, max_string=256)
+
+HOSTILE = [
+    ("long text", " + ".join(["a"] * 50000)),
+    ("parentheses", "(" * 2000 + "a" + ")" * 2000),
+    ("deep nesting", "(a + " * 1000 + "a" + ")" * 1000),
+    ("deep, short", "-" * 1000 + "a"),
+    ("many nodes", "+".join(["a"] * 2000)),
+    ("many arguments", "max({})".format(",".join(["a"] * 2000))),
+    ("long string", "'{}'".format("x" * 4000)),
+]
+
+
+def measure(compiler, text):
+    start = time.time()
+    try:
+        compiler.compile(text)
+    except ExpressionError as e:
+        outcome = type(e).__name__
+    else:
+        outcome = "compiled"
+    return time.time() - start, outcome
+
+
+def main():
+    unlimited = PythonCodeCompiler(cache=False)
+    limited = PythonCodeCompiler(cache=False, limits=LIMITS)
+
+    print("{:16} {:>24} {:>32}".format("", "no limits", "limits"))
+    for name, text in HOSTILE:
+        plain, plain_outcome = measure(unlimited, text)
+        checked, outcome = measure(limited, text)
+        print("{:16} {:9.2f} ms {:>11} {:9.2f} ms {:>20}"
+              .format(name, plain * 1e3, plain_outcome, checked * 1e3,
+                      outcome))
+
+
+if __name__ == "__main__":
+    main()
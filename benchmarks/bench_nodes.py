@@ -0,0 +1,77 @@
+# -*- encoding: utf8 -*-
+"""Measure memory used by expression graphs built by the default
+`Compiler`.
+
+Run from the repository root:
+
+    python benchmarks/bench_nodes.py [EXPRESSIONS]
+"""
+from __future__ import print_function
+
+import gc
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expressions import Compiler, Node
+
+
+VARIABLES = ["amount", "price", "quantity", "discount", "tax.rate",
+             "fx.rate", "order.customer.region", "cost"]
+FUNCTIONS = ["min", "max", "round", "coalesce"]
+OPERATORS = ["+", "-", "*", "/", "<", "and"]
+
+
+def random_expression(depth=4):
+    if depth == 0 or random.random() < 0.2:
+        if random.random() < 0.7:
+            return random.choice(VARIABLES)
+        return str(random.randint(0, 100))
+    elif random.random() < 0.2:
+        return "{}({}, {})".format(random.choice(FUNCTIONS),
+                                   random_expression(depth - 1),
+                                   random_expression(depth - 1))
+    elif random.random() < 0.1:
+        return "-{}".format(random_expression(depth - 1))
+    else:
+        return "({} {} {})".format(random_expression(depth - 1),
+                                   random.choice(OPERATORS),
+                                   random_expression(depth - 1))
+
+
+def count_nodes(obj):
+    if not isinstance(obj, Node):
+        return 0
+    count = 1
+    for child in [getattr(obj, "left", None), getattr(obj, "right", None),
+                  getattr(obj, "operand", None)] + getattr(obj, "args", []):
+        count += count_nodes(child)
+    return count
+
+
+def main(count=20000):
+    random.seed(0)
+    texts = [random_expression() for _ in range(count)]
+    compiler = Compiler(cache=False)
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    graphs = [compiler.compile(text) for text in texts]
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    nodes = sum(count_nodes(graph) for graph in graphs)
+    # The list holding the graphs is not part of the graphs
+    size = after - before - sys.getsizeof(graphs)
+
+    print("{} expressions, {} nodes".format(count, nodes))
+    print("{:.1f} MB, {:.1f} bytes per node".format(size / 1e6, size / nodes))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
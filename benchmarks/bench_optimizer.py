@@ -0,0 +1,47 @@
+# -*- encoding: utf8 -*-
+"""Compare evaluation of compiled expressions with and without the
+optimization pass.
+
+Run from the repository root:
+
+    python benchmarks/bench_optimizer.py
+"""
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expressions.evaluator import PythonCodeCompiler
+
+
+EXPRESSIONS = [
+    "price * (1 + 0.2)",
+    "(x - y) * 1 + 0",
+    "- - (x / y) * 1",
+    "amount / 4.0 + 2 ^ 10 - sqrt(16)",
+    "(price - discount * (1 - 0.25)) * (1 + 0.21) / 100.0",
+]
+
+ROW = {"price": 12.5, "discount": 2.0, "x": 3.0, "y": 4.0, "amount": 100}
+
+
+def main(number=1000000):
+    plain = PythonCodeCompiler()
+    optimizing = PythonCodeCompiler(optimize=True)
+
+    for text in EXPRESSIONS:
+        results = []
+        for compiler in [plain, optimizing]:
+            evaluator = compiler.compile(text)
+            results.append(min(timeit.repeat(lambda: evaluator(ROW),
+                                             number=number, repeat=3)))
+        print("{:55} {:6.0f} ns {:6.0f} ns optimized"
+              .format(text, results[0] / number * 1e9,
+                      results[1] / number * 1e9))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,62 @@
+# -*- encoding: utf8 -*-
+"""Compare single-core blocked evaluation with the parallel executor.
+
+Run from the repository root:
+
+    python benchmarks/bench_parallel.py [ROWS]
+"""
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy
+
+from expressions.vectorized import NumpyCompiler
+from expressions.parallel import ParallelExecutor
+
+
+EXPRESSIONS = [
+    "a * b + c * d - e",
+    "sqrt(a * b) + exp(c) * log(d + 1) - abs(e)",
+]
+
+
+def measure(function, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        function()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(rows=20000000):
+    columns = dict((name, numpy.random.random(rows)) for name in "abcde")
+    out = numpy.empty(rows)
+    compiler = NumpyCompiler()
+    cpus = os.cpu_count() or 1
+
+    print("{} rows, {} CPUs".format(rows, cpus))
+    for text in EXPRESSIONS:
+        plan = compiler.compile(text)
+
+        print(text)
+        elapsed = measure(lambda: plan.execute_blocked(columns, out=out))
+        print("  single core: {:6.1f} M rows/s".format(rows / elapsed / 1e6))
+
+        for workers in sorted(set([2, 4, cpus])):
+            with ParallelExecutor(plan, workers=workers) as executor:
+                # Start the pool outside of the measurement
+                executor.execute(columns, out=out)
+                elapsed = measure(lambda: executor.execute(columns, out=out))
+            print("  {:2} workers:  {:6.1f} M rows/s"
+                  .format(workers, rows / elapsed / 1e6))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
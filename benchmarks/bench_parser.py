@@ -0,0 +1,53 @@
+# -*- encoding: utf8 -*-
+"""Compare the hand-written parser with the Grako-generated parser.
+
+Run from the repository root:
+
+    python benchmarks/bench_parser.py
+"""
+from __future__ import print_function
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expressions import Compiler
+
+
+EXPRESSIONS = [
+    "a + 1",
+    "min(a, b) * 2",
+    "(amount / transactions) * 2",
+    "date.year == 2010 and amount > 10",
+    "sum(price * quantity) / count() - discount.rate ^ 2",
+    "not (a < b or c >= d) and e in f and 'text' != g.h.i",
+    "((((a + b) * (c - d)) / ((e % f) // g)) << 1) | (h & ~i)",
+]
+
+
+def measure(compiler, number):
+    def run():
+        for text in EXPRESSIONS:
+            compiler.compile(text)
+    return min(timeit.repeat(run, number=number, repeat=3)) / number
+
+
+def main(number=200):
+    native = measure(Compiler(parser="native", cache=False), number)
+    print("native: {:10.1f} us per {} expressions"
+          .format(native * 1e6, len(EXPRESSIONS)))
+
+    try:
+        grako = measure(Compiler(parser="grako", cache=False), number)
+    except ImportError as e:
+        print("grako:  not available ({})".format(e))
+    else:
+        print("grako:  {:10.1f} us per {} expressions"
+              .format(grako * 1e6, len(EXPRESSIONS)))
+        print("speedup: {:.1f}x".format(grako / native))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# -*- encoding: utf8 -*-
+"""Measure cold start of a process that compiles a catalogue of expressions:
+parsing every expression versus loading them from a `PersistentCache`.
+
+Run from the repository root:
+
+    python benchmarks/bench_persistent.py [EXPRESSIONS]
+"""
+from __future__ import print_function
+
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_nodes import random_expression
+
+
+STARTUP = """
+import sys, time
+start = time.time()
+sys.path.insert(0, {root!r})
+from expressions import Compiler
+from expressions.serialization import PersistentCache
+texts = open({corpus!r}).read().splitlines()
+cache = PersistentCache({path!r}) if {persistent!r} else False
+compiler = Compiler(cache=cache)
+for text in texts:
+    compiler.compile(text)
+if cache:
+    cache.save()
+print(time.time() - start)
+"""
+
+
+def startup(corpus, path, persistent):
+    code = STARTUP.format(root=ROOT, corpus=corpus, path=path,
+                          persistent=persistent)
+    output = subprocess.check_output([sys.executable, "-c", code])
+    return float(output)
+
+
+def main(count=5000):
+    random.seed(0)
+    directory = tempfile.mkdtemp()
+    try:
+        corpus = os.path.join(directory, "corpus")
+        path = os.path.join(directory, "cache")
+        with open(corpus, "w") as f:
+            f.write("\n".join(random_expression(6) for _ in range(count)))
+
+        parse = min(startup(corpus, path, False) for _ in range(3))
+        # The first run writes the cache file
+        write = startup(corpus, path, True)
+        load = min(startup(corpus, path, True) for _ in range(3))
+
+        print("{} expressions, cache file {:.1f} kB"
+              .format(count, os.path.getsize(path) / 1e3))
+        print("parse:       {:6.3f} s".format(parse))
+        print("write cache: {:6.3f} s".format(write))
+        print("load cache:  {:6.3f} s".format(load))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
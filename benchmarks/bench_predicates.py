@@ -0,0 +1,88 @@
+# -*- encoding: utf8 -*-
+"""Measure filtering of rows by selective predicates: a full scan evaluating
+the compiled expression for every row compared with `PredicateFilter` which
+looks the constraints up in sorted indexes first, and pruning of partitions
+by their minimum and maximum values.
+
+Run from the repository root:
+
+    python benchmarks/bench_predicates.py [ROWS] [PARTITION_SIZE]
+"""
+from __future__ import print_function
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expressions.evaluator import PythonCodeCompiler
+from expressions.predicates import PredicateFilter, analyze_predicate
+
+
+REGIONS = ["EU", "US", "DE", "CZ", "SK", "FR", "UK", "JP", "CN", "BR"]
+
+PREDICATES = [
+    "region == 'EU' and amount >= 100 and amount < 500",
+    "amount >= 990",
+    "(region == 'DE' or region == 'CZ') and amount < 20",
+    "region == 'JP' and amount > 900 and quantity % 2 == 0",
+    "day >= 360 and day < 362",
+]
+
+
+def rows(count):
+    random.seed(0)
+    return [{"region": random.choice(REGIONS),
+             "amount": random.random() * 1000,
+             "quantity": random.randint(1, 100),
+             "day": i * 365 // count}
+            for i in range(count)]
+
+
+def main(count=200000, partition_size=10000):
+    data = rows(count)
+    compiler = PythonCodeCompiler()
+    start = time.time()
+    table = PredicateFilter(data, ["region", "amount", "day"])
+    indexing = time.time() - start
+
+    print("{} rows, indexes built in {:.0f} ms".format(count,
+                                                       indexing * 1e3))
+    for text in PREDICATES:
+        function = compiler.compile(text)
+        start = time.time()
+        expected = [i for i, row in enumerate(data) if function(row)]
+        scan = time.time() - start
+
+        evaluations = table.evaluations
+        start = time.time()
+        positions = table.positions(text)
+        indexed = time.time() - start
+        assert positions == expected
+
+        print("{}\n    {} rows, scan {:7.1f} ms, index {:7.1f} ms ({:.0f}x),"
+              " {} rows evaluated"
+              .format(text, len(positions), scan * 1e3, indexed * 1e3,
+                      scan / indexed, table.evaluations - evaluations))
+
+    # Partitions of consecutive rows with minimum and maximum of every
+    # variable, as kept by columnar file formats
+    partitions = []
+    for offset in range(0, count, partition_size):
+        chunk = data[offset:offset + partition_size]
+        partitions.append(dict((name, (min(row[name] for row in chunk),
+                                       max(row[name] for row in chunk)))
+                               for name in ["amount", "day"]))
+
+    for text in PREDICATES:
+        predicate = analyze_predicate(text)
+        skipped = sum(1 for statistics in partitions
+                      if not predicate.may_match(statistics))
+        print("{}: {} of {} partitions skipped".format(text, skipped,
+                                                       len(partitions)))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
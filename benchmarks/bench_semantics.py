@@ -0,0 +1,107 @@
+# -*- encoding: utf8 -*-
+"""Measure the cost of the Grako parser semantic actions per expression
+node: time and number of `_Result` wrappers created. The semantic actions
+called by the parser are recorded once and replayed without the parser, so
+the time of Grako itself is not included. Requires Grako.
+
+Run from the repository root:
+
+    python benchmarks/bench_semantics.py [EXPRESSIONS]
+"""
+from __future__ import print_function
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expressions import Compiler, parse_expression
+from expressions import semantics
+
+from bench_nodes import random_expression
+
+
+class _Recorder(object):
+    """Semantics which records calls of the wrapped semantic actions."""
+
+    def __init__(self, semantics, calls):
+        self._semantics = semantics
+        self._calls = calls
+
+    def __getattr__(self, name):
+        action = getattr(self._semantics, name)
+        calls = self._calls
+
+        def record(ast, *args):
+            calls.append((name, ast, args))
+            return action(ast, *args)
+        return record
+
+
+def record_calls(compiler, texts):
+    """Return list of semantic actions called by the Grako parser while
+    parsing `texts`."""
+    calls = []
+    for text in texts:
+        recorder = _Recorder(semantics._ExpressionSemantics(compiler, None),
+                             calls)
+        semantics._parser().parse(text, rule_name="arithmetic_expression",
+                                  comments_re="#.*", ignorecase=False,
+                                  semantics=recorder)
+    return calls
+
+
+def replay(compiler, calls):
+    actions = semantics._ExpressionSemantics(compiler, None)
+    for name, ast, args in calls:
+        getattr(actions, name)(ast, *args)
+
+
+def count_results(compiler, calls):
+    """Return number of `_Result` objects created by replay of `calls`."""
+    counter = [0]
+
+    def counting_new(cls, *args):
+        counter[0] += 1
+        return object.__new__(cls)
+
+    semantics._Result.__new__ = staticmethod(counting_new)
+    try:
+        replay(compiler, calls)
+    finally:
+        del semantics._Result.__new__
+    return counter[0]
+
+
+def main(count=200):
+    try:
+        semantics._parser()
+    except ImportError:
+        print("Grako is not available")
+        return
+
+    random.seed(0)
+    texts = [random_expression(5) for _ in range(count)]
+    nodes = sum(len(parse_expression(text).instructions) for text in texts)
+    compiler = Compiler()
+    calls = record_calls(compiler, texts)
+
+    best = None
+    for _ in range(5):
+        start = time.time()
+        replay(compiler, calls)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    results = count_results(compiler, calls)
+
+    print("{} expressions, {} nodes, {} semantic actions"
+          .format(count, nodes, len(calls)))
+    print("time per node:    {:8.2f} us".format(best * 1e6 / nodes))
+    print("results per node: {:8.2f}".format(float(results) / nodes))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
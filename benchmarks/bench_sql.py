@@ -0,0 +1,61 @@
+# -*- encoding: utf8 -*-
+"""Measure compilation of expressions into SQL by `SQLCompiler` with and
+without the SQL text cache, and the number of distinct SQL texts of
+formulas which differ only in their literals.
+
+Run from the repository root:
+
+    python benchmarks/bench_sql.py [EXPRESSIONS]
+"""
+from __future__ import print_function
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expressions import ExpressionCache
+from expressions.sql import SQLCompiler
+
+from bench_nodes import random_expression
+
+
+def formulas(count, shapes=100):
+    """Return `count` formulas of `shapes` structures with random
+    literals."""
+    random.seed(0)
+    templates = [random_expression(4) + " * {} + {}" for _ in range(shapes)]
+    return [random.choice(templates).format(random.randint(1, 1000),
+                                            random.random())
+            for _ in range(count)]
+
+
+def measure(compiler, texts):
+    start = time.time()
+    statements = set(compiler.compile(text).sql for text in texts)
+    return time.time() - start, len(statements)
+
+
+def main(count=20000):
+    texts = formulas(count)
+
+    # Parse the texts into the parser cache first, only the compilation is
+    # measured
+    cache = ExpressionCache(maxsize=count)
+    uncached = SQLCompiler(statement_cache_size=0, cache=cache)
+    measure(uncached, texts)
+
+    plain, statements = measure(uncached, texts)
+    cached, _ = measure(SQLCompiler(cache=cache), texts)
+
+    print("{} formulas, {} distinct SQL texts".format(count, statements))
+    print("without SQL cache: {:8.2f} us per formula"
+          .format(plain * 1e6 / count))
+    print("with SQL cache:    {:8.2f} us per formula ({:.1f}x)"
+          .format(cached * 1e6 / count, plain / cached))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
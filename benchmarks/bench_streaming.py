@@ -0,0 +1,61 @@
+# -*- encoding: utf8 -*-
+"""Compare streaming evaluation of CSV rows with converting whole rows read
+by `csv.DictReader`.
+
+Run from the repository root:
+
+    python benchmarks/bench_streaming.py [ROWS]
+"""
+from __future__ import print_function
+
+import csv
+import io
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expressions.evaluator import PythonCodeCompiler
+from expressions.streaming import evaluate_stream
+
+
+COLUMNS = ["c{}".format(i) for i in range(20)]
+EXPRESSION = "c3 * c7 + c12 / 2"
+
+
+def make_csv(rows):
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(COLUMNS)
+    for _ in range(rows):
+        writer.writerow([random.random() for _ in COLUMNS])
+    return output.getvalue()
+
+
+def dict_rows(data):
+    evaluator = PythonCodeCompiler().compile(EXPRESSION)
+    for row in csv.DictReader(io.StringIO(data)):
+        row = dict((key, float(value)) for key, value in row.items())
+        evaluator(row)
+
+
+def stream(data):
+    results = evaluate_stream(EXPRESSION, csv.reader(io.StringIO(data)),
+                              header=True, convert=float)
+    for _ in results:
+        pass
+
+
+def main(rows=100000):
+    data = make_csv(rows)
+
+    for name, function in [("DictReader", dict_rows), ("stream", stream)]:
+        elapsed = min(timeit.repeat(lambda: function(data), number=1,
+                                    repeat=3))
+        print("{:12}: {:8.0f} rows/s".format(name, rows / elapsed))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
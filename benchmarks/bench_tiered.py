@@ -0,0 +1,87 @@
+# -*- encoding: utf8 -*-
+"""Measure the total time – compilation and evaluation – of a workload of
+many cold formulas evaluated a few times and a few hot formulas evaluated
+many times, with all formulas compiled, all interpreted and with the
+tiered executor.
+
+Run from the repository root:
+
+    python benchmarks/bench_tiered.py [COLD] [HOT] [HOT_ROWS]
+"""
+from __future__ import print_function
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expressions import ExpressionCache
+from expressions.evaluator import PythonCodeCompiler, default_functions
+from expressions.tiered import Interpreter, TieredExecutor
+
+from bench_nodes import random_expression, VARIABLES
+
+
+FUNCTIONS = dict(default_functions, coalesce=max)
+
+
+def workload(cold, hot, hot_rows):
+    """Return list of (formula, number of evaluations)."""
+    random.seed(0)
+    return [(random_expression(5), 5) for _ in range(cold)] \
+        + [(random_expression(5), hot_rows) for _ in range(hot)]
+
+
+def measure(evaluate, formulas, row):
+    start = time.time()
+    for text, rows in formulas:
+        for _ in range(rows):
+            try:
+                evaluate(text, row)
+            except (ZeroDivisionError, ValueError, OverflowError, TypeError):
+                pass
+    return time.time() - start
+
+
+def compiled_with(compiler):
+    functions = {}
+
+    def evaluate(text, row):
+        try:
+            function = functions[text]
+        except KeyError:
+            function = functions[text] = compiler.compile(text)
+        return function(row)
+
+    return evaluate
+
+
+def main(cold=2000, hot=10, hot_rows=20000):
+    formulas = workload(cold, hot, hot_rows)
+    row = dict((name, random.random() + 1) for name in VARIABLES)
+
+    # Parse the formulas first, only compilation and evaluation is measured
+    cache = ExpressionCache(maxsize=cold + hot)
+    for text, _ in formulas:
+        cache.parse(text)
+
+    compiled = measure(compiled_with(PythonCodeCompiler(FUNCTIONS,
+                                                        cache=cache)),
+                       formulas, row)
+    interpreted = measure(compiled_with(Interpreter(FUNCTIONS, cache=cache)),
+                          formulas, row)
+    executor = TieredExecutor(functions=FUNCTIONS, cache=cache)
+    tiered = measure(executor, formulas, row)
+
+    print("{} cold formulas x 5 rows, {} hot formulas x {} rows"
+          .format(cold, hot, hot_rows))
+    print("all compiled:    {:8.1f} ms".format(compiled * 1e3))
+    print("all interpreted: {:8.1f} ms".format(interpreted * 1e3))
+    print("tiered:          {:8.1f} ms".format(tiered * 1e3))
+    print(executor.counters())
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,81 @@
+# -*- encoding: utf8 -*-
+"""Measure the cost of type checking during compilation and evaluation of
+boolean arithmetic – counting of conditions – by typed NumPy plans.
+
+Run from the repository root:
+
+    python benchmarks/bench_types.py [EXPRESSIONS]
+"""
+from __future__ import print_function
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expressions import ExpressionCache, parse_expression
+from expressions.evaluator import PythonCodeCompiler, default_functions
+from expressions.types import infer_types
+
+from bench_nodes import random_expression, VARIABLES
+
+
+TYPES = dict((name, float) for name in VARIABLES)
+FUNCTIONS = dict(default_functions, coalesce=max)
+
+
+def measure(function, texts):
+    best = None
+    for _ in range(3):
+        start = time.time()
+        for text in texts:
+            function(text)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(count=5000):
+    random.seed(0)
+    texts = [random_expression(5) for _ in range(count)]
+    nodes = sum(len(parse_expression(text)) for text in texts)
+    cache = ExpressionCache(maxsize=count)
+
+    plain = measure(PythonCodeCompiler(FUNCTIONS, cache=cache).compile,
+                    texts)
+    typed = measure(PythonCodeCompiler(FUNCTIONS, cache=cache,
+                                       types=TYPES).compile, texts)
+    inferred = measure(lambda text: infer_types(cache.parse(text), TYPES),
+                       texts)
+
+    print("{} expressions, {} nodes".format(count, nodes))
+    print("compile:              {:6.2f} us per node"
+          .format(plain * 1e6 / nodes))
+    print("compile, typed:       {:6.2f} us per node"
+          .format(typed * 1e6 / nodes))
+    print("infer_types() only:   {:6.2f} us per node"
+          .format(inferred * 1e6 / nodes))
+
+    try:
+        import numpy
+    except ImportError:
+        return
+
+    from expressions.vectorized import NumpyCompiler
+
+    text = "(price > 10) + (quantity > 5) + (discount > 0)"
+    columns = dict((name, numpy.random.rand(1000000) * 20)
+                   for name in ["price", "quantity", "discount"])
+    plan = NumpyCompiler(types=TYPES).compile(text)
+    start = time.time()
+    result = plan.execute(columns)
+    elapsed = time.time() - start
+
+    print("typed NumPy plan: {} over 1M rows: {:.2f} ms, result {}"
+          .format(text, elapsed * 1e3, result.dtype))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
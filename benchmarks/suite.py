@@ -0,0 +1,203 @@
+# -*- encoding: utf8 -*-
+"""Benchmark suite of parsing, compilation, inspection and evaluation.
+
+Run from the repository root:
+
+    python benchmarks/suite.py                       # run all benchmarks
+    python benchmarks/suite.py -k parse              # only matching names
+    python benchmarks/suite.py --save results.json   # store results
+    python benchmarks/suite.py --compare benchmarks/baseline.json
+
+With `--compare` every benchmark is compared with the stored result and the
+command fails if any benchmark is slower than `--threshold` times the
+baseline. Timings are the best of several repeats, each repeat running long
+enough to be measurable.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import expressions
+from expressions import Compiler, ExpressionCache, inspect_variables
+from expressions.evaluator import PythonCodeCompiler
+
+from bench_nodes import random_expression
+
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "baseline.json")
+
+
+def corpus(count=500):
+    """Realistic formula catalogue: random expressions over a fixed set of
+    variables and functions."""
+    state = random.getstate()
+    random.seed(0)
+    texts = [random_expression(5) for _ in range(count)]
+    random.setstate(state)
+    return texts
+
+
+TEXTS = {
+    "short": "a + 1",
+    "long": " + ".join("v{0} * {0}".format(i) for i in range(200)),
+    "nested": "(" * 200 + "a" + ")" * 200,
+    "chain": " and ".join("a{0} < {0} or b{0}".format(i) for i in range(200)),
+    "arguments": "f({})".format(", ".join("a{}".format(i)
+                                          for i in range(200))),
+    "dotted": " + ".join("foo{0}.bar.baz{0}".format(i) for i in range(50)),
+    "strings": " + ".join(r"'line\n{0} \'quoted\' \\ \t'".format(i)
+                          for i in range(50)),
+}
+
+CORPUS = corpus()
+
+
+def compile_text(text, compiler):
+    return lambda: compiler.compile(text)
+
+
+def compile_corpus(compiler):
+    def run():
+        for text in CORPUS:
+            compiler.compile(text)
+    return run
+
+
+def inspect_corpus():
+    def run():
+        for text in CORPUS:
+            inspect_variables(text)
+    return run
+
+
+def evaluate_rows():
+    compiler = PythonCodeCompiler()
+    evaluator = compiler.compile("(price * quantity - discount) * (1 + tax)")
+    rows = [{"price": i * 0.5, "quantity": i % 7, "discount": 1.0,
+             "tax": 0.21} for i in range(1000)]
+    return lambda: list(evaluator.evaluate(rows))
+
+
+def evaluate_columns():
+    try:
+        import numpy
+        from expressions.vectorized import NumpyCompiler
+    except ImportError:
+        return None
+
+    plan = NumpyCompiler().compile("(price * quantity - discount) * (1 + tax)")
+    columns = dict((name, numpy.random.random(100000))
+                   for name in ["price", "quantity", "discount", "tax"])
+    out = numpy.empty(100000)
+    return lambda: plan.execute_blocked(columns, out=out)
+
+
+def benchmarks():
+    """Return list of tuples (`name`, `function`)."""
+    uncached = Compiler(cache=False)
+    cached = Compiler(cache=ExpressionCache(len(CORPUS)))
+
+    result = []
+    for name, text in sorted(TEXTS.items()):
+        result.append(("parse_" + name, compile_text(text, uncached)))
+
+    result += [
+        ("compile_corpus", compile_corpus(uncached)),
+        ("compile_corpus_cached", compile_corpus(cached)),
+        ("inspect_corpus", inspect_corpus()),
+        ("evaluate_rows", evaluate_rows()),
+        ("evaluate_columns", evaluate_columns()),
+    ]
+
+    return [(name, function) for name, function in result
+            if function is not None]
+
+
+def measure(function, repeat=5, min_time=0.1):
+    """Return best time of one call of `function` in seconds."""
+    timer = timeit.Timer(function)
+    number, elapsed = timer.autorange() if hasattr(timer, "autorange") \
+        else (10, timer.timeit(10))
+
+    # autorange() targets 0.2 s, scale to `min_time`
+    number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def format_time(seconds):
+    for unit, scale in [("s", 1), ("ms", 1e-3), ("us", 1e-6)]:
+        if seconds >= scale:
+            return "{:8.2f} {:2}".format(seconds / scale, unit)
+    return "{:8.2f} ns".format(seconds / 1e-9)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-k", dest="pattern", default="",
+                        help="run only benchmarks containing PATTERN")
+    parser.add_argument("--save", metavar="FILE",
+                        help="store results as JSON")
+    parser.add_argument("--compare", metavar="FILE", nargs="?",
+                        const=BASELINE,
+                        help="compare with stored results (default: "
+                             "benchmarks/baseline.json)")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="slowdown ratio reported as regression "
+                             "(default: 1.2)")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+
+    results = {}
+    regressions = []
+
+    for name, function in benchmarks():
+        if args.pattern not in name:
+            continue
+
+        seconds = measure(function, repeat=args.repeat)
+        results[name] = seconds
+        line = "{:24} {}".format(name, format_time(seconds))
+
+        if name in baseline:
+            ratio = seconds / baseline[name]
+            line += "  {}  {:5.2f}x".format(format_time(baseline[name]),
+                                             ratio)
+            if ratio > args.threshold:
+                regressions.append(name)
+                line += "  slower"
+            elif ratio < 1 / args.threshold:
+                line += "  faster"
+        print(line)
+        sys.stdout.flush()
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({
+                "version": expressions.__version__,
+                "python": platform.python_version(),
+                "results": results,
+            }, f, indent=4, sort_keys=True)
+            f.write("\n")
+
+    if regressions:
+        print("Regressions: {}".format(", ".join(regressions)))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
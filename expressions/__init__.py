@@ -1,3 +1,5 @@
+from .errors import *
+from .parsed import *
 from .compiler import *
 
 __version__ = '0.2.2'
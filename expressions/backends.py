@@ -0,0 +1,51 @@
+# -*- encoding: utf-8 -*-
+"""Parser backends.
+
+The parser modules are imported on the first parse, importing the package
+does not load the parser or the Grako runtime.
+"""
+
+from __future__ import absolute_import
+
+from .errors import ExpressionError
+
+MYPY = False
+if MYPY:
+    from typing import Callable
+
+__all__ = [
+        "get_parser",
+        "check_parser",
+        "PARSERS",
+        "GRAMMAR_VERSION",
+    ]
+
+
+# Names of the parser backends
+PARSERS = ("native", "grako")
+
+# Version of the language. Must be increased whenever the same text might be
+# parsed differently, it invalidates persistent caches of parsed expressions.
+GRAMMAR_VERSION = 1
+
+
+def check_parser(name):
+    # type: (str) -> None
+    """Raise `ExpressionError` if `name` is not a parser backend."""
+    if name not in PARSERS:
+        raise ExpressionError("Unknown parser '{}'".format(name))
+
+
+def get_parser(name):
+    # type: (str) -> Callable
+    """Return parse function of the parser backend `name`: ``native`` or
+    ``grako``. The parse function has the same signature as
+    `parser.parse()`."""
+    if name == "native":
+        from .parser import parse
+        return parse
+    elif name == "grako":
+        from .semantics import parse
+        return parse
+    else:
+        raise ExpressionError("Unknown parser '{}'".format(name))
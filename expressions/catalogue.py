@@ -0,0 +1,217 @@
+# -*- encoding: utf-8 -*-
+"""Bulk inspection and validation of formula catalogues.
+
+`inspect_catalogue()` parses a whole catalogue of expression texts, collects
+variable and function names of every expression and checks them against
+lists of allowed names. Identical texts are inspected once. Large catalogues
+are split into chunks inspected in a pool of worker processes; only the
+texts are sent to the workers and only the names and errors are sent back.
+"""
+
+from __future__ import absolute_import
+
+import multiprocessing
+
+MYPY = False
+if MYPY:
+    from typing import List, Any, Dict, Optional, Tuple, Iterable, Set, \
+                       FrozenSet
+
+from .compiler import ExpressionInspector
+from .errors import ExpressionError, ExpressionSyntaxError
+
+__all__ = [
+        "inspect_catalogue",
+        "CatalogueReport",
+        "Inspection",
+        "DEFAULT_CHUNK_SIZE",
+    ]
+
+
+# Number of distinct expressions inspected by a worker at once
+DEFAULT_CHUNK_SIZE = 2000
+
+
+class Inspection(object):
+    __slots__ = ("text", "variables", "functions", "error", "position",
+                 "unknown_variables", "unknown_functions")
+
+    def __init__(self, text, variables, functions, error=None,
+                 position=None, unknown_variables=frozenset(),
+                 unknown_functions=frozenset()):
+        # type: (str, FrozenSet[str], FrozenSet[str], Optional[str], Optional[int], FrozenSet[str], FrozenSet[str]) -> None
+        """Result of inspection of one expression `text`. `variables` and
+        `functions` are sets of the names used in the expression, `error` is
+        the syntax error message and `position` the offset of the error in
+        the text. `unknown_variables` and `unknown_functions` are the names
+        which are not allowed."""
+        self.text = text
+        self.variables = variables
+        self.functions = functions
+        self.error = error
+        self.position = position
+        self.unknown_variables = unknown_variables
+        self.unknown_functions = unknown_functions
+
+    @property
+    def valid(self):
+        # type: () -> bool
+        """`True` if the expression can be parsed and uses only allowed
+        names."""
+        return self.error is None and not self.unknown_variables \
+            and not self.unknown_functions
+
+    @property
+    def messages(self):
+        # type: () -> List[str]
+        """List of the validation error messages."""
+        messages = []
+        if self.error is not None:
+            if self.position is None:
+                messages.append(self.error)
+            else:
+                messages.append("{} (at position {})".format(self.error,
+                                                              self.position))
+        messages += ["Variable '{}' is not allowed".format(name)
+                     for name in sorted(self.unknown_variables)]
+        messages += ["Function '{}' is not allowed".format(name)
+                     for name in sorted(self.unknown_functions)]
+        return messages
+
+    def __repr__(self):
+        # type: () -> str
+        return "Inspection({!r}, valid={})".format(self.text, self.valid)
+
+
+class CatalogueReport(object):
+    def __init__(self, results, distinct):
+        # type: (List[Inspection], int) -> None
+        """Result of `inspect_catalogue()`. `results` is a list of
+        `Inspection` objects in the order of the inspected texts, identical
+        texts share one object. `distinct` is the number of distinct
+        texts."""
+        self.results = results
+        self.distinct = distinct
+
+    def __len__(self):
+        # type: () -> int
+        return len(self.results)
+
+    def __iter__(self):
+        # type: () -> Any
+        return iter(self.results)
+
+    def __getitem__(self, index):
+        # type: (int) -> Inspection
+        return self.results[index]
+
+    @property
+    def valid(self):
+        # type: () -> bool
+        """`True` if all the expressions are valid."""
+        return all(result.valid for result in self.results)
+
+    @property
+    def invalid(self):
+        # type: () -> List[int]
+        """List of indexes of invalid expressions."""
+        return [i for i, result in enumerate(self.results)
+                if not result.valid]
+
+    @property
+    def variables(self):
+        # type: () -> Set[str]
+        """Set of variables used in all the expressions."""
+        return set().union(*[result.variables for result in self.results])
+
+    @property
+    def functions(self):
+        # type: () -> Set[str]
+        """Set of functions used in all the expressions."""
+        return set().union(*[result.functions for result in self.results])
+
+
+def _inspect_chunk(texts):
+    # type: (List[str]) -> List[Tuple[Tuple[str, ...], Tuple[str, ...], Optional[str], Optional[int]]]
+    """Return list of tuples (`variables`, `functions`, `error`,
+    `position`) for `texts`."""
+    inspector = ExpressionInspector()
+    # The texts are distinct, caching them would only fill the cache
+    inspector.cache = None
+    results = []
+
+    for text in texts:
+        try:
+            variables, functions = inspector.compile(text)
+        except ExpressionSyntaxError as e:
+            results.append(((), (), e.message, e.position))
+        except ExpressionError as e:
+            results.append(((), (), str(e), None))
+        else:
+            results.append((tuple(variables), tuple(functions), None, None))
+
+    return results
+
+
+def inspect_catalogue(texts, variables=None, functions=None, workers=None,
+                      chunk_size=None):
+    # type: (Iterable[str], Optional[Iterable[str]], Optional[Iterable[str]], Optional[int], Optional[int]) -> CatalogueReport
+    """Parse and inspect expressions `texts` and return a `CatalogueReport`.
+    If `variables` or `functions` are given, names not in the lists are
+    reported as not allowed.
+
+    Distinct texts are inspected in `workers` processes, by default one per
+    CPU, in chunks of `chunk_size` expressions. Catalogues not larger than
+    one chunk and ``workers=1`` are inspected in the calling process."""
+
+    texts = list(texts)
+    allowed_variables = frozenset(variables) if variables is not None \
+        else None
+    allowed_functions = frozenset(functions) if functions is not None \
+        else None
+    if chunk_size is None:
+        chunk_size = DEFAULT_CHUNK_SIZE
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+
+    if chunk_size < 1 or workers < 1:
+        raise ExpressionError("Number of workers and chunk size must be "
+                              "positive")
+
+    indexes = {}  # type: Dict[str, int]
+    distinct = []  # type: List[str]
+    for text in texts:
+        if text not in indexes:
+            indexes[text] = len(distinct)
+            distinct.append(text)
+
+    chunks = [distinct[start:start + chunk_size]
+              for start in range(0, len(distinct), chunk_size)]
+
+    if workers == 1 or len(chunks) <= 1:
+        inspected = [_inspect_chunk(chunk) for chunk in chunks]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            inspected = list(pool.map(_inspect_chunk, chunks))
+
+    results = []  # type: List[Inspection]
+    for chunk, chunk_results in zip(chunks, inspected):
+        for text, (names, calls, error, position) in zip(chunk,
+                                                         chunk_results):
+            names = frozenset(names)
+            calls = frozenset(calls)
+            if allowed_variables is not None:
+                unknown_variables = names - allowed_variables
+            else:
+                unknown_variables = frozenset()
+            if allowed_functions is not None:
+                unknown_functions = calls - allowed_functions
+            else:
+                unknown_functions = frozenset()
+
+            results.append(Inspection(text, names, calls, error, position,
+                                      unknown_variables, unknown_functions))
+
+    return CatalogueReport([results[indexes[text]] for text in texts],
+                           len(distinct))
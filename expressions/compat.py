@@ -10,6 +10,7 @@ py3k = sys.version_info >= (3, 0)
 if py3k:
     string_type = str
     text_type = str
+    integer_types = (int, )
 
     def unicode_escape(s):
         return bytes(s, "utf-8").decode("unicode_escape")
@@ -17,7 +18,19 @@ if py3k:
 else:
     string_type = basestring
     text_type = unicode
+    integer_types = (int, long)
 
     def unicode_escape(s):
          return s.decode("string-escape")
 
+
+try:
+    from sys import intern
+except ImportError:
+    intern = intern
+
+# Wall clock with the best resolution
+try:
+    from time import perf_counter as clock
+except ImportError:
+    from time import time as clock
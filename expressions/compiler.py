@@ -3,11 +3,19 @@
 from __future__ import absolute_import
 from __future__ import print_function
 
-from typing import List, Any, Union, Optional, Set, Tuple
+import threading
 
-from .grammar import ExpressionParser, ExpressionSemantics
-from grako.exceptions import FailedSemantics
-from . import compat
+MYPY = False
+if MYPY:
+    from typing import List, Any, Optional, Set, Tuple, Dict, Callable
+
+from .nodes import Node, Variable, Function, BinaryOperator, UnaryOperator, \
+                   intern_variable
+from .backends import get_parser, check_parser
+from .parsed import ParsedExpression, parse_expression, default_cache, \
+                    merge_expressions
+from .limits import Limits
+from .compat import clock
 
 __all__ = [
         "Compiler",
@@ -17,212 +25,64 @@ __all__ = [
         "BinaryOperator",
         "UnaryOperator",
         "Node",
-        "inspect_variables"
+        "inspect_variables",
+        "intern_variable",
+        "Limits",
     ]
 
 
-class Node(object):
-    pass
-
-class Function(Node):
-    def __init__(self, variable, args):
-        # type: (Variable, List[str]) -> None
-        self.reference = variable.reference  # type: str
-        self.name = variable.name   # type: str
-        self.args = args  # type: List[str]
-
-    def __str__(self):
-        # type: () -> str
-        return "{}({})".format(self.name, ", ".join(str(a) for a in self.args))
-
-    def __repr__(self):
-        # type: () -> str
-        return "{}({})".format(self.name, ", ".join(repr(a) for a in self.args))
-
-
-class Variable(Node):
-    def __init__(self, reference):
-        # type: (str) -> None
-        """Creates a variable reference. Attributes: `reference` – variable
-        reference as a list of variable parts and `name` as a full variable
-        name. This object is passed to the `compile_variable()` and
-        `compile_function()`"""
-
-        self.reference = reference
-        self.name = ".".join(self.reference)
-
-    def __str__(self):
-        # type: () -> str
-        return self.name
-
-    def __repr__(self):
-        # type: () -> str
-        return "Variable({.name})".format(self)
-
-    def __eq__(self, other):
-        # type: (Any) -> bool
-        if not isinstance(other, Variable):
-            return NotImplemented
-        else:
-            return self.name == other.name \
-                    and self.reference == other.reference
-
-    def __hash__(self):
-        # type: () -> int
-        return hash(self.name)
-
-
-class UnaryOperator(Node):
-    def __init__(self, operator, operand):
-        # type: (str, str) -> None
-        self.operator = operator
-        self.operand = operand
-
-    def __str__(self):
-        # type: () -> str
-        return "({0.operator} {0.operand})".format(self)
-
-    def __repr__(self):
-        # type: () -> str
-        return "Unary({0.operator!r}, {0.operand!r})".format(self)
-
-
-class BinaryOperator(Node):
-    def __init__(self, operator, left, right):
-        # type: (str, str, str) -> None
-        self.operator = operator
-        self.left = left
-        self.right = right
-
-    def __str__(self):
-        # type: () -> str
-        return "({0.left} {0.operator} {0.right})".format(self)
-
-    def __repr__(self):
-        # type: () -> str
-        return "Binary({0.left!r}, {0.operator!r}, {0.right!r})".format(self)
-
-
-class _Result(object):
-    """Wrapper class for compilation result. We need this to properly
-    distinguish between our result and delegated results."""
-
-    def __init__(self, value):
-        # type: (Any) -> None
-        self.value = value
-    def __str__(self):
-        # type: () -> str
-        return str(self.value)
-    def __repr__(self):
-        # type: () -> str
-        return "_Result({})".format(repr(self.value))
-
-
-class _ExpressionSemantics(object):
-    keywords = ['in', 'not', 'is', 'and', 'or']
-    def __init__(self, compiler, context):
-        # type: (Any, Any) -> None
-        self.compiler = compiler
-        self.context = context
-
-    def _default(self, ast, node_type=None, *args):
-        # type: (Any, str, Any) -> _Result
-
-        if isinstance(ast, _Result):
-            return ast
-
-        if not node_type:
-            return ast
-
-        elif node_type == "unary":
-            operator, operand = ast
-            result = self.compiler.compile_unary(self.context,
-                                                 operator,
-                                                 operand.value)
-        elif node_type == "binary":
-            left, rest = ast
-            left = left.value
-
-            for op, right in rest:
-                # Get the object's value
-                right = right.value
-
-                left = self.compiler.compile_binary(self.context, op,
-                                                    left, right)
-            result = left
-
-        elif node_type == "binarynr":
-            left, operator, right = ast
-            result = self.compiler.compile_binary(self.context, operator,
-                                                  left.value, right.value)
-        else:
-            raise Exception("Unknown node type '{}'".format(node_type))
-
-        if isinstance(result, _Result):
-            raise Exception("Internal compiler error - "
-                            "unexpected _Result() object")
-            # Variable is already wrapped
-
-        return _Result(result)
-
-    def variable(self, ast):
-        # type: (Any) -> _Result
-        # Note: ast is expected to be a _Result() from the `reference` rule
-        value = ast.value
-        if not isinstance(ast, _Result):
-            import pdb; pdb.set_trace()
-        result = self.compiler.compile_variable(self.context, value)
-        return _Result(result)
-
-    def reference(self, ast):
-        # type: (Any) -> _Result
-        return _Result(Variable(ast))
-
-    def function(self, ast):
-        # type: (Any) -> _Result
-        ref = ast.ref.value
-        args = [arg.value for arg in ast.args or []]
-        result = self.compiler.compile_function(self.context, ref, args)
-
-        return _Result(result)
-
-    def NUMBER(self, ast):
-        # type: (Any) -> _Result
-
-        try:
-            value = int(ast)  # type: Union[int, float]
-        except ValueError:
-            value = float(ast)
-
-        result = self.compiler.compile_literal(self.context, value)
-
-        return _Result(result)
-
-    def STRING(self, ast):
-        # type: (Any) -> _Result
-        # Strip the surrounding quotes
-        value = compat.unicode_escape(compat.text_type(ast[1:-1]))
-
-        result = self.compiler.compile_literal(self.context, value)
-        return _Result(result)
-
-    def NAME(self, ast):
-        # type: (Any) -> _Result
-        if ast.lower() in self.keywords:
-            raise FailedSemantics("'{}' is a keyword.".format(ast))
-        return ast
-
-
 class Compiler(object):
-    def __init__(self, context=None):
-        # type: (Any) -> None
+    # Pure functions folded by the optimizer, `None` for those of
+    # `optimizer.pure_functions` which are in the compiler's `functions`
+    pure_functions = None  # type: Optional[Dict[str, Any]]
+
+    def __init__(self, context=None, parser=None, cache=None, optimize=False,
+                 instrumentation=None, limits=None):
+        # type: (Any, Optional[str], Any, bool, Any, Optional[Limits]) -> None
         """Creates an expression compiler with a `context` object. The context
         object is a custom object that subclasses might use during the
         compilation process for example to get variables by name, function
         objects. Context can be also used store information while compiling
         multiple expressions such as list of used attributes for analyzing
-        requirements for query construction."""
+        requirements for query construction.
+
+        `parser` is name of the parser backend: ``native`` (default) for the
+        built-in hand-written parser or ``grako`` for the Grako-generated
+        parser.
+
+        Parsed expressions are kept in `cache`, an `ExpressionCache`, and
+        compiling the same text again only replays the parsed expression into
+        the compiler. Shared `default_cache` is used by default, pass
+        ``False`` to parse the text on every compilation.
+
+        If `optimize` is true the parsed expression is optimized before it
+        is compiled: constant subexpressions and calls of
+        `folded_functions()` with constant arguments are folded and trivial
+        operations are removed. See `optimize_expression()`.
+
+        `instrumentation` is an optional `Instrumentation` object which
+        records time of the compilation phases and statistics of the compiled
+        expressions, see also `instrument()`.
+
+        `limits` are `Limits` – resource budgets for expressions from
+        untrusted sources. The text and the parsed expression are checked
+        before the expression is compiled, `ExpressionLimitError` is raised
+        if a limit is exceeded."""
         self.context = context
+        self.parser = parser or "native"
+        self.optimize = optimize
+        self.instrumentation = instrumentation
+        self.limits = limits
+
+        # Fail early on unknown parser
+        check_parser(self.parser)
+
+        if cache is None:
+            self.cache = default_cache
+        elif cache is False:
+            self.cache = None
+        else:
+            self.cache = cache
 
     def compile(self, text, context=None):
         # type: (str, Optional[Any]) -> Any
@@ -231,17 +91,104 @@ class Compiler(object):
         if context is None:
             context = self.context
 
-        parser = ExpressionParser()
+        if self.instrumentation is not None:
+            from .instrumentation import instrumented_compile
+            return instrumented_compile(self, text, context)
+
+        if self.cache is not None or self.optimize \
+                or self.limits is not None:
+            return self.parse(text).replay(self, context)
+
+        result = get_parser(self.parser)(text, self, context)
+
+        return self.finalize(context, result)
+
+    def instrument(self, callback=None):
+        # type: (Optional[Callable]) -> Any
+        """Return a context manager which records compilation statistics
+        into a new `Instrumentation` while the block is executed::
+
+            with compiler.instrument() as stats:
+                compiler.compile(text)
+            print(stats.as_dict())
+
+        `callback` is called with statistics of every compiled
+        expression."""
+        from .instrumentation import instrument
+        return instrument(self, callback)
+
+    def parse(self, text):
+        # type: (str) -> ParsedExpression
+        """Return parsed expression `text` which can be compiled by any
+        compiler with `ParsedExpression.replay()`. Uses the compiler's
+        cache and is optimized if the compiler optimizes. Raises
+        `ExpressionLimitError` if the expression exceeds the compiler's
+        limits."""
+        return self.lookup(text)[0]
+
+    def lookup(self, text, times=None):
+        # type: (str, Optional[Dict[str, float]]) -> Tuple[ParsedExpression, bool]
+        """Same as `parse()`, returns tuple (`parsed`, `cached`) where
+        `cached` is true if the expression was found in the cache. Wall times
+        of the ``parse`` and ``optimize`` phases in seconds are stored into
+        the `times` dictionary if given."""
+        limits = self.limits
+        if limits is not None:
+            limits.check_text(text)
+
+        start = clock() if times is not None else 0.0
+        if self.cache is not None:
+            parsed, cached = self.cache.lookup(text, self.parser)
+        else:
+            parsed = parse_expression(text, self.parser)
+            cached = False
+        if times is not None:
+            times["parse"] = clock() - start
+
+        if limits is not None:
+            limits.check_parsed(parsed)
+
+        if self.optimize:
+            from .optimizer import optimize_expression
+            start = clock() if times is not None else 0.0
+            parsed = optimize_expression(parsed, self.folded_functions())
+            if times is not None:
+                times["optimize"] = clock() - start
+
+        return (parsed, cached)
+
+    def folded_functions(self):
+        # type: () -> Dict[str, Any]
+        """Return functions which the optimizer may evaluate at compilation
+        time: `pure_functions` if set, otherwise the functions of
+        `optimizer.pure_functions` which are the same objects in the
+        compiler's `functions` dictionary. Compilers without `functions`
+        fold no functions."""
+        if self.pure_functions is not None:
+            return self.pure_functions
+
+        from .optimizer import pure_functions
+        functions = getattr(self, "functions", None)
+        if not isinstance(functions, dict):
+            return {}
+        return dict((name, function)
+                    for name, function in pure_functions.items()
+                    if functions.get(name) is function)
+
+    def compile_many(self, texts, context=None):
+        # type: (List[str], Optional[Any]) -> Any
+        """Compile a list of expressions `texts` together. Subexpressions
+        common to the expressions are compiled only once and the compiled
+        objects are shared, see `merge_expressions()`. Returns list of
+        finalized objects."""
 
-        result = parser.parse(text,
-                 rule_name="arithmetic_expression",
-                 comments_re="#.*",
-                 ignorecase=False,
-                 semantics=_ExpressionSemantics(self, context))
+        if context is None:
+            context = self.context
 
-        # Result is of type _Result
+        batch = merge_expressions([self.parse(text) for text in texts])
 
-        return self.finalize(context, result.value)
+        return [self.finalize(context, obj)
+                for obj in batch.replay(self, context)]
 
     def compile_literal(self, context, literal):
         # type: (Any, Any) -> Any
@@ -278,6 +225,14 @@ class Compiler(object):
         """
         return Function(function, args)
 
+    def compile_shared(self, context, obj):
+        # type: (Any, Any) -> Any
+        """Called with compiled subexpression `obj` which is used more than
+        once in expressions compiled by `compile_many()`. Subclasses might
+        store the result of the subexpression in a temporary variable.
+        Default implementation returns `obj`."""
+        return obj
+
     def finalize(self, context, obj):
         # type: (Any, Any) -> Any
         """Return final object as a result of expression compilation. By
@@ -289,33 +244,77 @@ class Compiler(object):
         return obj
 
 
-class ExpressionInspector(Compiler):
-    """Preprocesses an expression. Returns tuple of sets (`variables`,
-    `functions`)"""
+class _Inspection(object):
+    """Names collected from a single expression."""
+
     def __init__(self):
         # type: () -> None
-        super(ExpressionInspector, self).__init__()
+        self.variables = set()   # type: Set[str]
+        self.functions = set()   # type: Set[str]
 
+
+class ExpressionInspector(Compiler):
+    """Preprocesses an expression. Returns tuple of sets (`variables`,
+    `functions`) of names used in the expression. Attributes `variables` and
+    `functions` contain names from all expressions compiled by the
+    inspector.
+
+    If `validate` is false the names are collected by a scan of the tokens,
+    without parsing the expression, see `scan_names()`. The result for
+    expressions with invalid grammar is unspecified."""
+    def __init__(self, validate=True, limits=None):
+        # type: (bool, Optional[Limits]) -> None
+        super(ExpressionInspector, self).__init__(limits=limits)
+
+        self.validate = validate
         self.variables = set()   # type: Set[str]
         self.functions = set()   # type: Set[str]
+        self._lock = threading.Lock()
+
+    def compile(self, text, context=None):
+        # type: (str, Any) -> Tuple[Set[str], Set[str]]
+        if self.validate:
+            return super(ExpressionInspector, self).compile(text,
+                                                            _Inspection())
+
+        if self.limits is not None:
+            self.limits.check_text(text)
+
+        from .parser import scan_names
+        inspection = _Inspection()
+        inspection.variables, inspection.functions = scan_names(text)
+        return self.finalize(inspection, None)
+
+    def compile_many(self, texts, context=None):
+        # type: (List[str], Any) -> List[Tuple[Set[str], Set[str]]]
+        return [self.compile(text) for text in texts]
 
     def compile_variable(self, context, variable):
-        # type: (Any, Any) -> Any
-        self.variables.add(variable.name)
+        # type: (_Inspection, Any) -> Any
+        # Replayed without an `_Inspection`, collect directly into self
+        (context or self).variables.add(variable.name)
         return variable
 
     def compile_function(self, context, function, args):
-        # type: (Any, Any, Any) -> Any
-        self.functions.add(function.name)
+        # type: (_Inspection, Any, Any) -> Any
+        (context or self).functions.add(function.name)
         return function
 
     def finalize(self, context, obj):
-        # type: (Any, Any) -> Tuple[Any, Any]
-        return (self.variables, self.functions)
+        # type: (_Inspection, Any) -> Tuple[Set[str], Set[str]]
+        if context is None:
+            return (self.variables, self.functions)
+
+        with self._lock:
+            self.variables |= context.variables
+            self.functions |= context.functions
+        return (context.variables, context.functions)
+
 
 def inspect_variables(text):
     # type: (str) -> Set[str]
-    """Return set of variables in expression `text`"""
-    inspector = ExpressionInspector()
-    inspector.compile(text)
-    return inspector.variables
+    """Return set of variables in expression `text`. Raises
+    `ExpressionSyntaxError` if the expression is not valid, use
+    `scan_names()` to only scan the expression for names."""
+    variables, _ = ExpressionInspector().compile(text)
+    return variables
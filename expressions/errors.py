@@ -0,0 +1,79 @@
+# -*- encoding: utf-8 -*-
+"""Expression exceptions"""
+
+from __future__ import absolute_import
+
+MYPY = False
+if MYPY:
+    from typing import Any, List
+
+__all__ = [
+        "ExpressionError",
+        "ExpressionSyntaxError",
+        "ExpressionLimitError",
+        "ExpressionCycleError",
+        "ExpressionTypeError",
+    ]
+
+
+class ExpressionError(Exception):
+    """Base class for all expression errors."""
+    pass
+
+
+class ExpressionSyntaxError(ExpressionError):
+    def __init__(self, message, text=None, position=None):
+        # type: (str, str, int) -> None
+        """Raised when an expression `text` can not be parsed. `position` is
+        the offset of the offending token in the `text`."""
+        super(ExpressionSyntaxError, self).__init__(message)
+        self.message = message
+        self.text = text
+        self.position = position
+
+    def __str__(self):
+        # type: () -> str
+        if self.position is None:
+            return self.message
+        else:
+            return "{} (at position {})".format(self.message, self.position)
+
+
+class ExpressionLimitError(ExpressionError):
+    def __init__(self, limit, value, maximum):
+        # type: (str, Any, Any) -> None
+        """Raised when an expression or its evaluation exceeds a resource
+        budget. `limit` is the name of the exceeded `Limits` attribute,
+        `value` is the value found and `maximum` the allowed maximum."""
+        message = "Expression exceeds the limit {}: {} > {}".format(limit,
+                                                                   value,
+                                                                   maximum)
+        super(ExpressionLimitError, self).__init__(message)
+        self.limit = limit
+        self.value = value
+        self.maximum = maximum
+
+    def __reduce__(self):
+        # type: () -> Any
+        return (ExpressionLimitError, (self.limit, self.value, self.maximum))
+
+
+class ExpressionCycleError(ExpressionError):
+    def __init__(self, cycle):
+        # type: (List[str]) -> None
+        """Raised when named expressions depend on each other in a cycle.
+        `cycle` is the list of names in the cycle, the first name is
+        repeated at the end."""
+        message = "Circular dependency: {}".format(" -> ".join(cycle))
+        super(ExpressionCycleError, self).__init__(message)
+        self.cycle = cycle
+
+    def __reduce__(self):
+        # type: () -> Any
+        return (ExpressionCycleError, (self.cycle, ))
+
+
+class ExpressionTypeError(ExpressionError):
+    """Raised when an operation or a function can not be applied to values
+    of the types of its operands."""
+    pass
@@ -0,0 +1,347 @@
+# -*- encoding: utf-8 -*-
+"""Compilation of expressions into Python functions.
+
+`PythonCodeCompiler` translates an expression into Python source code of a
+single function, compiles it with `compile()` and returns an `Evaluator`.
+Evaluating the expression for a row costs one Python function call. The
+generated code has no access to builtins, only to the whitelisted functions.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+
+import marshal
+import math
+import threading
+import types
+import warnings
+
+MYPY = False
+if MYPY:
+    from typing import List, Any, Dict, Optional, Callable, Tuple
+    from .limits import Limits
+
+from .compat import integer_types
+from .compiler import Compiler
+from .parsed import merge_expressions
+from .errors import ExpressionError
+from .types import TypeChecker
+
+__all__ = [
+        "PythonCodeCompiler",
+        "Evaluator",
+        "default_functions",
+    ]
+
+
+default_functions = {
+    "abs": abs,
+    "min": min,
+    "max": max,
+    "round": round,
+    "sqrt": math.sqrt,
+    "exp": math.exp,
+    "log": math.log,
+    "log10": math.log10,
+    "floor": math.floor,
+    "ceil": math.ceil,
+}  # type: Dict[str, Callable]
+
+
+# Operators which are not the same in Python
+_BINARY_OPERATORS = {
+    "^": "**",
+    # There is no identity in the expression language, `is` compares values
+    "is": "==",
+}
+
+_UNARY_OPERATORS = {
+    "not": "not ",
+}
+
+ROW_NAME = "_row"
+TEMPORARY_PREFIX = "_t"
+
+_warnings_lock = threading.Lock()
+
+
+class _CodeContext(object):
+    """Compilation state of a single expression."""
+
+    def __init__(self, schema):
+        # type: (Any) -> None
+        self.variables = []  # type: List[str]
+        self.functions = []  # type: List[str]
+        # Assignments of shared subexpressions to temporary variables
+        self.assignments = []  # type: List[str]
+        # Number of compiled nodes
+        self.size = 0
+        # Types of the compiled code if the compiler checks types
+        self.types = {}  # type: Dict[str, str]
+
+        if schema is None:
+            self.keys = None  # type: Optional[Dict[str, Any]]
+        elif hasattr(schema, "keys"):
+            self.keys = dict(schema)
+        else:
+            self.keys = dict((name, i) for i, name in enumerate(schema))
+
+
+def _load_evaluator(code, functions, source, variables, function_names,
+                    keys, size=1, limits=None):
+    # type: (bytes, Dict[str, Callable], str, List[str], List[str], Any, int, Optional[Limits]) -> Evaluator
+    """Create an evaluator from marshalled `code` of its function."""
+    globals_ = dict(functions)
+    globals_["__builtins__"] = {}
+    function = types.FunctionType(marshal.loads(code), globals_)
+    return Evaluator(function, source, variables, function_names, keys,
+                     size, limits)
+
+
+def _evaluate_limited(function, rows, size, limits):
+    # type: (Callable, Any, int, Limits) -> Any
+    if limits.max_steps is not None:
+        max_rows = limits.max_steps // size
+    else:
+        max_rows = None
+    check_time = limits.max_time is not None
+    start = limits.start()
+
+    for count, row in enumerate(rows):
+        if count == max_rows:
+            limits.check_steps((count + 1) * size)
+        if check_time and not count & 255:
+            limits.check_time(start)
+        yield function(row)
+
+
+class Evaluator(object):
+    def __init__(self, function, source, variables, functions, keys=None,
+                 size=1, limits=None):
+        # type: (Callable, str, List[str], List[str], Optional[Dict[str, Any]], int, Optional[Limits]) -> None
+        """Compiled expression. `function` is a Python function of one
+        argument – the row, `source` is its source code, `variables` and
+        `functions` are lists of names used in the expression. `keys` maps
+        variable names to row keys or indexes, it is ``None`` if rows are
+        mappings keyed by variable names. `size` is the number of nodes of
+        the expression and `limits` are `Limits` of `evaluate()`.
+
+        Evaluators can be pickled: the code object of the function is
+        marshalled, the expression is not compiled again."""
+        self.function = function
+        self.source = source
+        self.variables = variables
+        self.functions = functions
+        self.keys = keys
+        self.size = max(size, 1)
+        self.limits = limits
+
+    def __reduce__(self):
+        # type: () -> Tuple
+        functions = dict((name, value) for name, value
+                         in self.function.__globals__.items()
+                         if name != "__builtins__")
+        return (_load_evaluator, (marshal.dumps(self.code), functions,
+                                  self.source, self.variables,
+                                  self.functions, self.keys, self.size,
+                                  self.limits))
+
+    @property
+    def code(self):
+        # type: () -> Any
+        """Python code object of the expression."""
+        return self.function.__code__
+
+    def __call__(self, row):
+        # type: (Any) -> Any
+        return self.function(row)
+
+    def evaluate(self, rows):
+        # type: (Any) -> Any
+        """Return an iterator of results for every row in `rows`.
+
+        With `limits` the iterator raises `ExpressionLimitError` when the
+        number of rows times the expression size exceeds `max_steps` or
+        when the iteration takes longer than `max_time` seconds, the time
+        is checked every 256 rows."""
+        limits = self.limits
+        if limits is None or (limits.max_steps is None
+                              and limits.max_time is None):
+            return map(self.function, rows)
+        return _evaluate_limited(self.function, rows, self.size, limits)
+
+    def __repr__(self):
+        # type: () -> str
+        return "Evaluator({!r})".format(self.source)
+
+
+class PythonCodeCompiler(Compiler):
+    def __init__(self, functions=None, types=None, signatures=None,
+                 **kwargs):
+        # type: (Optional[Dict[str, Callable]], Optional[Dict[str, Any]], Optional[Dict[str, Any]], Any) -> None
+        """Creates a compiler of expressions into Python functions.
+        `functions` is a dictionary of functions that the expressions may
+        call, `default_functions` are used if not specified.
+
+        If `types` – a mapping of variable names to types – is given, the
+        types of the expression are checked during the compilation and
+        `ExpressionTypeError` is raised instead of failing at evaluation
+        time, see `TypeChecker`. `signatures` are signatures of the
+        functions.
+
+        The compilation context is a row schema: ``None`` for rows that are
+        mappings keyed by variable names, a list of variable names for rows
+        that are tuples or a dictionary mapping variable names to row keys or
+        indexes."""
+
+        super(PythonCodeCompiler, self).__init__(**kwargs)
+
+        if functions is None:
+            functions = default_functions
+
+        self.functions = dict(functions)
+        self.type_checker = None  # type: Optional[TypeChecker]
+        if types is not None:
+            self.type_checker = TypeChecker(types, signatures)
+        self._function_names = {}  # type: Dict[str, str]
+        self._globals = {"__builtins__": {}}  # type: Dict[str, Any]
+
+        for i, name in enumerate(sorted(self.functions)):
+            identifier = "_f{}".format(i)
+            self._function_names[name] = identifier
+            self._globals[identifier] = self.functions[name]
+
+    def compile(self, text, context=None):
+        # type: (str, Any) -> Evaluator
+        """Compile the `text` expression into an `Evaluator`. `context` is
+        the row schema."""
+        if context is None:
+            context = self.context
+        return super(PythonCodeCompiler, self).compile(text,
+                                                       _CodeContext(context))
+
+    def compile_literal(self, context, literal):
+        # type: (_CodeContext, Any) -> str
+        context.size += 1
+        if isinstance(literal, float) and math.isinf(literal):
+            code = "1e999" if literal > 0 else "(-1e999)"
+        elif isinstance(literal, (float, ) + integer_types) and literal < 0:
+            # Folded negative literals bind tighter than the operators
+            code = "({!r})".format(literal)
+        else:
+            code = repr(literal)
+        if self.type_checker is not None:
+            context.types[code] = self.type_checker.literal(literal)
+        return code
+
+    def compile_variable(self, context, variable):
+        # type: (_CodeContext, Any) -> str
+        context.size += 1
+        name = variable.name
+        if context.keys is None:
+            key = name
+        else:
+            try:
+                key = context.keys[name]
+            except KeyError:
+                raise ExpressionError("Unknown variable '{}'".format(name))
+
+        if name not in context.variables:
+            context.variables.append(name)
+
+        code = "{}[{!r}]".format(ROW_NAME, key)
+        if self.type_checker is not None:
+            context.types[code] = self.type_checker.variable(name)
+        return code
+
+    def compile_binary(self, context, operator, left, right):
+        # type: (_CodeContext, str, str, str) -> str
+        context.size += 1
+        code = "({} {} {})".format(left,
+                                   _BINARY_OPERATORS.get(operator, operator),
+                                   right)
+        if self.type_checker is not None:
+            types = context.types
+            types[code] = self.type_checker.binary(operator, types[left],
+                                                   types[right])
+        return code
+
+    def compile_unary(self, context, operator, operand):
+        # type: (_CodeContext, str, str) -> str
+        context.size += 1
+        code = "({}{})".format(_UNARY_OPERATORS.get(operator, operator),
+                               operand)
+        if self.type_checker is not None:
+            types = context.types
+            types[code] = self.type_checker.unary(operator, types[operand])
+        return code
+
+    def compile_function(self, context, function, args):
+        # type: (_CodeContext, Any, List[str]) -> str
+        context.size += 1
+        name = function.name
+        try:
+            identifier = self._function_names[name]
+        except KeyError:
+            raise ExpressionError("Unknown function '{}'".format(name))
+
+        if name not in context.functions:
+            context.functions.append(name)
+
+        code = "{}({})".format(identifier, ", ".join(args))
+        if self.type_checker is not None:
+            types = context.types
+            types[code] = self.type_checker.function(name, [types[arg]
+                                                            for arg in args])
+        return code
+
+    def compile_many(self, texts, context=None):
+        # type: (List[str], Any) -> Evaluator
+        """Compile a list of expressions into one `Evaluator` which returns
+        a tuple of results of all the expressions. `context` is the row
+        schema. Subexpressions common to the expressions are evaluated only
+        once per row."""
+        if context is None:
+            context = self.context
+
+        context = _CodeContext(context)
+        batch = merge_expressions([self.parse(text) for text in texts])
+        bodies = batch.replay(self, context)
+
+        if len(bodies) == 1:
+            return self.finalize(context, "({}, )".format(bodies[0]))
+        else:
+            return self.finalize(context, "({})".format(", ".join(bodies)))
+
+    def compile_shared(self, context, obj):
+        # type: (_CodeContext, str) -> str
+        name = "{}{}".format(TEMPORARY_PREFIX, len(context.assignments))
+        context.assignments.append("{} = {}".format(name, obj))
+        if self.type_checker is not None:
+            context.types[name] = context.types[obj]
+        return name
+
+    def finalize(self, context, obj):
+        # type: (_CodeContext, str) -> Evaluator
+        lines = ["def _expression({}):".format(ROW_NAME)]
+        lines += ["    " + line for line in context.assignments]
+        lines.append("    return {}".format(obj))
+        source = "\n".join(lines) + "\n"
+        namespace = {}  # type: Dict[str, Any]
+
+        # catch_warnings() changes process-wide state
+        with _warnings_lock, warnings.catch_warnings():
+            warnings.simplefilter("ignore", SyntaxWarning)
+            try:
+                code = compile(source, "<expression>", "exec",
+                               division.compiler_flag, True)
+            except (SyntaxError, MemoryError, RuntimeError):
+                # Python limits nesting of the generated code
+                raise ExpressionError("Expression is too deeply nested to "
+                                      "be compiled into Python code")
+
+        exec(code, self._globals, namespace)
+
+        return Evaluator(namespace["_expression"], source,
+                         context.variables, context.functions, context.keys,
+                         context.size, self.limits)
@@ -0,0 +1,257 @@
+# -*- encoding: utf-8 -*-
+"""Calculated fields defined by expressions over inputs and other fields.
+
+`FieldGraph` inspects the expressions of named fields, builds the graph of
+their dependencies, rejects circular dependencies and compiles the fields
+with `PythonCodeCompiler`. Fields are evaluated in topological order.
+`FieldValues` keeps the values of inputs and fields; when some inputs change
+only the fields downstream of them are evaluated again, and only as long as
+the evaluated values change.
+"""
+
+from __future__ import absolute_import
+
+import heapq
+
+MYPY = False
+if MYPY:
+    from typing import List, Any, Dict, Iterable, Mapping, Optional, Set, \
+                       Tuple, Union
+
+from .compiler import ExpressionInspector
+from .errors import ExpressionError, ExpressionCycleError
+from .evaluator import PythonCodeCompiler, Evaluator
+
+__all__ = [
+        "FieldGraph",
+        "FieldValues",
+    ]
+
+
+_VISITING = 1
+_VISITED = 2
+
+
+def _topological_order(names, dependencies):
+    # type: (List[str], Dict[str, List[str]]) -> List[str]
+    """Return `names` ordered so that every name follows the names it depends
+    on. Names which are not keys of `dependencies` are inputs. Raises
+    `ExpressionCycleError` on circular dependency."""
+    order = []  # type: List[str]
+    state = {}  # type: Dict[str, int]
+
+    for root in names:
+        if root in state:
+            continue
+        state[root] = _VISITING
+        stack = [(root, iter(dependencies[root]))]
+
+        while stack:
+            name, pending = stack[-1]
+            for dependency in pending:
+                if dependency not in dependencies:
+                    continue
+                visited = state.get(dependency)
+                if visited is None:
+                    state[dependency] = _VISITING
+                    stack.append((dependency,
+                                  iter(dependencies[dependency])))
+                    break
+                elif visited == _VISITING:
+                    path = [item[0] for item in stack]
+                    cycle = path[path.index(dependency):] + [dependency]
+                    raise ExpressionCycleError(cycle)
+            else:
+                stack.pop()
+                state[name] = _VISITED
+                order.append(name)
+
+    return order
+
+
+def _same(old, new):
+    # type: (Any, Any) -> bool
+    """`True` if the `new` value does not have to be propagated."""
+    return old is new or (type(old) is type(new) and old == new)
+
+
+class FieldGraph(object):
+    def __init__(self, fields, compiler=None):
+        # type: (Union[Mapping[str, str], Iterable[Tuple[str, str]]], Optional[PythonCodeCompiler]) -> None
+        """Graph of calculated `fields` – a mapping or a list of pairs of
+        field names and expression texts. Variables of the expressions which
+        are not fields are inputs. Dotted names such as ``sales.margin``
+        are field names as well.
+
+        The expressions are compiled by `compiler`, a `PythonCodeCompiler`
+        by default. Raises `ExpressionCycleError` if fields depend on each
+        other in a cycle."""
+        if hasattr(fields, "items"):
+            fields = list(fields.items())  # type: ignore
+        self.texts = dict(fields)
+        names = [name for name, _ in fields]
+
+        if len(self.texts) != len(names):
+            raise ExpressionError("Fields are defined more than once")
+
+        inspector = ExpressionInspector()
+        # Names used by the fields
+        self.dependencies = {}  # type: Dict[str, List[str]]
+        for name in names:
+            variables, _ = inspector.compile(self.texts[name])
+            self.dependencies[name] = sorted(variables)
+
+        self.order = _topological_order(names, self.dependencies)
+        self._index = dict((name, i) for i, name in enumerate(self.order))
+
+        # Fields using a field or an input directly
+        self.dependents = {}  # type: Dict[str, List[str]]
+        for name in self.order:
+            for dependency in self.dependencies[name]:
+                self.dependents.setdefault(dependency, []).append(name)
+
+        self.inputs = set(self.dependents) - set(self.texts)
+
+        compiler = compiler or PythonCodeCompiler()
+        self.evaluators = {}  # type: Dict[str, Evaluator]
+        for name in self.order:
+            self.evaluators[name] = compiler.compile(self.texts[name])
+
+    def __contains__(self, name):
+        # type: (str) -> bool
+        return name in self.texts
+
+    def __len__(self):
+        # type: () -> int
+        return len(self.order)
+
+    def downstream(self, names):
+        # type: (Iterable[str]) -> List[str]
+        """Return list of fields which depend, directly or indirectly, on
+        any of the inputs or fields `names` in the order of evaluation."""
+        found = set()  # type: Set[str]
+        stack = list(names)
+        while stack:
+            for field in self.dependents.get(stack.pop(), ()):
+                if field not in found:
+                    found.add(field)
+                    stack.append(field)
+        return sorted(found, key=self._index.__getitem__)
+
+    def evaluate(self, inputs):
+        # type: (Mapping[str, Any]) -> Dict[str, Any]
+        """Evaluate all the fields from the `inputs` values and return a
+        dictionary of the inputs and the field values."""
+        values = dict(inputs)
+        self._check_inputs(values)
+
+        missing = self.inputs.difference(values)
+        if missing:
+            raise ExpressionError("Missing values of inputs: {}"
+                                  .format(", ".join(sorted(missing))))
+
+        evaluators = self.evaluators
+        for name in self.order:
+            values[name] = evaluators[name](values)
+
+        return values
+
+    def values(self, inputs):
+        # type: (Mapping[str, Any]) -> FieldValues
+        """Evaluate all the fields and return `FieldValues` which can be
+        updated incrementally."""
+        return FieldValues(self, self.evaluate(inputs))
+
+    def _check_inputs(self, inputs):
+        # type: (Iterable[str]) -> None
+        fields = [name for name in inputs if name in self.texts]
+        if fields:
+            raise ExpressionError("Calculated fields can not be set: {}"
+                                  .format(", ".join(sorted(fields))))
+
+    def __repr__(self):
+        # type: () -> str
+        return "FieldGraph({})".format(", ".join(self.order))
+
+
+class FieldValues(object):
+    def __init__(self, graph, values):
+        # type: (FieldGraph, Dict[str, Any]) -> None
+        """Values of inputs and fields of the `graph`, created by
+        `FieldGraph.values()`. `values` is a dictionary of all the
+        values."""
+        self.graph = graph
+        self.values = values
+        # Number of field evaluations by `update()`
+        self.evaluations = 0
+
+    def __getitem__(self, name):
+        # type: (str) -> Any
+        return self.values[name]
+
+    def __contains__(self, name):
+        # type: (str) -> bool
+        return name in self.values
+
+    def update(self, changes):
+        # type: (Mapping[str, Any]) -> Dict[str, Any]
+        """Set the input values in `changes` and evaluate again the fields
+        downstream of the changed inputs. A field is evaluated only if a
+        value it depends on has changed. Returns a dictionary of the fields
+        with changed values.
+
+        If an evaluation fails, the values are left as they were before the
+        update."""
+        graph = self.graph
+        graph._check_inputs(changes)
+
+        values = self.values
+        order = graph.order
+        index = graph._index
+        dependents = graph.dependents
+        evaluators = graph.evaluators
+
+        pending = []  # type: List[int]
+        scheduled = set()  # type: Set[int]
+        previous = {}  # type: Dict[str, Any]
+        missing = object()
+
+        def schedule(name):
+            # type: (str) -> None
+            for field in dependents.get(name, ()):
+                position = index[field]
+                if position not in scheduled:
+                    scheduled.add(position)
+                    heapq.heappush(pending, position)
+
+        changed = {}  # type: Dict[str, Any]
+        try:
+            for name, value in changes.items():
+                old = values.get(name, missing)
+                if old is not missing and _same(old, value):
+                    continue
+                previous[name] = old
+                values[name] = value
+                schedule(name)
+
+            while pending:
+                name = order[heapq.heappop(pending)]
+                value = evaluators[name](values)
+                self.evaluations += 1
+                if not _same(values[name], value):
+                    previous[name] = values[name]
+                    values[name] = changed[name] = value
+                    schedule(name)
+        except Exception:
+            for name, old in previous.items():
+                if old is missing:
+                    del values[name]
+                else:
+                    values[name] = old
+            raise
+
+        return changed
+
+    def __repr__(self):
+        # type: () -> str
+        return "FieldValues({!r})".format(self.values)
@@ -135,12 +135,12 @@ class ExpressionParser(Parser):
                 with self._choice():
                     with self._option():
                         self._token('*')
+                    with self._option():
+                        self._token('//')
                     with self._option():
                         self._token('/')
                     with self._option():
                         self._token('%')
-                    with self._option():
-                        self._token('//')
                     self._error('expecting one of: % * / //')
             self._factor_()
         self._closure(block0)
@@ -163,7 +163,7 @@ class ExpressionParser(Parser):
                 self._power_()
             self._error('no available options')
 
-    @graken()
+    @graken('binarynr')
     def _power_(self):
         self._atom_()
         with self._optional():
@@ -250,14 +250,14 @@ class ExpressionParser(Parser):
                     self._token('==')
                 with self._option():
                     self._token('!=')
-                with self._option():
-                    self._token('<')
                 with self._option():
                     self._token('<=')
                 with self._option():
-                    self._token('>')
+                    self._token('<')
                 with self._option():
                     self._token('>=')
+                with self._option():
+                    self._token('>')
                 with self._option():
                     self._token('in')
                 with self._option():
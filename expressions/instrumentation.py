@@ -0,0 +1,157 @@
+# -*- encoding: utf-8 -*-
+"""Instrumentation of the expression compilation.
+
+An `Instrumentation` object attached to a compiler records for every
+compiled expression the wall time of the compilation phases, counts of the
+compiled nodes and size of the expression:
+
+* ``parse`` – parsing of the text, or lookup in the cache
+* ``optimize`` – the optimization pass, if enabled
+* ``compile`` – the `compile_*` methods of the compiler
+* ``finalize`` – the `finalize()` method of the compiler
+
+Compilers without an instrumentation take the regular path, the only cost
+is a check of one attribute.
+"""
+
+from __future__ import absolute_import
+
+import threading
+
+from contextlib import contextmanager
+
+MYPY = False
+if MYPY:
+    from typing import Any, Dict, Optional, Callable
+
+from .compat import clock
+from .parsed import expression_depth
+
+__all__ = [
+        "Instrumentation",
+        "expression_depth",
+        "NODE_KINDS",
+    ]
+
+
+NODE_KINDS = ("literal", "variable", "function", "unary", "binary")
+
+PHASES = ("parse", "optimize", "compile", "finalize")
+
+
+class Instrumentation(object):
+    def __init__(self, callback=None):
+        # type: (Optional[Callable[[Dict[str, Any]], None]]) -> None
+        """Collector of compilation statistics. `callback` is called with a
+        dictionary of statistics of every compiled expression, see
+        `record()`. The totals are returned by `as_dict()`.
+
+        An instrumentation can be shared by compilers used from multiple
+        threads, the callback is called from the compiling thread."""
+        self.callback = callback
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        # type: () -> None
+        """Reset the totals."""
+        with self._lock:
+            self.compilations = 0
+            self.cache_hits = 0
+            self.times = dict((phase, 0.0) for phase in PHASES)
+            self.nodes = dict((kind, 0) for kind in NODE_KINDS)
+            self.tokens = 0
+            self.max_size = 0
+            self.max_depth = 0
+
+    def record(self, stats):
+        # type: (Dict[str, Any]) -> None
+        """Add statistics of one compiled expression. `stats` is a dictionary
+        with keys:
+
+        * `text` – the expression
+        * `times` – dictionary of phase wall times in seconds
+        * `nodes` – dictionary of counts of compiled nodes by kind
+        * `size` – number of nodes, `depth` – depth of the expression tree
+        * `cached` – whether the parsed expression was found in the cache
+        * `tokens` – number of tokens if the text was parsed by the native
+          parser, otherwise 0
+        """
+        with self._lock:
+            self.compilations += 1
+            self.cache_hits += stats["cached"]
+            self.tokens += stats["tokens"]
+            self.max_size = max(self.max_size, stats["size"])
+            self.max_depth = max(self.max_depth, stats["depth"])
+
+            for phase, seconds in stats["times"].items():
+                self.times[phase] += seconds
+            for kind, count in stats["nodes"].items():
+                self.nodes[kind] += count
+
+        if self.callback is not None:
+            self.callback(stats)
+
+    def as_dict(self):
+        # type: () -> Dict[str, Any]
+        """Return totals of all the recorded compilations."""
+        with self._lock:
+            return {
+                "compilations": self.compilations,
+                "cache_hits": self.cache_hits,
+                "times": dict(self.times),
+                "nodes": dict(self.nodes),
+                "tokens": self.tokens,
+                "max_size": self.max_size,
+                "max_depth": self.max_depth,
+            }
+
+
+def instrumented_compile(compiler, text, context):
+    # type: (Any, str, Any) -> Any
+    """Compile `text` with `compiler` and record the statistics into the
+    compiler's instrumentation."""
+
+    times = {}  # type: Dict[str, float]
+    parsed, cached = compiler.lookup(text, times)
+    tokens = parsed.tokens if not cached and parsed.tokens else 0
+
+    start = clock()
+    obj = parsed.replay(compiler, context, finalize=False)
+    times["compile"] = clock() - start
+
+    start = clock()
+    result = compiler.finalize(context, obj)
+    times["finalize"] = clock() - start
+
+    nodes = dict((kind, 0) for kind in NODE_KINDS)
+    for instruction in parsed.instructions:
+        nodes[NODE_KINDS[instruction[0]]] += 1
+
+    compiler.instrumentation.record({
+        "text": text,
+        "times": times,
+        "nodes": nodes,
+        "size": len(parsed),
+        "depth": expression_depth(parsed),
+        "cached": cached,
+        "tokens": tokens,
+    })
+
+    return result
+
+
+@contextmanager
+def instrument(compiler, callback=None):
+    # type: (Any, Optional[Callable[[Dict[str, Any]], None]]) -> Any
+    """Context manager which attaches a new `Instrumentation` to `compiler`
+    for the duration of the block. The instrumentation is set as an attribute
+    of the compiler, compilations from other threads during the block are
+    recorded as well."""
+    instrumentation = Instrumentation(callback)
+    previous = compiler.instrumentation
+    compiler.instrumentation = instrumentation
+    try:
+        yield instrumentation
+    finally:
+        compiler.instrumentation = previous
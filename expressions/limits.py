@@ -0,0 +1,123 @@
+# -*- encoding: utf-8 -*-
+"""Resource budgets for expressions from untrusted sources.
+
+A `Limits` object given to a compiler is checked before any expensive work
+is done: the length of the text before it is parsed, the size, depth,
+function arity and string literals of the parsed expression before it is
+compiled. Evaluators and plans compiled by the compiler carry the limits and
+stop the evaluation which exceeds its step or time budget. Exceeded limits
+raise `ExpressionLimitError`.
+"""
+
+from __future__ import absolute_import
+
+MYPY = False
+if MYPY:
+    from typing import Optional
+
+from .compat import string_type, clock
+from .errors import ExpressionLimitError
+from .parsed import ParsedExpression, LITERAL, FUNCTION, expression_depth
+
+__all__ = [
+        "Limits",
+    ]
+
+
+class Limits(object):
+    def __init__(self, max_length=None, max_depth=None, max_nodes=None,
+                 max_arguments=None, max_string=None, max_steps=None,
+                 max_time=None):
+        # type: (Optional[int], Optional[int], Optional[int], Optional[int], Optional[int], Optional[int], Optional[float]) -> None
+        """Resource budgets of compilation and evaluation, `None` means no
+        limit:
+
+        * `max_length` – length of the expression text
+        * `max_depth` – depth of the expression tree, a single variable or
+          literal has depth 1
+        * `max_nodes` – number of literals, variables, functions and
+          operators
+        * `max_arguments` – number of arguments of a function call
+        * `max_string` – length of a string literal
+        * `max_steps` – number of operations evaluated by one evaluation:
+          number of nodes times number of rows
+        * `max_time` – wall time of one evaluation in seconds
+        """
+        self.max_length = max_length
+        self.max_depth = max_depth
+        self.max_nodes = max_nodes
+        self.max_arguments = max_arguments
+        self.max_string = max_string
+        self.max_steps = max_steps
+        self.max_time = max_time
+
+    def check_text(self, text):
+        # type: (str) -> None
+        """Check length of the expression `text` before it is parsed."""
+        if self.max_length is not None and len(text) > self.max_length:
+            raise ExpressionLimitError("max_length", len(text),
+                                       self.max_length)
+
+    def check_parsed(self, parsed):
+        # type: (ParsedExpression) -> None
+        """Check size, depth, function arity and string literals of the
+        `parsed` expression."""
+        instructions = parsed.instructions
+
+        if self.max_nodes is not None and len(instructions) > self.max_nodes:
+            raise ExpressionLimitError("max_nodes", len(instructions),
+                                       self.max_nodes)
+
+        max_arguments = self.max_arguments
+        max_string = self.max_string
+
+        if max_arguments is not None or max_string is not None:
+            for instruction in instructions:
+                code = instruction[0]
+                if code == FUNCTION:
+                    args = instruction[2]
+                    if max_arguments is not None \
+                            and len(args) > max_arguments:
+                        raise ExpressionLimitError("max_arguments",
+                                                   len(args), max_arguments)
+                elif max_string is not None and code == LITERAL \
+                        and isinstance(instruction[1], string_type) \
+                        and len(instruction[1]) > max_string:
+                    raise ExpressionLimitError("max_string",
+                                               len(instruction[1]),
+                                               max_string)
+
+        if self.max_depth is not None:
+            depth = expression_depth(parsed)
+            if depth > self.max_depth:
+                raise ExpressionLimitError("max_depth", depth,
+                                           self.max_depth)
+
+    def check_steps(self, steps):
+        # type: (int) -> None
+        """Check number of operations of an evaluation."""
+        if self.max_steps is not None and steps > self.max_steps:
+            raise ExpressionLimitError("max_steps", steps, self.max_steps)
+
+    def start(self):
+        # type: () -> float
+        """Return start time of an evaluation for `check_time()`."""
+        return clock()
+
+    def check_time(self, start):
+        # type: (float) -> None
+        """Check time elapsed since the evaluation `start`."""
+        if self.max_time is not None:
+            elapsed = clock() - start
+            if elapsed > self.max_time:
+                raise ExpressionLimitError("max_time", round(elapsed, 3),
+                                           self.max_time)
+
+    def __repr__(self):
+        # type: () -> str
+        limits = ["{}={!r}".format(name, getattr(self, name))
+                  for name in ["max_length", "max_depth", "max_nodes",
+                               "max_arguments", "max_string", "max_steps",
+                               "max_time"]
+                  if getattr(self, name) is not None]
+        return "Limits({})".format(", ".join(limits))
@@ -0,0 +1,315 @@
+# -*- encoding: utf-8 -*-
+"""Default semantic graph nodes"""
+
+from __future__ import absolute_import
+
+MYPY = False
+if MYPY:
+    from typing import List, Any, Tuple, Dict
+
+from .compat import intern
+
+__all__ = [
+        "Variable",
+        "Function",
+        "BinaryOperator",
+        "UnaryOperator",
+        "Node",
+        "intern_variable",
+    ]
+
+
+class Node(object):
+    __slots__ = ()
+
+
+class _ImmutableNode(Node):
+    """Node with attributes set only when the node is created."""
+    __slots__ = ()
+
+    def __setattr__(self, name, value):
+        # type: (str, Any) -> None
+        raise AttributeError("{} is immutable".format(type(self).__name__))
+
+    def __delattr__(self, name):
+        # type: (str) -> None
+        raise AttributeError("{} is immutable".format(type(self).__name__))
+
+
+# Shared table of interned variables by their reference
+_variables = {}  # type: Dict[Tuple[str, ...], Variable]
+
+# The table is emptied when it grows over the limit
+MAX_INTERNED_VARIABLES = 65536
+
+
+def intern_variable(reference):
+    # type: (List[str]) -> Variable
+    """Return shared `Variable` for `reference`. Equal references return the
+    same object."""
+    key = tuple(reference)
+    try:
+        return _variables[key]
+    except KeyError:
+        pass
+
+    if len(_variables) >= MAX_INTERNED_VARIABLES:
+        _variables.clear()
+
+    return _variables.setdefault(key, Variable(reference))
+
+
+def _equal(node, other):
+    # type: (Node, Any) -> bool
+    """Compare two expression trees without recursion. Literals are equal
+    only if they have the same type, ``x // 2`` is not ``x // 2.0``."""
+    stack = [(node, other)]
+    while stack:
+        left, right = stack.pop()
+        if left is right:
+            continue
+        elif type(left) is not type(right):
+            return False
+        elif isinstance(left, _CompositeNode):
+            if left._hash is not None and right._hash is not None \
+                    and left._hash != right._hash:
+                return False
+            elif left._key() != right._key():
+                return False
+            left_children = left._children()
+            right_children = right._children()
+            if len(left_children) != len(right_children):
+                return False
+            stack.extend(zip(left_children, right_children))
+        elif not left == right:
+            return False
+    return True
+
+
+def _leaf_hash(value):
+    # type: (Any) -> int
+    if isinstance(value, _CompositeNode):
+        return value._hash
+    else:
+        return hash((type(value), value))
+
+
+def _compute_hash(node):
+    # type: (_CompositeNode) -> None
+    """Compute and cache hashes of `node` and of its children that do not
+    have one yet, children first and without recursion."""
+    stack = [node]
+    while stack:
+        current = stack[-1]
+        pending = [child for child in current._children()
+                   if isinstance(child, _CompositeNode)
+                   and child._hash is None]
+        if pending:
+            stack.extend(pending)
+            continue
+
+        stack.pop()
+        if current._hash is None:
+            children = tuple(_leaf_hash(child)
+                             for child in current._children())
+            object.__setattr__(current, "_hash",
+                               hash((current._key(), children)))
+
+
+class _CompositeNode(_ImmutableNode):
+    """Node with child nodes. The hash is computed on first use and cached,
+    the hash and the equality are computed iteratively, so that deeply
+    nested expressions do not exceed the recursion limit."""
+    __slots__ = ()
+
+    def _key(self):
+        # type: () -> Tuple
+        """Attributes other than the child nodes."""
+        raise NotImplementedError
+
+    def _children(self):
+        # type: () -> Tuple
+        raise NotImplementedError
+
+    def __eq__(self, other):
+        # type: (Any) -> bool
+        if not isinstance(other, type(self)):
+            return NotImplemented
+        else:
+            return _equal(self, other)
+
+    def __ne__(self, other):
+        # type: (Any) -> bool
+        return not self == other
+
+    def __hash__(self):
+        # type: () -> int
+        if self._hash is None:
+            _compute_hash(self)
+        return self._hash
+
+
+class Function(_CompositeNode):
+    __slots__ = ("variable", "_args", "_hash")
+
+    def __init__(self, variable, args):
+        # type: (Variable, List[str]) -> None
+        """Function call node. Attributes: `variable` – the function
+        `Variable`, `reference` and `name` of the function and `args` – list
+        of the arguments."""
+        set_attribute = object.__setattr__
+        set_attribute(self, "variable", variable)
+        set_attribute(self, "_args", tuple(args))
+        set_attribute(self, "_hash", None)
+
+    @property
+    def reference(self):
+        # type: () -> List[str]
+        return self.variable.reference
+
+    @property
+    def name(self):
+        # type: () -> str
+        return self.variable.name
+
+    @property
+    def args(self):
+        # type: () -> List[Any]
+        return list(self._args)
+
+    def __reduce__(self):
+        # type: () -> Tuple
+        return (Function, (self.variable, self._args))
+
+    def __str__(self):
+        # type: () -> str
+        return "{}({})".format(self.name,
+                               ", ".join(str(a) for a in self._args))
+
+    def __repr__(self):
+        # type: () -> str
+        return "{}({})".format(self.name,
+                               ", ".join(repr(a) for a in self._args))
+
+    def _key(self):
+        # type: () -> Tuple
+        return (self.variable, )
+
+    def _children(self):
+        # type: () -> Tuple
+        return self._args
+
+
+class Variable(_ImmutableNode):
+    __slots__ = ("_reference", "name")
+
+    def __init__(self, reference):
+        # type: (List[str]) -> None
+        """Creates a variable reference. Attributes: `reference` – variable
+        reference as a list of variable parts and `name` as a full variable
+        name. This object is passed to the `compile_variable()` and
+        `compile_function()`. Use `intern_variable()` to get a shared
+        instance."""
+
+        reference = tuple(intern(part) for part in reference)
+        set_attribute = object.__setattr__
+        set_attribute(self, "_reference", reference)
+        set_attribute(self, "name", intern(".".join(reference)))
+
+    @property
+    def reference(self):
+        # type: () -> List[str]
+        return list(self._reference)
+
+    def __reduce__(self):
+        # type: () -> Tuple
+        return (intern_variable, (self.reference, ))
+
+    def __str__(self):
+        # type: () -> str
+        return self.name
+
+    def __repr__(self):
+        # type: () -> str
+        return "Variable({.name})".format(self)
+
+    def __eq__(self, other):
+        # type: (Any) -> bool
+        if self is other:
+            return True
+        elif not isinstance(other, Variable):
+            return NotImplemented
+        else:
+            return self.name == other.name \
+                    and self._reference == other._reference
+
+    def __ne__(self, other):
+        # type: (Any) -> bool
+        return not self == other
+
+    def __hash__(self):
+        # type: () -> int
+        return hash(self.name)
+
+
+class UnaryOperator(_CompositeNode):
+    __slots__ = ("operator", "operand", "_hash")
+
+    def __init__(self, operator, operand):
+        # type: (str, str) -> None
+        set_attribute = object.__setattr__
+        set_attribute(self, "operator", intern(operator))
+        set_attribute(self, "operand", operand)
+        set_attribute(self, "_hash", None)
+
+    def __reduce__(self):
+        # type: () -> Tuple
+        return (UnaryOperator, (self.operator, self.operand))
+
+    def __str__(self):
+        # type: () -> str
+        return "({0.operator} {0.operand})".format(self)
+
+    def __repr__(self):
+        # type: () -> str
+        return "Unary({0.operator!r}, {0.operand!r})".format(self)
+
+    def _key(self):
+        # type: () -> Tuple
+        return (self.operator, )
+
+    def _children(self):
+        # type: () -> Tuple
+        return (self.operand, )
+
+
+class BinaryOperator(_CompositeNode):
+    __slots__ = ("operator", "left", "right", "_hash")
+
+    def __init__(self, operator, left, right):
+        # type: (str, str, str) -> None
+        set_attribute = object.__setattr__
+        set_attribute(self, "operator", intern(operator))
+        set_attribute(self, "left", left)
+        set_attribute(self, "right", right)
+        set_attribute(self, "_hash", None)
+
+    def __reduce__(self):
+        # type: () -> Tuple
+        return (BinaryOperator, (self.operator, self.left, self.right))
+
+    def __str__(self):
+        # type: () -> str
+        return "({0.left} {0.operator} {0.right})".format(self)
+
+    def __repr__(self):
+        # type: () -> str
+        return "Binary({0.left!r}, {0.operator!r}, {0.right!r})".format(self)
+
+    def _key(self):
+        # type: () -> Tuple
+        return (self.operator, )
+
+    def _children(self):
+        # type: () -> Tuple
+        return (self.left, self.right)
@@ -0,0 +1,346 @@
+# -*- encoding: utf-8 -*-
+"""Optimization of parsed expressions.
+
+`optimize_expression()` rewrites the instructions of a `ParsedExpression`
+before they are replayed into a compiler:
+
+* operators with literal operands are folded into a literal
+* calls of pure functions with literal arguments are folded into a literal
+* identities such as ``x * 1``, ``x + 0`` or ``- - x`` are removed when
+  ``x`` is known to be a number – an arithmetic result, not a variable
+* division by a float constant with an exact reciprocal is reduced to a
+  multiplication
+
+Only rewrites which give the same result in Python and in SQL are made:
+integer division and modulo are folded only for non-negative operands,
+division of integers is not folded at all and logical operators are never
+folded or reordered. Operations that would fail, such as division by zero,
+are left for the evaluation.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+
+import math
+import operator
+
+MYPY = False
+if MYPY:
+    from typing import List, Any, Dict, Optional, Callable, Tuple
+
+from .compat import string_type
+from .parsed import ParsedExpression, LITERAL, FUNCTION, UNARY, BINARY
+
+__all__ = [
+        "optimize_expression",
+        "pure_functions",
+    ]
+
+
+# Functions without side effects that can be evaluated at compilation time
+pure_functions = {
+    "abs": abs,
+    "min": min,
+    "max": max,
+    "sqrt": math.sqrt,
+    "exp": math.exp,
+    "log": math.log,
+    "log10": math.log10,
+}  # type: Dict[str, Callable]
+
+
+_ARITHMETIC = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": operator.truediv,
+    "//": operator.floordiv,
+    "%": operator.mod,
+    "^": operator.pow,
+}
+
+_BITWISE = {
+    "&": operator.and_,
+    "|": operator.or_,
+    "<<": operator.lshift,
+    ">>": operator.rshift,
+}
+
+_UNARY = {
+    "-": operator.neg,
+    "+": operator.pos,
+    "~": operator.invert,
+}
+
+# Largest folded shift and integer power exponent
+_MAX_EXPONENT = 64
+
+# Folded integers fit into 64 bits
+_MAX_INTEGER = 2 ** 63
+
+
+def _is_number(value):
+    # type: (Any) -> bool
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_int(value):
+    # type: (Any) -> bool
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _is_literal(value):
+    # type: (Any) -> bool
+    """Return true if `value` can be a folded literal."""
+    if isinstance(value, float):
+        return not math.isinf(value) and not math.isnan(value)
+    elif _is_int(value):
+        return -_MAX_INTEGER <= value < _MAX_INTEGER
+    return isinstance(value, string_type)
+
+
+def _fold_binary(op, left, right):
+    # type: (str, Any, Any) -> Tuple[bool, Any]
+    """Return tuple (`folded`, `value`)."""
+    if op in _ARITHMETIC:
+        if op == "+" and isinstance(left, string_type) \
+                and isinstance(right, string_type):
+            return (True, left + right)
+        if not _is_number(left) or not _is_number(right):
+            return (False, None)
+        if op == "/" and _is_int(left) and _is_int(right):
+            # Integer division in SQL, true division in Python
+            return (False, None)
+        if op in ("//", "%") and (left < 0 or right < 0):
+            # Rounding of negative numbers differs
+            return (False, None)
+        if op == "^":
+            if _is_int(right) and not 0 <= right <= _MAX_EXPONENT:
+                return (False, None)
+        function = _ARITHMETIC[op]
+    elif op in _BITWISE:
+        if not _is_int(left) or not _is_int(right):
+            return (False, None)
+        if op in ("<<", ">>") and not 0 <= right <= _MAX_EXPONENT:
+            return (False, None)
+        function = _BITWISE[op]
+    else:
+        return (False, None)
+
+    try:
+        value = function(left, right)
+    except (ArithmeticError, ValueError):
+        return (False, None)
+
+    return (_is_literal(value), value)
+
+
+def _fold_unary(op, operand):
+    # type: (str, Any) -> Tuple[bool, Any]
+    if op == "~":
+        if not _is_int(operand):
+            return (False, None)
+    elif op not in _UNARY or not _is_number(operand):
+        return (False, None)
+
+    value = _UNARY[op](operand)
+    return (_is_literal(value), value)
+
+
+def _fold_function(function, args):
+    # type: (Callable, List[Any]) -> Tuple[bool, Any]
+    if not all(_is_number(arg) for arg in args):
+        return (False, None)
+    try:
+        value = function(*args)
+    except (ArithmeticError, ValueError, TypeError):
+        return (False, None)
+
+    return (_is_number(value) and _is_literal(value), value)
+
+
+def _is_exact_reciprocal(value):
+    # type: (Any) -> bool
+    """Return true if `value` is a float power of two."""
+    return isinstance(value, float) and value != 0 \
+           and _is_literal(value) and math.frexp(value)[0] in (0.5, -0.5) \
+           and _is_literal(1.0 / value)
+
+
+class _Rewriter(object):
+    """Builds list of optimized instructions."""
+
+    def __init__(self):
+        # type: () -> None
+        self.instructions = []  # type: List[Tuple]
+        # Instructions known to evaluate to numbers
+        self.numbers = []  # type: List[bool]
+
+    def emit(self, instruction):
+        # type: (Tuple) -> int
+        self.numbers.append(self._is_numeric(instruction))
+        self.instructions.append(instruction)
+        return len(self.instructions) - 1
+
+    def literal(self, index):
+        # type: (int) -> Tuple[bool, Any]
+        """Return tuple (`is_literal`, `value`) of instruction `index`."""
+        instruction = self.instructions[index]
+        if instruction[0] == LITERAL:
+            return (True, instruction[1])
+        return (False, None)
+
+    def numeric(self, index):
+        # type: (int) -> bool
+        """Return true if instruction `index` evaluates to a number, not a
+        boolean or a string, or fails."""
+        return self.numbers[index]
+
+    def _is_numeric(self, instruction):
+        # type: (Tuple) -> bool
+        code = instruction[0]
+        if code == LITERAL:
+            return _is_number(instruction[1])
+        elif code == UNARY:
+            return instruction[1] in ("-", "+", "~")
+        elif code == BINARY:
+            op = instruction[1]
+            if op in ("-", "/", "//", "^"):
+                return True
+            elif op in ("+", "*"):
+                return self.numbers[instruction[2]] \
+                    and self.numbers[instruction[3]]
+            elif op == "%":
+                return self.numbers[instruction[2]]
+        return False
+
+    def binary(self, op, left, right):
+        # type: (str, int, int) -> int
+        is_left, left_value = self.literal(left)
+        is_right, right_value = self.literal(right)
+
+        if is_left and is_right:
+            folded, value = _fold_binary(op, left_value, right_value)
+            if folded:
+                return self.emit((LITERAL, value))
+
+        # Identities, only with integer literals and numeric operands to keep
+        # the type: `True + 0` is 1 and `'a' + 0` fails
+        if is_right and _is_int(right_value) and self.numeric(left):
+            if right_value == 0 and op in ("+", "-"):
+                return left
+            if right_value == 1 and op == "*":
+                return left
+        if is_left and _is_int(left_value) and self.numeric(right):
+            if left_value == 0 and op == "+":
+                return right
+            if left_value == 1 and op == "*":
+                return right
+
+        if op == "/" and is_right and _is_exact_reciprocal(right_value):
+            constant = self.emit((LITERAL, 1.0 / right_value))
+            return self.emit((BINARY, "*", left, constant))
+
+        return self.emit((BINARY, op, left, right))
+
+    def unary(self, op, operand):
+        # type: (str, int) -> int
+        is_literal, value = self.literal(operand)
+        if is_literal:
+            folded, value = _fold_unary(op, value)
+            if folded:
+                return self.emit((LITERAL, value))
+
+        instruction = self.instructions[operand]
+        if op == "-" and instruction[0] == UNARY and instruction[1] == "-" \
+                and self.numeric(instruction[2]):
+            return instruction[2]
+
+        return self.emit((UNARY, op, operand))
+
+    def function(self, function, args, functions):
+        # type: (Any, Tuple[int, ...], Dict[str, Callable]) -> int
+        callable_ = functions.get(function.name)
+        if callable_ is not None:
+            literals = [self.literal(arg) for arg in args]
+            if all(is_literal for is_literal, _ in literals):
+                folded, value = _fold_function(callable_,
+                                               [value for _, value
+                                                in literals])
+                if folded:
+                    return self.emit((LITERAL, value))
+
+        return self.emit((FUNCTION, function, args))
+
+
+def _prune(instructions, root):
+    # type: (List[Tuple], int) -> List[Tuple]
+    """Return instructions of the `root` expression without unused
+    instructions, in the original order."""
+    live = [False] * len(instructions)
+    live[root] = True
+
+    for index in range(root, -1, -1):
+        if not live[index]:
+            continue
+        instruction = instructions[index]
+        code = instruction[0]
+        if code == BINARY:
+            live[instruction[2]] = live[instruction[3]] = True
+        elif code == UNARY:
+            live[instruction[2]] = True
+        elif code == FUNCTION:
+            for arg in instruction[2]:
+                live[arg] = True
+
+    new_indexes = {}  # type: Dict[int, int]
+    result = []  # type: List[Tuple]
+
+    for index in range(root + 1):
+        if not live[index]:
+            continue
+        instruction = instructions[index]
+        code = instruction[0]
+        if code == BINARY:
+            instruction = (BINARY, instruction[1],
+                           new_indexes[instruction[2]],
+                           new_indexes[instruction[3]])
+        elif code == UNARY:
+            instruction = (UNARY, instruction[1], new_indexes[instruction[2]])
+        elif code == FUNCTION:
+            instruction = (FUNCTION, instruction[1],
+                           tuple(new_indexes[arg] for arg in instruction[2]))
+        new_indexes[index] = len(result)
+        result.append(instruction)
+
+    return result
+
+
+def optimize_expression(parsed, functions=None):
+    # type: (ParsedExpression, Optional[Dict[str, Callable]]) -> ParsedExpression
+    """Return optimized copy of the `parsed` expression. `functions` is a
+    dictionary of pure functions that can be folded, `pure_functions` by
+    default."""
+    if functions is None:
+        functions = pure_functions
+
+    rewriter = _Rewriter()
+    indexes = []  # type: List[int]
+
+    for instruction in parsed.instructions:
+        code = instruction[0]
+        if code == BINARY:
+            index = rewriter.binary(instruction[1], indexes[instruction[2]],
+                                    indexes[instruction[3]])
+        elif code == UNARY:
+            index = rewriter.unary(instruction[1], indexes[instruction[2]])
+        elif code == FUNCTION:
+            args = tuple(indexes[arg] for arg in instruction[2])
+            index = rewriter.function(instruction[1], args, functions)
+        else:
+            index = rewriter.emit(instruction)
+        indexes.append(index)
+
+    instructions = _prune(rewriter.instructions, indexes[-1])
+
+    return ParsedExpression(parsed.text, instructions, parsed.tokens)
@@ -0,0 +1,288 @@
+# -*- encoding: utf-8 -*-
+"""Multi-core evaluation of compiled expressions over large columns.
+
+`ParallelExecutor` copies the input columns once into shared memory, splits
+them into chunks and evaluates the chunks in a pool of worker processes. The
+workers map the shared memory without copying and write their results
+directly into a shared output buffer.
+
+The compiled plan – a `NumpyPlan` or an `Evaluator` – is pickled and sent to
+every worker once when the pool starts, the expression text is not parsed in
+the workers. Requires Python 3.8 or newer and NumPy.
+"""
+
+from __future__ import absolute_import
+
+MYPY = False
+if MYPY:
+    from typing import List, Any, Dict, Optional, Tuple
+
+from .errors import ExpressionError
+from .evaluator import Evaluator
+from .vectorized import NumpyPlan, resolve_column, _import_numpy
+
+__all__ = [
+        "ParallelExecutor",
+        "DEFAULT_CHUNK_SIZE",
+    ]
+
+
+# Number of rows evaluated by a worker at once
+DEFAULT_CHUNK_SIZE = 1048576
+
+
+def _shared_memory():
+    # type: () -> Any
+    try:
+        from multiprocessing import shared_memory
+    except ImportError:
+        raise ExpressionError("Parallel evaluation requires Python 3.8 or "
+                              "newer")
+    return shared_memory
+
+
+def _attach(name):
+    # type: (str) -> Any
+    """Attach to an existing shared memory block `name` in a worker without
+    registering it with the resource tracker – the block is owned and
+    unlinked by the parent process."""
+    shared_memory = _shared_memory()
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 has no `track` argument
+        from multiprocessing import resource_tracker
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args, **kwargs: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
+
+
+# Plan of the worker process, set by `_initialize_worker()`
+_worker_plan = None
+
+
+def _initialize_worker(plan):
+    # type: (Any) -> None
+    global _worker_plan
+    _worker_plan = plan
+
+
+def _evaluate_chunk(inputs, output, start, stop):
+    # type: (List[Tuple[str, str, str, int]], Tuple[str, str, int], int, int) -> None
+    """Evaluate rows from `start` to `stop` of the shared `inputs` and write
+    them into the shared `output`. Inputs are tuples (`name`, `memory`,
+    `dtype`, `length`), output is a tuple (`memory`, `dtype`, `length`)."""
+    blocks = []  # type: List[Any]
+
+    try:
+        _evaluate_shared(blocks, inputs, output, start, stop)
+    finally:
+        for block in blocks:
+            try:
+                block.close()
+            except BufferError:
+                # A view of the memory is still referenced by a traceback,
+                # the memory is unmapped once the view is released
+                pass
+
+
+def _evaluate_shared(blocks, inputs, output, start, stop):
+    # type: (List[Any], List[Tuple[str, str, str, int]], Tuple[str, str, int], int, int) -> None
+    numpy = _import_numpy()
+
+    columns = {}
+    for name, memory, dtype, length in inputs:
+        block = _attach(memory)
+        blocks.append(block)
+        array = numpy.ndarray(length, dtype=dtype, buffer=block.buf)
+        columns[name] = array[start:stop]
+
+    memory, dtype, length = output
+    block = _attach(memory)
+    blocks.append(block)
+    out = numpy.ndarray(length, dtype=dtype, buffer=block.buf)
+
+    _evaluate(_worker_plan, columns, out[start:stop])
+
+
+def _evaluate_rows(plan, columns):
+    # type: (Evaluator, Dict[str, Any]) -> Any
+    """Evaluate an `Evaluator` `plan` for every row of `columns` and return
+    the results as an array."""
+    numpy = _import_numpy()
+    names = plan.variables
+    keys = [name if plan.keys is None else plan.keys[name]
+            for name in names]
+    values = [columns[name].tolist() for name in names]
+    rows = (dict(zip(keys, row)) for row in zip(*values))
+    return numpy.asarray(list(map(plan.function, rows)))
+
+
+def _evaluate(plan, columns, out):
+    # type: (Any, Dict[str, Any], Any) -> None
+    """Evaluate `plan` for `columns` and write the result into `out`. Raises
+    `ExpressionError` if results of an `Evaluator` can not be stored in
+    `out` without loss."""
+    if isinstance(plan, NumpyPlan):
+        plan.execute_blocked(columns, out=out)
+    else:
+        numpy = _import_numpy()
+        result = _evaluate_rows(plan, columns)
+        if len(result) and not numpy.can_cast(result.dtype, out.dtype):
+            raise ExpressionError("Results of type {} can not be stored as "
+                                  "{} without loss, specify the dtype of "
+                                  "the result".format(result.dtype,
+                                                      out.dtype))
+        out[:] = result
+
+
+class ParallelExecutor(object):
+    def __init__(self, plan, workers=None, chunk_size=None, dtype=None):
+        # type: (Any, Optional[int], Optional[int], Any) -> None
+        """Creates an executor of a compiled `plan` – a `NumpyPlan` or an
+        `Evaluator` – on a pool of `workers` processes (number of CPUs by
+        default). Columns are split into chunks of `chunk_size` rows
+        (`DEFAULT_CHUNK_SIZE` by default).
+
+        `dtype` is the type of the result array. By default it is the type
+        of the `out` array, if given, or the type of the result of the first
+        row. Execution of an `Evaluator` raises `ExpressionError` if a
+        result can not be stored in the result type without loss.
+
+        The pool is created on the first `execute()` and reused until the
+        executor is closed. The executor can be used as a context
+        manager."""
+        if not isinstance(plan, (NumpyPlan, Evaluator)):
+            raise ExpressionError("Plan must be a NumpyPlan or an Evaluator")
+
+        self.plan = plan
+        self.workers = workers
+        self.chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+        self.dtype = dtype
+        self._pool = None  # type: Any
+
+        if self.chunk_size < 1:
+            raise ExpressionError("Chunk size must be positive")
+
+    def __enter__(self):
+        # type: () -> ParallelExecutor
+        return self
+
+    def __exit__(self, *args):
+        # type: (Any) -> None
+        self.close()
+
+    def close(self):
+        # type: () -> None
+        """Shut down the worker pool."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _get_pool(self):
+        # type: () -> Any
+        if self._pool is None:
+            from concurrent.futures import ProcessPoolExecutor
+            self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                             initializer=_initialize_worker,
+                                             initargs=(self.plan, ))
+        return self._pool
+
+    def _output_dtype(self, columns):
+        # type: (Dict[str, Any]) -> Any
+        """Return type of the result evaluated from the first row."""
+        numpy = _import_numpy()
+        first = dict((name, column[:1]) for name, column in columns.items())
+
+        if isinstance(self.plan, NumpyPlan):
+            return numpy.asarray(self.plan.execute(first)).dtype
+        else:
+            return _evaluate_rows(self.plan, first).dtype
+
+    def execute(self, columns, out=None):
+        # type: (Any, Any) -> Any
+        """Evaluate the plan for `columns` – a mapping of variable names to
+        arrays – and return the result array. The result is written into
+        `out` if provided."""
+        numpy = _import_numpy()
+        shared_memory = _shared_memory()
+
+        names = self.plan.variables
+        if not names:
+            raise ExpressionError("Expression does not use any column")
+
+        arrays = dict((name, numpy.ascontiguousarray(
+                                resolve_column(columns, name,
+                                               name.split("."))))
+                      for name in names)
+        length = len(arrays[names[0]])
+
+        for name, array in arrays.items():
+            if array.ndim != 1 or len(array) != length:
+                raise ExpressionError("Column '{}' is not a one-dimensional "
+                                      "array of length {}"
+                                      .format(name, length))
+            if array.dtype.hasobject:
+                raise ExpressionError("Column '{}' of object type can not "
+                                      "be shared".format(name))
+
+        if self.dtype is not None:
+            dtype = numpy.dtype(self.dtype)
+        elif out is not None:
+            dtype = out.dtype
+        elif length == 0:
+            dtype = numpy.float64
+        else:
+            dtype = self._output_dtype(arrays)
+
+        if dtype.hasobject:
+            raise ExpressionError("Result of type {} can not be evaluated "
+                                  "in parallel".format(dtype))
+
+        if out is None:
+            out = numpy.empty(length, dtype=dtype)
+        elif len(out) != length:
+            raise ExpressionError("Output array has length {}, expected {}"
+                                  .format(len(out), length))
+
+        if length == 0:
+            return out
+
+        blocks = []
+        try:
+            inputs = []
+            for name, array in arrays.items():
+                block = shared_memory.SharedMemory(create=True,
+                                                   size=max(array.nbytes, 1))
+                blocks.append(block)
+                shared = numpy.ndarray(length, dtype=array.dtype,
+                                       buffer=block.buf)
+                shared[:] = array
+                del shared
+                inputs.append((name, block.name, array.dtype.str, length))
+
+            block = shared_memory.SharedMemory(
+                        create=True,
+                        size=max(length * numpy.dtype(dtype).itemsize, 1))
+            blocks.append(block)
+            output = (block.name, numpy.dtype(dtype).str, length)
+
+            pool = self._get_pool()
+            futures = [pool.submit(_evaluate_chunk, inputs, output, start,
+                                   min(start + self.chunk_size, length))
+                       for start in range(0, length, self.chunk_size)]
+            for future in futures:
+                future.result()
+
+            result = numpy.ndarray(length, dtype=dtype, buffer=block.buf)
+            out[:] = result
+            del result
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+        return out
@@ -0,0 +1,395 @@
+# -*- encoding: utf-8 -*-
+"""Parsed expressions and the parsed expression cache.
+
+A `ParsedExpression` is a context-free product of parsing: a flat list of
+instructions, one per `compile_*` call in the order the parser made the
+calls. Each instruction refers to its operands by their index in the list,
+therefore the list is the expression tree in post-order. Replaying the
+instructions into a compiler makes exactly the same calls as compiling the
+original text, without parsing it again.
+"""
+
+from __future__ import absolute_import
+
+import threading
+
+from collections import OrderedDict, namedtuple
+
+MYPY = False
+if MYPY:
+    from typing import List, Any, Optional, Tuple, Dict
+
+from .nodes import Variable
+from .backends import get_parser
+
+__all__ = [
+        "ParsedExpression",
+        "ExpressionCache",
+        "ExpressionBatch",
+        "parse_expression",
+        "expression_depth",
+        "merge_expressions",
+        "default_cache",
+    ]
+
+
+# Instruction codes
+LITERAL = 0
+VARIABLE = 1
+FUNCTION = 2
+UNARY = 3
+BINARY = 4
+
+
+class ParsedExpression(object):
+    def __init__(self, text, instructions, tokens=None):
+        # type: (str, List[Tuple], Optional[int]) -> None
+        """Parsed expression `text`. `instructions` is a list of tuples:
+
+        * ``(LITERAL, value)``
+        * ``(VARIABLE, variable)``
+        * ``(FUNCTION, variable, argument_indexes)``
+        * ``(UNARY, operator, operand_index)``
+        * ``(BINARY, operator, left_index, right_index)``
+
+        The last instruction is the root of the expression. `tokens` is the
+        number of tokens of the text if known."""
+        self.text = text
+        self.instructions = instructions
+        self.tokens = tokens
+
+    def __len__(self):
+        # type: () -> int
+        return len(self.instructions)
+
+    def __repr__(self):
+        # type: () -> str
+        return "ParsedExpression({!r})".format(self.text)
+
+    def replay(self, compiler, context=None, finalize=True):
+        # type: (Any, Any, bool) -> Any
+        """Compile the parsed expression with `compiler` within `context`.
+        Calls the `compile_*` methods of the compiler in the same order as
+        the parser would and returns the finalized object. If `finalize` is
+        false the compiled root object is returned without finalization."""
+
+        compile_literal = compiler.compile_literal
+        compile_variable = compiler.compile_variable
+        compile_function = compiler.compile_function
+        compile_unary = compiler.compile_unary
+        compile_binary = compiler.compile_binary
+
+        results = []  # type: List[Any]
+        append = results.append
+
+        for instruction in self.instructions:
+            code = instruction[0]
+            if code == BINARY:
+                append(compile_binary(context, instruction[1],
+                                      results[instruction[2]],
+                                      results[instruction[3]]))
+            elif code == VARIABLE:
+                append(compile_variable(context, instruction[1]))
+            elif code == LITERAL:
+                append(compile_literal(context, instruction[1]))
+            elif code == UNARY:
+                append(compile_unary(context, instruction[1],
+                                     results[instruction[2]]))
+            else:
+                args = [results[i] for i in instruction[2]]
+                append(compile_function(context, instruction[1], args))
+
+        if not finalize:
+            return results[-1]
+
+        return compiler.finalize(context, results[-1])
+
+
+class _Recorder(object):
+    """Compiler-like object that records the compilation calls as
+    `ParsedExpression` instructions. Every method returns index of the
+    recorded instruction."""
+
+    def __init__(self):
+        # type: () -> None
+        self.instructions = []  # type: List[Tuple]
+
+    def _record(self, instruction):
+        # type: (Tuple) -> int
+        self.instructions.append(instruction)
+        return len(self.instructions) - 1
+
+    def compile_literal(self, context, literal):
+        # type: (Any, Any) -> int
+        return self._record((LITERAL, literal))
+
+    def compile_variable(self, context, variable):
+        # type: (Any, Variable) -> int
+        return self._record((VARIABLE, variable))
+
+    def compile_function(self, context, function, args):
+        # type: (Any, Variable, List[int]) -> int
+        return self._record((FUNCTION, function, tuple(args)))
+
+    def compile_unary(self, context, operator, operand):
+        # type: (Any, str, int) -> int
+        return self._record((UNARY, operator, operand))
+
+    def compile_binary(self, context, operator, left, right):
+        # type: (Any, str, int, int) -> int
+        return self._record((BINARY, operator, left, right))
+
+
+def parse_expression(text, parser=None):
+    # type: (str, Optional[str]) -> ParsedExpression
+    """Parse expression `text` into a `ParsedExpression`. `parser` is name
+    of the parser backend, see `Compiler`."""
+    recorder = _Recorder()
+    if parser is None or parser == "native":
+        from .parser import parse_counting_tokens
+        _, tokens = parse_counting_tokens(text, recorder)
+    else:
+        get_parser(parser)(text, recorder)
+        tokens = None
+
+    return ParsedExpression(text, recorder.instructions, tokens)
+
+
+def expression_depth(parsed):
+    # type: (ParsedExpression) -> int
+    """Return depth of the `parsed` expression tree, a single literal or
+    variable has depth 1."""
+    depths = []  # type: List[int]
+    append = depths.append
+
+    for instruction in parsed.instructions:
+        code = instruction[0]
+        if code == BINARY:
+            append(1 + max(depths[instruction[2]], depths[instruction[3]]))
+        elif code == UNARY:
+            append(1 + depths[instruction[2]])
+        elif code == FUNCTION:
+            append(1 + max([depths[i] for i in instruction[2]] or [0]))
+        else:
+            append(1)
+
+    return depths[-1] if depths else 0
+
+
+class ExpressionBatch(object):
+    def __init__(self, texts, instructions, roots):
+        # type: (List[str], List[Tuple], List[int]) -> None
+        """Batch of parsed expressions `texts` sharing common
+        subexpressions. `instructions` are the same as in the
+        `ParsedExpression` but every distinct subexpression is present only
+        once, `roots` are indexes of the instructions of the expressions.
+
+        `shared` is a list of flags of instructions that are worth computing
+        only once: operators and function calls used more than once which
+        are always evaluated – not only on the right side of ``and`` or
+        ``or``."""
+        self.texts = texts
+        self.instructions = instructions
+        self.roots = roots
+
+        uses = [0] * len(instructions)
+        evaluated = [False] * len(instructions)
+
+        for root in roots:
+            uses[root] += 1
+            evaluated[root] = True
+
+        # Parents always follow their operands, walk from parents down
+        for index in range(len(instructions) - 1, -1, -1):
+            instruction = instructions[index]
+            code = instruction[0]
+            if code == BINARY or code == UNARY:
+                operands = instruction[2:]
+            elif code == FUNCTION:
+                operands = instruction[2]
+            else:
+                continue
+
+            for operand in operands:
+                uses[operand] += 1
+
+            if evaluated[index]:
+                if code == BINARY and instruction[1] in ("and", "or"):
+                    evaluated[instruction[2]] = True
+                else:
+                    for operand in operands:
+                        evaluated[operand] = True
+
+        self.shared = [uses[i] > 1 and evaluated[i]
+                       and instructions[i][0] not in (LITERAL, VARIABLE)
+                       for i in range(len(instructions))]
+
+    def __len__(self):
+        # type: () -> int
+        return len(self.instructions)
+
+    def __repr__(self):
+        # type: () -> str
+        return "ExpressionBatch({!r})".format(self.texts)
+
+    def replay(self, compiler, context=None):
+        # type: (Any, Any) -> List[Any]
+        """Compile the batch with `compiler` within `context`. Every
+        distinct subexpression is compiled once, the compiled objects of
+        the shared subexpressions are passed through
+        `compiler.compile_shared()`. Returns list of compiled objects of the
+        expressions, not finalized."""
+
+        shared = self.shared
+        results = []  # type: List[Any]
+        append = results.append
+
+        for index, instruction in enumerate(self.instructions):
+            code = instruction[0]
+            if code == BINARY:
+                result = compiler.compile_binary(context, instruction[1],
+                                                 results[instruction[2]],
+                                                 results[instruction[3]])
+            elif code == VARIABLE:
+                result = compiler.compile_variable(context, instruction[1])
+            elif code == LITERAL:
+                result = compiler.compile_literal(context, instruction[1])
+            elif code == UNARY:
+                result = compiler.compile_unary(context, instruction[1],
+                                                results[instruction[2]])
+            else:
+                args = [results[i] for i in instruction[2]]
+                result = compiler.compile_function(context, instruction[1],
+                                                   args)
+            if shared[index]:
+                result = compiler.compile_shared(context, result)
+            append(result)
+
+        return [results[root] for root in self.roots]
+
+
+def merge_expressions(expressions):
+    # type: (List[ParsedExpression]) -> ExpressionBatch
+    """Merge parsed `expressions` into an `ExpressionBatch`. Structurally
+    equal subexpressions are merged into one, including calls of the same
+    function with the same arguments – functions are expected to have no
+    side effects."""
+
+    instructions = []  # type: List[Tuple]
+    known = {}  # type: Dict[Tuple, int]
+    roots = []  # type: List[int]
+
+    for parsed in expressions:
+        indexes = []  # type: List[int]
+
+        for instruction in parsed.instructions:
+            code = instruction[0]
+            if code == BINARY:
+                instruction = (BINARY, instruction[1],
+                               indexes[instruction[2]],
+                               indexes[instruction[3]])
+            elif code == UNARY:
+                instruction = (UNARY, instruction[1],
+                               indexes[instruction[2]])
+            elif code == FUNCTION:
+                instruction = (FUNCTION, instruction[1],
+                               tuple(indexes[i] for i in instruction[2]))
+
+            if code == LITERAL:
+                # 1, 1.0 and True are equal but are different literals
+                key = (LITERAL, type(instruction[1]), instruction[1])
+            else:
+                key = instruction
+
+            index = known.get(key)
+            if index is None:
+                index = len(instructions)
+                instructions.append(instruction)
+                known[key] = index
+            indexes.append(index)
+
+        roots.append(indexes[-1])
+
+    return ExpressionBatch([parsed.text for parsed in expressions],
+                           instructions, roots)
+
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+class ExpressionCache(object):
+    def __init__(self, maxsize=1024):
+        # type: (int) -> None
+        """Least recently used cache of parsed expressions keyed by the
+        expression text. At most `maxsize` expressions are kept."""
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()  # type: OrderedDict
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        # type: () -> int
+        return len(self._items)
+
+    def __contains__(self, text):
+        # type: (str) -> bool
+        """`True` if `text` parsed by the native parser is cached."""
+        return ("native", text) in self._items
+
+    def parse(self, text, parser=None):
+        # type: (str, Optional[str]) -> ParsedExpression
+        """Return parsed expression `text` from the cache. The expression is
+        parsed with `parser` and stored in the cache if it is not cached
+        yet. Expressions parsed by different parsers are cached
+        separately."""
+        return self.lookup(text, parser)[0]
+
+    def lookup(self, text, parser=None):
+        # type: (str, Optional[str]) -> Tuple[ParsedExpression, bool]
+        """Same as `parse()`, returns tuple (`parsed`, `hit`) where `hit` is
+        true if the expression was not parsed."""
+        key = (parser or "native", text)
+        items = self._items
+
+        with self._lock:
+            parsed = items.pop(key, None)
+            if parsed is not None:
+                items[key] = parsed
+                self.hits += 1
+                return (parsed, True)
+            self.misses += 1
+
+        parsed = parse_expression(text, parser)
+
+        with self._lock:
+            self._remember(key, parsed)
+
+        return (parsed, False)
+
+    def _remember(self, key, parsed):
+        # type: (Tuple[str, str], ParsedExpression) -> None
+        """Store `parsed` expression, the lock must be held."""
+        if self.maxsize > 0:
+            self._items[key] = parsed
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def info(self):
+        # type: () -> CacheInfo
+        """Return cache statistics as a named tuple (`hits`, `misses`,
+        `maxsize`, `currsize`)."""
+        return CacheInfo(self.hits, self.misses, self.maxsize,
+                         len(self._items))
+
+    def clear(self):
+        # type: () -> None
+        """Remove all expressions from the cache and reset the
+        statistics."""
+        with self._lock:
+            self._items.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+default_cache = ExpressionCache()
@@ -0,0 +1,453 @@
+# -*- encoding: utf-8 -*-
+"""Hand-written expression parser.
+
+The parser accepts the language described in `grammar.ebnf` and calls the
+`compile_*` methods of a compiler in exactly the same order as the
+Grako-generated parser does: all operands of a chain of operators of the same
+precedence (such as ``a + b - c``) are compiled first, then the chain is
+folded from the left.
+
+The text is split into tokens by a single regular expression and the tokens
+are parsed with precedence climbing, which needs only a few Python frames per
+nesting level instead of one frame per grammar rule.
+"""
+
+from __future__ import absolute_import
+
+import re
+
+MYPY = False
+if MYPY:
+    from typing import List, Any, Union, Optional, Tuple, Set, \
+                       Dict
+
+from .backends import get_parser, GRAMMAR_VERSION
+from .errors import ExpressionSyntaxError
+from .nodes import intern_variable
+from . import compat
+
+__all__ = [
+        "parse",
+        "tokenize",
+        "scan_names",
+        "get_parser",
+        "GRAMMAR_VERSION",
+    ]
+
+
+KEYWORDS = frozenset(["in", "not", "is", "and", "or"])
+
+# Token kinds
+NUMBER = 0
+STRING = 1
+NAME = 2
+OPERATOR = 3
+END = 4
+
+_TOKEN_RE = re.compile(r"""
+    (?P<space>(?:\s+|\#[^\n]*(?:\n|$))+)
+    | (?P<number>[0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?)
+    | (?P<string>'[^'\\\r\n]*(?:\\.[^'\\\r\n]*)*')
+    | (?P<name>\w+(?:(?:\s+|\#[^\n]*(?:\n|$))*\.\w+)*)
+    | (?P<operator><<|>>|<=|>=|==|!=|//|[-+*/%^~&|<>(),])
+    | (?P<error>.)
+    """, re.VERBOSE | re.UNICODE)
+
+_SPACE_RE = re.compile(r"(?:\s+|#.*)+", re.UNICODE)
+
+# Tokens of `_TOKEN_RE` for `scan_names()`: runs of tokens other than names
+# are skipped by one match, a name is matched with the following `(`. A
+# comment has to end with the line, so that it can not end before a `.` or
+# a `(` within the comment.
+_SCAN_RE = re.compile(r"""
+    (?:[-+*/%^~&|(),\s]+|<<|>>|[<>=!]=|[<>]
+        | [0-9]*\.?[0-9]+(?:[eE][-+]?[0-9]+)?
+        | \#[^\n]*(?:\n|$)
+        | '[^'\\\r\n]*(?:\\.[^'\\\r\n]*)*')+
+    | (?P<name>\w+(?:(?:\s+|\#[^\n]*(?:\n|$))*\.\w+)*)
+      (?P<call>(?:\s+|\#[^\n]*(?:\n|$))*\()?
+    | (?P<error>.)
+    """, re.VERBOSE | re.UNICODE)
+
+# Names matched by `_SCAN_RE` and their references, `None` for keywords
+_scanned_names = {}  # type: Dict[str, Optional[str]]
+MAX_SCANNED_NAMES = 65536
+
+# Binary operators and their precedence levels. Level 3 is reserved for the
+# unary `not`.
+_OR_LEVEL = 1
+_NOT_LEVEL = 3
+
+BINARY_OPERATORS = {
+    "or": 1,
+    "and": 2,
+    "==": 4, "!=": 4, "<": 4, "<=": 4, ">": 4, ">=": 4, "in": 4, "is": 4,
+    "|": 5,
+    "&": 6,
+    "<<": 7, ">>": 7,
+    "+": 8, "-": 8,
+    "*": 9, "/": 9, "//": 9, "%": 9,
+}
+
+UNARY_OPERATORS = frozenset(["+", "-", "~"])
+
+# Parser frames: a chain of binary operators (`_CHAIN`, `min_level`, `stack`)
+# where the `stack` is created with the first operator, a factor waiting for
+# `^`, the power operator (`_POWER`, `left`), an unary operator (`_UNARY`,
+# `operator`), `not`, a parenthesis and a function call (`_CALL`,
+# `reference`, `args`)
+_CHAIN = 0
+_FACTOR = 1
+_POWER = 2
+_UNARY = 3
+_NOT = 4
+_PARENTHESIS = 5
+_CALL = 6
+
+_FACTOR_FRAME = (_FACTOR, )
+_NOT_FRAME = (_NOT, )
+_PARENTHESIS_FRAME = (_PARENTHESIS, )
+
+
+def tokenize(text):
+    # type: (str) -> List[Tuple[int, Any, int]]
+    """Return list of tokens of `text`. Token is a tuple (`kind`, `value`,
+    `position`). Names are returned as lists of reference components,
+    keywords are returned as operators. The list is terminated with an `END`
+    token."""
+
+    tokens = []
+    append = tokens.append
+    match = _TOKEN_RE.match
+    length = len(text)
+    pos = 0
+
+    while pos < length:
+        found = match(text, pos)
+        kind = found.lastgroup
+        value = found.group()
+
+        if kind == "space":
+            pass
+        elif kind == "name":
+            if "." in value:
+                reference = _SPACE_RE.sub("", value).split(".")
+            else:
+                reference = [value]
+            first = reference[0]
+            if first in KEYWORDS:
+                # Keyword operator directly followed by a dot, such as
+                # `not .5`
+                value = compat.intern(first)
+                append((OPERATOR, value, pos))
+            else:
+                for part in reference:
+                    if part.lower() in KEYWORDS:
+                        raise ExpressionSyntaxError("'{}' is a keyword."
+                                                    .format(part),
+                                                    text, pos)
+                append((NAME, reference, pos))
+        elif kind == "operator":
+            append((OPERATOR, compat.intern(value), pos))
+        elif kind == "number":
+            append((NUMBER, value, pos))
+        elif kind == "string":
+            append((STRING, value, pos))
+        else:
+            raise ExpressionSyntaxError("Unexpected character '{}'"
+                                        .format(value),
+                                        text, pos)
+        pos += len(value)
+
+    append((END, None, len(text)))
+
+    return tokens
+
+
+def _scanned_name(value, text, position):
+    # type: (str, str, int) -> Optional[str]
+    if "." in value:
+        reference = _SPACE_RE.sub("", value).split(".")
+    else:
+        reference = [value]
+
+    if reference[0] in KEYWORDS:
+        name = None
+    else:
+        for part in reference:
+            if part.lower() in KEYWORDS:
+                raise ExpressionSyntaxError("'{}' is a keyword."
+                                            .format(part),
+                                            text, position)
+        name = ".".join(reference)
+
+    if len(_scanned_names) >= MAX_SCANNED_NAMES:
+        _scanned_names.clear()
+    _scanned_names[value] = name
+    return name
+
+
+def scan_names(text):
+    # type: (str) -> Tuple[Set[str], Set[str]]
+    """Return tuple of sets (`variables`, `functions`) of names referenced in
+    the expression `text`. The text is scanned in a single pass without
+    parsing it: a name followed by ``(`` is a function, other names are
+    variables.
+
+    Invalid tokens and keywords used as names raise `ExpressionSyntaxError`,
+    the grammar is not checked. For a valid expression the names are the
+    same as collected by `ExpressionInspector`."""
+
+    variables = set()  # type: Set[str]
+    functions = set()  # type: Set[str]
+    match = _SCAN_RE.match
+    names = _scanned_names
+    length = len(text)
+    pos = 0
+
+    while pos < length:
+        found = match(text, pos)
+        pos = found.end()
+        kind = found.lastgroup
+
+        if kind is None:
+            continue
+        elif kind == "error":
+            raise ExpressionSyntaxError("Unexpected character '{}'"
+                                        .format(found.group()),
+                                        text, found.start())
+
+        value = found.group("name")
+        try:
+            name = names[value]
+        except KeyError:
+            name = _scanned_name(value, text, found.start())
+
+        if name is None:
+            # Keyword operator, scan the rest again as in `not .5`
+            keyword = _SPACE_RE.sub("", value).split(".")[0]
+            pos = found.start() + len(keyword)
+        elif kind == "call":
+            functions.add(name)
+        else:
+            variables.add(name)
+
+    return (variables, functions)
+
+
+class _Parser(object):
+    def __init__(self, text, compiler, context):
+        # type: (str, Any, Any) -> None
+        self.text = text
+        self.tokens = tokenize(text)
+        self.pos = 0
+        self.compiler = compiler
+        self.context = context
+
+    def error(self, message=None):
+        # type: (Optional[str]) -> None
+        kind, value, position = self.tokens[self.pos]
+        if message is None:
+            if kind == END:
+                message = "Unexpected end of expression"
+            else:
+                message = "Unexpected '{}'".format(self.text[position:]
+                                                   .split(None, 1)[0])
+        raise ExpressionSyntaxError(message, self.text, position)
+
+    def expect(self, operator):
+        # type: (str) -> None
+        kind, value, _ = self.tokens[self.pos]
+        if kind != OPERATOR or value != operator:
+            self.error("Expected '{}'".format(operator))
+        self.pos += 1
+
+    def parse(self):
+        # type: () -> Any
+        """Parse the expression with an explicit stack of pending frames
+        instead of recursion, nesting depth is limited only by memory.
+
+        The parser descends through prefix operators, opening parentheses
+        and function calls, pushing a frame for each of them, until it
+        reaches an atom. Then it ascends with the compiled atom: frames are
+        popped and compiled until one of them expects another operand."""
+
+        tokens = self.tokens
+        compiler = self.compiler
+        context = self.context
+        frames = []  # type: List[Tuple]
+
+        # Parse a chain of binary operators with precedence at least
+        # `min_level`, `None` to parse a single factor
+        min_level = _OR_LEVEL  # type: Optional[int]
+
+        while True:
+            kind, value, _ = tokens[self.pos]
+
+            if min_level is not None:
+                while kind == OPERATOR and value == "not" \
+                        and min_level <= _NOT_LEVEL:
+                    self.pos += 1
+                    frames.append((_CHAIN, min_level, None))
+                    frames.append(_NOT_FRAME)
+                    min_level = _NOT_LEVEL
+                    kind, value, _ = tokens[self.pos]
+                frames.append((_CHAIN, min_level, None))
+
+            while kind == OPERATOR and value in UNARY_OPERATORS:
+                self.pos += 1
+                frames.append((_UNARY, value))
+                kind, value, _ = tokens[self.pos]
+            frames.append(_FACTOR_FRAME)
+
+            # Atom
+            if kind == NUMBER:
+                self.pos += 1
+                try:
+                    number = int(value)  # type: Union[int, float]
+                except ValueError:
+                    number = float(value)
+                result = compiler.compile_literal(context, number)
+
+            elif kind == STRING:
+                self.pos += 1
+                string = compat.unicode_escape(compat.text_type(value[1:-1]))
+                result = compiler.compile_literal(context, string)
+
+            elif kind == NAME:
+                self.pos += 1
+                reference = intern_variable(value)
+
+                kind, value, _ = tokens[self.pos]
+                if kind == OPERATOR and value == "(":
+                    self.pos += 1
+                    kind, value, _ = tokens[self.pos]
+                    if kind != OPERATOR or value != ")":
+                        frames.append((_CALL, reference, []))
+                        min_level = _OR_LEVEL
+                        continue
+                    self.pos += 1
+                    result = compiler.compile_function(context, reference,
+                                                       [])
+                else:
+                    result = compiler.compile_variable(context, reference)
+
+            elif kind == OPERATOR and value == "(":
+                self.pos += 1
+                frames.append(_PARENTHESIS_FRAME)
+                min_level = _OR_LEVEL
+                continue
+
+            else:
+                self.error()
+
+            # Ascend with the compiled `result` until a frame expects another
+            # operand
+            min_level = None
+            while frames:
+                frame = frames.pop()
+                code = frame[0]
+
+                if code == _FACTOR:
+                    kind, value, _ = tokens[self.pos]
+                    if kind == OPERATOR and value == "^":
+                        self.pos += 1
+                        frames.append((_POWER, result))
+                        break
+
+                elif code == _CHAIN:
+                    kind, value, _ = tokens[self.pos]
+                    level = BINARY_OPERATORS.get(value) \
+                        if kind == OPERATOR else None
+                    stack = frame[2]
+
+                    if level is None or level < frame[1]:
+                        # Stack of pending chains of operators of the same
+                        # precedence is folded at the end of the chain
+                        while stack:
+                            _, operands, operators = stack.pop()
+                            operands.append(result)
+                            result = self.fold(operands, operators)
+                        continue
+
+                    self.pos += 1
+                    if stack is None:
+                        stack = []
+                        frame = (_CHAIN, frame[1], stack)
+
+                    while stack and stack[-1][0] > level:
+                        _, operands, operators = stack.pop()
+                        operands.append(result)
+                        result = self.fold(operands, operators)
+
+                    if stack and stack[-1][0] == level:
+                        stack[-1][1].append(result)
+                        stack[-1][2].append(value)
+                    else:
+                        stack.append((level, [result], [value]))
+
+                    frames.append(frame)
+                    kind, value, _ = tokens[self.pos]
+                    if kind == OPERATOR and value == "not" \
+                            and level < _NOT_LEVEL:
+                        self.pos += 1
+                        frames.append(_NOT_FRAME)
+                        min_level = _NOT_LEVEL
+                    break
+
+                elif code == _POWER:
+                    result = compiler.compile_binary(context, "^", frame[1],
+                                                     result)
+                elif code == _UNARY:
+                    result = compiler.compile_unary(context, frame[1],
+                                                    result)
+                elif code == _NOT:
+                    result = compiler.compile_unary(context, "not", result)
+
+                elif code == _PARENTHESIS:
+                    self.expect(")")
+
+                else:
+                    args = frame[2]
+                    args.append(result)
+                    kind, value, _ = tokens[self.pos]
+                    if kind == OPERATOR and value == ",":
+                        self.pos += 1
+                        frames.append(frame)
+                        min_level = _OR_LEVEL
+                        break
+                    self.expect(")")
+                    result = compiler.compile_function(context, frame[1],
+                                                       args)
+            else:
+                if tokens[self.pos][0] != END:
+                    self.error()
+                return result
+
+    def fold(self, operands, operators):
+        # type: (List[Any], List[str]) -> Any
+        compiler = self.compiler
+        context = self.context
+
+        left = operands[0]
+        for operator, right in zip(operators, operands[1:]):
+            left = compiler.compile_binary(context, operator, left, right)
+        return left
+
+
+def parse(text, compiler, context=None):
+    # type: (str, Any, Any) -> Any
+    """Parse expression `text` and compile it with `compiler` within
+    `context`. Returns the object returned by the last `compile_*` call of
+    the `compiler` – `finalize()` is not called."""
+    return _Parser(text, compiler, context).parse()
+
+
+def parse_counting_tokens(text, compiler, context=None):
+    # type: (str, Any, Any) -> Tuple[Any, int]
+    """Same as `parse()`, returns tuple (`result`, `tokens`) where `tokens`
+    is the number of tokens of the `text`."""
+    parser = _Parser(text, compiler, context)
+    result = parser.parse()
+    # END token is not counted
+    return (result, len(parser.tokens) - 1)
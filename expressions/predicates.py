@@ -0,0 +1,707 @@
+# -*- encoding: utf-8 -*-
+"""Analysis of filter predicates for index and partition pushdown.
+
+`PredicateAnalyzer` compiles a filter expression into a `Predicate` – a
+disjunction of `Conjunction`s. Comparisons of a variable with a literal
+(``==``, ``is``, ``<``, ``<=``, ``>``, ``>=``) are *sargable*: they are
+turned into per-variable `Constraint`s – sets of equal values and ranges with
+open or closed bounds. Equalities of one variable joined by ``or`` become one
+set of values, an in-list. All other parts of the expression are kept as
+*residual* nodes which have to be evaluated.
+
+The constraints are necessary conditions of the predicate: a row or a
+partition which satisfies no conjunction can be skipped without evaluating
+the expression. `Predicate.may_match()` tests partition statistics,
+`PredicateFilter` looks the constraints up in in-memory `SortedIndex`es and
+evaluates the expression only for the candidate rows which are not matched
+by the indexes alone.
+"""
+
+from __future__ import absolute_import
+
+from bisect import bisect_left, bisect_right
+from binascii import hexlify, unhexlify
+
+MYPY = False
+if MYPY:
+    from typing import List, Any, Dict, Optional, Iterable, Mapping, Set, \
+                       Tuple
+
+from .compat import integer_types
+from .compiler import Compiler
+from .errors import ExpressionError
+from .evaluator import PythonCodeCompiler
+from .nodes import Node, Variable, Function, BinaryOperator, UnaryOperator
+
+__all__ = [
+        "PredicateAnalyzer",
+        "Predicate",
+        "Conjunction",
+        "Constraint",
+        "SortedIndex",
+        "PredicateFilter",
+        "analyze_predicate",
+        "DEFAULT_MAX_TERMS",
+    ]
+
+
+# Maximal number of conjunctions of the normalized predicate, larger parts
+# of the predicate are kept as residual
+DEFAULT_MAX_TERMS = 64
+
+# Maximal number of bitmaps of equal values cached by a `SortedIndex`
+MAX_CACHED_BITMAPS = 256
+
+# Operator of a comparison with swapped operands
+_SWAPPED = {
+    "==": "==",
+    "is": "==",
+    "!=": "!=",
+    "<": ">",
+    "<=": ">=",
+    ">": "<",
+    ">=": "<=",
+}
+
+_COMPARISONS = frozenset(["==", "is", "!=", "<", "<=", ">", ">=", "in"])
+
+
+class Constraint(object):
+    __slots__ = ("values", "low", "high", "low_inclusive", "high_inclusive")
+
+    def __init__(self, values=None, low=None, high=None, low_inclusive=True,
+                 high_inclusive=True):
+        # type: (Optional[Iterable[Any]], Any, Any, bool, bool) -> None
+        """Constraint of a variable: the value is one of `values` and lies
+        between `low` and `high`. `None` is no constraint – there is no
+        ``None`` literal in the expressions. The bounds are closed if
+        `low_inclusive` or `high_inclusive` is true."""
+        self.values = None if values is None else frozenset(values)
+        self.low = low
+        self.high = high
+        self.low_inclusive = low_inclusive if low is not None else True
+        self.high_inclusive = high_inclusive if high is not None else True
+
+    @classmethod
+    def comparison(cls, operator, value):
+        # type: (str, Any) -> Optional[Constraint]
+        """Return constraint of a variable compared by `operator` with the
+        `value` on the right side, `None` if the comparison is not
+        sargable."""
+        if operator in ("==", "is"):
+            return cls(values=[value])
+        elif operator == "<":
+            return cls(high=value, high_inclusive=False)
+        elif operator == "<=":
+            return cls(high=value)
+        elif operator == ">":
+            return cls(low=value, low_inclusive=False)
+        elif operator == ">=":
+            return cls(low=value)
+        return None
+
+    def in_range(self, value):
+        # type: (Any) -> bool
+        """`True` if `value` lies between the bounds. Raises `TypeError` if
+        the value can not be compared with the bounds."""
+        if self.low is not None:
+            if value < self.low or (value == self.low
+                                    and not self.low_inclusive):
+                return False
+        if self.high is not None:
+            if value > self.high or (value == self.high
+                                     and not self.high_inclusive):
+                return False
+        return True
+
+    def matches(self, value):
+        # type: (Any) -> bool
+        """`True` if `value` satisfies the constraint."""
+        if value is None:
+            return False
+        if self.values is not None and value not in self.values:
+            return False
+        return self.in_range(value)
+
+    def intersect(self, other):
+        # type: (Constraint) -> Constraint
+        """Return constraint satisfied by values satisfying both constraints.
+        Raises `TypeError` if the bounds or values can not be compared."""
+        if self.values is None:
+            values = other.values
+        elif other.values is None:
+            values = self.values
+        else:
+            values = self.values & other.values
+
+        low, low_inclusive = _tighter(self.low, self.low_inclusive,
+                                      other.low, other.low_inclusive, 1)
+        high, high_inclusive = _tighter(self.high, self.high_inclusive,
+                                        other.high, other.high_inclusive, -1)
+        result = Constraint(values, low, high, low_inclusive, high_inclusive)
+
+        if values is not None and (low is not None or high is not None):
+            # Values within the bounds make the bounds redundant
+            return Constraint([value for value in values
+                               if result.in_range(value)])
+        return result
+
+    def is_empty(self):
+        # type: () -> bool
+        """`True` if no value satisfies the constraint."""
+        if self.values is not None:
+            return not self.values
+        if self.low is None or self.high is None:
+            return False
+        try:
+            return self.low > self.high or (self.low == self.high and not
+                                            (self.low_inclusive
+                                             and self.high_inclusive))
+        except TypeError:
+            return False
+
+    def overlaps(self, minimum, maximum):
+        # type: (Any, Any) -> bool
+        """`True` if some value between `minimum` and `maximum` (inclusive)
+        may satisfy the constraint. `True` if the values can not be
+        compared."""
+        try:
+            if self.values is not None:
+                return any(minimum <= value <= maximum
+                           for value in self.values)
+            return not (self.low is not None
+                        and (maximum < self.low
+                             or (maximum == self.low
+                                 and not self.low_inclusive))) \
+                and not (self.high is not None
+                         and (minimum > self.high
+                              or (minimum == self.high
+                                  and not self.high_inclusive)))
+        except TypeError:
+            return True
+
+    def _key(self):
+        # type: () -> Tuple
+        return (self.values, self.low, self.high, self.low_inclusive,
+                self.high_inclusive)
+
+    def __eq__(self, other):
+        # type: (Any) -> bool
+        if not isinstance(other, Constraint):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __ne__(self, other):
+        # type: (Any) -> bool
+        return not self == other
+
+    def __hash__(self):
+        # type: () -> int
+        return hash(self._key())
+
+    def __repr__(self):
+        # type: () -> str
+        parts = []
+        if self.values is not None:
+            parts.append("in {!r}".format(sorted(self.values, key=repr)))
+        if self.low is not None:
+            parts.append("{} {!r}".format(">=" if self.low_inclusive
+                                          else ">", self.low))
+        if self.high is not None:
+            parts.append("{} {!r}".format("<=" if self.high_inclusive
+                                          else "<", self.high))
+        return "Constraint({})".format(", ".join(parts))
+
+
+def _tighter(first, first_inclusive, second, second_inclusive, direction):
+    # type: (Any, bool, Any, bool, int) -> Tuple[Any, bool]
+    """Return the tighter of two bounds, the greater of lower bounds for
+    `direction` 1 and the lesser of upper bounds for -1."""
+    if first is None:
+        return second, second_inclusive
+    if second is None or first == second and not first_inclusive:
+        return first, first_inclusive
+    if first == second:
+        return second, second_inclusive
+    if (first > second) == (direction > 0):
+        return first, first_inclusive
+    return second, second_inclusive
+
+
+class Conjunction(object):
+    __slots__ = ("constraints", "residual")
+
+    def __init__(self, constraints, residual):
+        # type: (Dict[str, Constraint], List[Any]) -> None
+        """Conjunction of `constraints` – a dictionary of variable names and
+        their `Constraint`s – and of the `residual` nodes which are not
+        sargable."""
+        self.constraints = constraints
+        self.residual = residual
+
+    @property
+    def sargable(self):
+        # type: () -> bool
+        """`True` if the conjunction is fully described by the
+        constraints."""
+        return not self.residual
+
+    def may_match(self, statistics):
+        # type: (Mapping[str, Tuple[Any, Any]]) -> bool
+        """`True` if a partition with `statistics` – a mapping of variable
+        names to their (`minimum`, `maximum`) – may contain matching rows."""
+        for name, constraint in self.constraints.items():
+            try:
+                minimum, maximum = statistics[name]
+            except KeyError:
+                continue
+            if not constraint.overlaps(minimum, maximum):
+                return False
+        return True
+
+    def __eq__(self, other):
+        # type: (Any) -> bool
+        if not isinstance(other, Conjunction):
+            return NotImplemented
+        return self.constraints == other.constraints \
+            and self.residual == other.residual
+
+    def __ne__(self, other):
+        # type: (Any) -> bool
+        return not self == other
+
+    def __repr__(self):
+        # type: () -> str
+        return "Conjunction({!r}, residual=[{}])".format(
+            self.constraints, ", ".join(str(node) for node in self.residual))
+
+
+class Predicate(object):
+    def __init__(self, node, conjunctions):
+        # type: (Any, List[Conjunction]) -> None
+        """Predicate `node` normalized into a disjunction of
+        `conjunctions`. No conjunctions means the predicate is never
+        true."""
+        self.node = node
+        self.conjunctions = conjunctions
+
+    @property
+    def sargable(self):
+        # type: () -> bool
+        """`True` if the predicate is fully described by the constraints of
+        its conjunctions."""
+        return all(conjunction.sargable for conjunction in self.conjunctions)
+
+    @property
+    def variables(self):
+        # type: () -> Set[str]
+        """Names of the constrained variables."""
+        return set(name for conjunction in self.conjunctions
+                   for name in conjunction.constraints)
+
+    def may_match(self, statistics):
+        # type: (Mapping[str, Tuple[Any, Any]]) -> bool
+        """`True` if a partition with `statistics` – a mapping of variable
+        names to their (`minimum`, `maximum`) – may contain rows matching
+        the predicate. Partitions for which it is `False` can be skipped."""
+        return any(conjunction.may_match(statistics)
+                   for conjunction in self.conjunctions)
+
+    def __repr__(self):
+        # type: () -> str
+        return "Predicate({!r})".format(self.conjunctions)
+
+
+class _Comparison(object):
+    """Sargable comparison of a variable in a conjunction."""
+    __slots__ = ("name", "constraint", "node")
+
+    def __init__(self, name, constraint, node):
+        # type: (str, Constraint, Any) -> None
+        self.name = name
+        self.constraint = constraint
+        self.node = node
+
+
+class _Analysis(object):
+    """Boolean subexpression with its normalized form and the normalized
+    form of its negation. The forms are lists of conjunctions – tuples of
+    `_Comparison`s and residual nodes."""
+    __slots__ = ("node", "positive", "negative")
+
+    def __init__(self, node, positive, negative):
+        # type: (Any, List[Tuple], List[Tuple]) -> None
+        self.node = node
+        self.positive = positive
+        self.negative = negative
+
+
+def _node(obj):
+    # type: (Any) -> Any
+    return obj.node if isinstance(obj, _Analysis) else obj
+
+
+def _boolean(obj):
+    # type: (Any) -> _Analysis
+    """Return analysis of `obj` used as a condition."""
+    if isinstance(obj, _Analysis):
+        return obj
+    return _Analysis(obj, [(obj, )], [(UnaryOperator("not", obj), )])
+
+
+class PredicateAnalyzer(Compiler):
+    def __init__(self, max_terms=DEFAULT_MAX_TERMS, **kwargs):
+        # type: (int, Any) -> None
+        """Creates an analyzer which compiles filter expressions into
+        `Predicate`s. Parts of the expression which would expand into more
+        than `max_terms` conjunctions are kept as residual."""
+        super(PredicateAnalyzer, self).__init__(**kwargs)
+        self.max_terms = max_terms
+
+    def compile_variable(self, context, variable):
+        # type: (Any, Variable) -> Variable
+        return variable
+
+    def compile_function(self, context, function, args):
+        # type: (Any, Variable, List[Any]) -> Function
+        return Function(function, [_node(arg) for arg in args])
+
+    def compile_unary(self, context, operator, operand):
+        # type: (Any, str, Any) -> Any
+        if operator in ("-", "+") and _is_number(operand):
+            # Negative literals are parsed as unary minus of the number
+            return -operand if operator == "-" else operand
+        elif operator != "not":
+            return UnaryOperator(operator, _node(operand))
+
+        operand = _boolean(operand)
+        return _Analysis(UnaryOperator(operator, operand.node),
+                         operand.negative, operand.positive)
+
+    def compile_binary(self, context, operator, left, right):
+        # type: (Any, str, Any, Any) -> Any
+        if operator in ("and", "or"):
+            left = _boolean(left)
+            right = _boolean(right)
+            node = BinaryOperator(operator, left.node, right.node)
+            if operator == "and":
+                positive = self._product(left.positive, right.positive)
+                negative = self._union(left.negative, right.negative)
+            else:
+                positive = self._union(left.positive, right.positive)
+                negative = self._product(left.negative, right.negative)
+            return _Analysis(node,
+                             positive or [(node, )],
+                             negative or [(UnaryOperator("not", node), )])
+
+        node = BinaryOperator(operator, _node(left), _node(right))
+        if operator not in _COMPARISONS:
+            return node
+
+        if isinstance(left, Variable) and _is_literal(right):
+            name, value = left.name, right
+        elif isinstance(right, Variable) and _is_literal(left):
+            name, value = right.name, left
+            operator = _SWAPPED.get(operator, operator)
+        else:
+            return _boolean(node)
+
+        negated = UnaryOperator("not", node)
+        if operator == "!=":
+            # `x != v` is not sargable, but its negation is
+            return _Analysis(node, [(node, )],
+                             [(_Comparison(name, Constraint(values=[value]),
+                                           negated), )])
+
+        constraint = Constraint.comparison(operator, value)
+        if constraint is None:
+            return _boolean(node)
+
+        # Negation of an ordering is not a range: NaN and incomparable
+        # values satisfy neither the comparison nor the complementary range
+        return _Analysis(node, [(_Comparison(name, constraint, node), )],
+                         [(negated, )])
+
+    def _product(self, left, right):
+        # type: (List[Tuple], List[Tuple]) -> Optional[List[Tuple]]
+        if len(left) * len(right) > self.max_terms:
+            return None
+        return [first + second for first in left for second in right]
+
+    def _union(self, left, right):
+        # type: (List[Tuple], List[Tuple]) -> Optional[List[Tuple]]
+        if len(left) + len(right) > self.max_terms:
+            return None
+        return left + right
+
+    def finalize(self, context, obj):
+        # type: (Any, Any) -> Predicate
+        analysis = _boolean(obj)
+        conjunctions = []  # type: List[Conjunction]
+        for terms in analysis.positive:
+            conjunction = _conjunction(terms)
+            if conjunction is not None and conjunction not in conjunctions:
+                conjunctions.append(conjunction)
+        return Predicate(analysis.node, _merge_values(conjunctions))
+
+
+def _is_literal(obj):
+    # type: (Any) -> bool
+    return not isinstance(obj, (Node, _Analysis))
+
+
+def _is_number(obj):
+    # type: (Any) -> bool
+    return isinstance(obj, (float, ) + integer_types) \
+        and not isinstance(obj, bool)
+
+
+def _conjunction(terms):
+    # type: (Tuple) -> Optional[Conjunction]
+    """Return conjunction of `terms`, `None` if it is never true."""
+    constraints = {}  # type: Dict[str, Constraint]
+    residual = []  # type: List[Any]
+
+    for term in terms:
+        if not isinstance(term, _Comparison):
+            if term not in residual:
+                residual.append(term)
+            continue
+
+        existing = constraints.get(term.name)
+        if existing is None:
+            constraints[term.name] = term.constraint
+            continue
+        try:
+            constraints[term.name] = existing.intersect(term.constraint)
+        except TypeError:
+            # Bounds of different types, keep the comparison as residual
+            residual.append(term.node)
+
+    if any(constraint.is_empty() for constraint in constraints.values()):
+        return None
+    return Conjunction(constraints, residual)
+
+
+def _merge_values(conjunctions):
+    # type: (List[Conjunction]) -> List[Conjunction]
+    """Merge sargable conjunctions which differ only in equality values of
+    one variable into one conjunction with the union of the values."""
+    merged = []  # type: List[Conjunction]
+    for conjunction in conjunctions:
+        for i, other in enumerate(merged):
+            name = _values_difference(other, conjunction)
+            if name is not None:
+                constraints = dict(other.constraints)
+                constraints[name] = Constraint(
+                    other.constraints[name].values
+                    | conjunction.constraints[name].values)
+                merged[i] = Conjunction(constraints, [])
+                break
+        else:
+            merged.append(conjunction)
+    return merged
+
+
+def _values_difference(first, second):
+    # type: (Conjunction, Conjunction) -> Optional[str]
+    """Return name of the only variable whose constraints of the sargable
+    conjunctions `first` and `second` differ and are both sets of values,
+    otherwise `None`."""
+    if first.residual or second.residual \
+            or set(first.constraints) != set(second.constraints):
+        return None
+
+    different = [name for name, constraint in first.constraints.items()
+                 if constraint != second.constraints[name]]
+    if len(different) != 1:
+        return None
+
+    name = different[0]
+    for constraint in (first.constraints[name], second.constraints[name]):
+        if constraint.values is None or constraint.low is not None \
+                or constraint.high is not None:
+            return None
+    return name
+
+
+def analyze_predicate(text, max_terms=DEFAULT_MAX_TERMS):
+    # type: (str, int) -> Predicate
+    """Return `Predicate` of the filter expression `text`."""
+    return PredicateAnalyzer(max_terms).compile(text)
+
+
+# Positions of the set bits of every byte
+_BITS = [tuple(bit for bit in range(8) if byte >> bit & 1)
+         for byte in range(256)]
+
+
+def _bitmap(positions, size):
+    # type: (Iterable[int], int) -> int
+    """Return bitmap – an integer – with bits at `positions` set."""
+    data = bytearray(size // 8 + 1)
+    for position in positions:
+        data[position >> 3] |= 1 << (position & 7)
+    data.reverse()
+    return int(hexlify(bytes(data)), 16)
+
+
+def _positions(bitmap):
+    # type: (int) -> List[int]
+    """Return ascending positions of the set bits of `bitmap`."""
+    if not bitmap:
+        return []
+    digits = "{:x}".format(bitmap)
+    if len(digits) % 2:
+        digits = "0" + digits
+    data = bytearray(unhexlify(digits))
+    data.reverse()
+
+    result = []  # type: List[int]
+    for index, byte in enumerate(data):
+        if byte:
+            base = index * 8
+            result.extend(base + bit for bit in _BITS[byte])
+    return result
+
+
+class SortedIndex(object):
+    def __init__(self, values):
+        # type: (Iterable[Any]) -> None
+        """Creates an index of a column of `values`, one value per row.
+        ``None`` and NaN values are not indexed – they satisfy no
+        constraint. Raises `ExpressionError` if the values can not be
+        ordered."""
+        values = list(values)
+        pairs = [(value, position) for position, value in enumerate(values)
+                 if value is not None and value == value]
+        self.size = len(values)
+        try:
+            pairs.sort()
+        except TypeError:
+            raise ExpressionError("Indexed values can not be ordered")
+        self.keys = [value for value, _ in pairs]
+        self.positions = [position for _, position in pairs]
+        # Bitmaps of looked up equal values
+        self._bitmaps = {}  # type: Dict[Any, int]
+
+    def lookup(self, constraint):
+        # type: (Constraint) -> int
+        """Return bitmap of the rows satisfying the `constraint`. Raises
+        `TypeError` if the constraint can not be compared with the
+        values."""
+        keys = self.keys
+        if constraint.values is not None:
+            bitmap = 0
+            for value in constraint.values:
+                bitmap |= self._equal(value)
+            if constraint.low is not None or constraint.high is not None:
+                bitmap &= self.lookup(Constraint(None, constraint.low,
+                                                 constraint.high,
+                                                 constraint.low_inclusive,
+                                                 constraint.high_inclusive))
+            return bitmap
+
+        start, end = 0, len(keys)
+        if constraint.low is not None:
+            if constraint.low_inclusive:
+                start = bisect_left(keys, constraint.low)
+            else:
+                start = bisect_right(keys, constraint.low)
+        if constraint.high is not None:
+            if constraint.high_inclusive:
+                end = bisect_right(keys, constraint.high)
+            else:
+                end = bisect_left(keys, constraint.high)
+        return self._bitmap([(start, end)])
+
+    def _equal(self, value):
+        # type: (Any) -> int
+        try:
+            return self._bitmaps[value]
+        except KeyError:
+            pass
+
+        keys = self.keys
+        bitmap = self._bitmap([(bisect_left(keys, value),
+                                bisect_right(keys, value))])
+        if len(self._bitmaps) >= MAX_CACHED_BITMAPS:
+            self._bitmaps.clear()
+        self._bitmaps[value] = bitmap
+        return bitmap
+
+    def _bitmap(self, spans):
+        # type: (List[Tuple[int, int]]) -> int
+        positions = self.positions
+        return _bitmap((positions[i] for start, end in spans
+                        for i in range(start, end)), self.size)
+
+    def __len__(self):
+        # type: () -> int
+        return len(self.keys)
+
+
+class PredicateFilter(object):
+    def __init__(self, rows, indexed, functions=None,
+                 max_terms=DEFAULT_MAX_TERMS):
+        # type: (Iterable[Mapping[str, Any]], Iterable[str], Optional[Dict[str, Any]], int) -> None
+        """Creates a filter of `rows` – mappings of variable names to values
+        – with `SortedIndex`es of the `indexed` variables. `functions` are
+        the functions of the filter expressions, see `PythonCodeCompiler`.
+
+        Rows are selected by the constraints of the predicate first. The
+        expression is evaluated only for the selected rows which are not
+        matched by the indexes alone: rows of conjunctions with residual
+        nodes or with constraints of variables which are not indexed.
+        `evaluations` counts the evaluated rows."""
+        self.rows = list(rows)
+        self.indexes = dict((name, SortedIndex([row[name]
+                                                for row in self.rows]))
+                            for name in indexed)
+        self.analyzer = PredicateAnalyzer(max_terms)
+        self.compiler = PythonCodeCompiler(functions)
+        self.evaluations = 0
+
+    def positions(self, text):
+        # type: (str) -> List[int]
+        """Return ascending positions of rows matching the filter expression
+        `text`."""
+        predicate = self.analyzer.compile(text)
+        everything = (1 << len(self.rows)) - 1
+        exact = 0
+        candidates = 0
+
+        for conjunction in predicate.conjunctions:
+            bitmap = everything
+            known = conjunction.sargable
+            for name, constraint in conjunction.constraints.items():
+                index = self.indexes.get(name)
+                if index is None:
+                    known = False
+                    continue
+                try:
+                    bitmap &= index.lookup(constraint)
+                except TypeError:
+                    # Let the evaluation decide, or raise
+                    known = False
+            if known:
+                exact |= bitmap
+            else:
+                candidates |= bitmap
+
+        matched = _positions(exact)
+        candidates &= ~exact
+        if candidates:
+            function = self.compiler.compile(text)
+            rows = self.rows
+            evaluated = _positions(candidates)
+            self.evaluations += len(evaluated)
+            matched = sorted(matched + [position for position in evaluated
+                                        if function(rows[position])])
+        return matched
+
+    def filter(self, text):
+        # type: (str) -> List[Mapping[str, Any]]
+        """Return rows matching the filter expression `text`."""
+        rows = self.rows
+        return [rows[position] for position in self.positions(text)]
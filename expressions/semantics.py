@@ -0,0 +1,195 @@
+# -*- encoding: utf-8 -*-
+"""Semantics for the Grako-generated parser. Grako is imported only when the
+parser is used."""
+
+from __future__ import absolute_import
+
+import threading
+
+MYPY = False
+if MYPY:
+    from typing import Any, List, Union
+
+from .nodes import intern_variable
+from . import compat
+from .errors import ExpressionSyntaxError
+
+__all__ = [
+        "parse",
+    ]
+
+
+class _Result(object):
+    """Wrapper class for compilation result. We need this to properly
+    distinguish between our result and delegated results."""
+
+    __slots__ = ("value", )
+
+    def __init__(self, value):
+        # type: (Any) -> None
+        self.value = value
+    def __str__(self):
+        # type: () -> str
+        return str(self.value)
+    def __repr__(self):
+        # type: () -> str
+        return "_Result({})".format(repr(self.value))
+
+
+class _ExpressionSemantics(object):
+    keywords = frozenset(['in', 'not', 'is', 'and', 'or'])
+    def __init__(self, compiler, context):
+        # type: (Any, Any) -> None
+        self.compiler = compiler
+        self.context = context
+
+    def _default(self, ast, node_type=None, *args):
+        # type: (Any, str, Any) -> Any
+        # Rules without an operator pass the operand's result through
+        # unchanged, only nodes that are compiled get a new `_Result`.
+        if node_type is None or ast.__class__ is _Result:
+            return ast
+
+        try:
+            handler = _HANDLERS[node_type]
+        except KeyError:
+            raise Exception("Unknown node type '{}'".format(node_type))
+
+        return handler(self, ast)
+
+    def _unary(self, ast):
+        # type: (Any) -> _Result
+        operator, operand = ast
+        return _Result(self.compiler.compile_unary(self.context, operator,
+                                                   operand.value))
+
+    def _binary(self, ast):
+        # type: (Any) -> _Result
+        left, rest = ast
+        if not rest:
+            return left
+
+        compile_binary = self.compiler.compile_binary
+        context = self.context
+        result = left.value
+
+        for op, right in rest:
+            result = compile_binary(context, op, result, right.value)
+
+        return _Result(result)
+
+    def _binarynr(self, ast):
+        # type: (Any) -> _Result
+        left, operator, right = ast
+        return _Result(self.compiler.compile_binary(self.context, operator,
+                                                    left.value, right.value))
+
+    def variable(self, ast):
+        # type: (_Result) -> _Result
+        # Note: ast is a _Result() from the `reference` rule
+        return _Result(self.compiler.compile_variable(self.context,
+                                                      ast.value))
+
+    def reference(self, ast):
+        # type: (Any) -> _Result
+        return _Result(intern_variable(ast))
+
+    def function(self, ast):
+        # type: (Any) -> _Result
+        ref = ast.ref.value
+        args = [arg.value for arg in ast.args or []]
+        result = self.compiler.compile_function(self.context, ref, args)
+
+        return _Result(result)
+
+    def NUMBER(self, ast):
+        # type: (Any) -> _Result
+
+        try:
+            value = int(ast)  # type: Union[int, float]
+        except ValueError:
+            value = float(ast)
+
+        result = self.compiler.compile_literal(self.context, value)
+
+        return _Result(result)
+
+    def STRING(self, ast):
+        # type: (Any) -> _Result
+        # Strip the surrounding quotes
+        value = compat.unicode_escape(compat.text_type(ast[1:-1]))
+
+        result = self.compiler.compile_literal(self.context, value)
+        return _Result(result)
+
+    def NAME(self, ast):
+        # type: (Any) -> _Result
+        if ast.lower() in self.keywords:
+            from grako.exceptions import FailedSemantics
+            raise FailedSemantics("'{}' is a keyword.".format(ast))
+        return ast
+
+
+# Handlers of the rule types given to `_default()` by the generated parser
+_HANDLERS = {
+    "unary": _ExpressionSemantics._unary,
+    "binary": _ExpressionSemantics._binary,
+    "binarynr": _ExpressionSemantics._binarynr,
+}
+
+
+# Grako parsers keep the parsing state, idle parsers are reused per thread.
+# A parser is taken out of the pool while parsing, so that a compiler may
+# parse another expression from its callbacks.
+_local = threading.local()
+
+
+def _idle_parsers():
+    # type: () -> List[Any]
+    parsers = getattr(_local, "parsers", None)
+    if parsers is None:
+        parsers = _local.parsers = []
+    return parsers
+
+
+def _parser():
+    # type: () -> Any
+    """Return an idle parser of the current thread or a new one. Give it back
+    with `_release()` when the parsing is finished."""
+    try:
+        return _idle_parsers().pop()
+    except IndexError:
+        from .grammar import ExpressionParser
+        return ExpressionParser()
+
+
+def _release(parser):
+    # type: (Any) -> None
+    _idle_parsers().append(parser)
+
+
+def parse(text, compiler, context=None):
+    # type: (str, Any, Any) -> Any
+    """Parse expression `text` with the Grako-generated parser and compile
+    it with `compiler` within `context`. Same as `expressions.parser.parse()`
+    but slower."""
+    from grako.exceptions import ParseError
+
+    parser = _parser()
+    try:
+        result = parser.parse(text,
+                 rule_name="arithmetic_expression",
+                 comments_re="#.*",
+                 ignorecase=False,
+                 semantics=_ExpressionSemantics(compiler, context))
+    except ParseError as error:
+        # `FailedParse` with the position or `FailedSemantics`
+        message = getattr(error, "message", None) or str(error)
+        raise ExpressionSyntaxError(str(message).strip(), text,
+                                    getattr(error, "pos", None))
+    finally:
+        _release(parser)
+
+    # Result is of type _Result
+
+    return result.value
@@ -0,0 +1,403 @@
+# -*- encoding: utf-8 -*-
+"""Binary serialization of parsed expressions and a persistent cache.
+
+`dumps()` and `loads()` convert a `ParsedExpression` to and from a compact
+versioned binary form. `PersistentCache` keeps the serialized expressions in
+a file that is memory-mapped when opened, a new process loads the parsed
+expressions from the file and replays them into compilers without parsing
+the texts.
+
+Serialized expression layout, all integers are little-endian unsigned 32
+bits:
+
+* counts of strings, instructions and function arguments
+* lengths of the UTF-8 encoded strings followed by the strings, the first
+  string is the expression text
+* instructions as records (`code`, `tag`, `a`, `b`, `c`) where `code` and
+  `tag` are bytes; literals are stored as strings with a type `tag`
+* argument indexes of the function calls
+
+Cache file layout: a header (magic, format version, grammar version, number
+of entries), an index of entries sorted by key – (SHA-1 of the text,
+offset, length) – and the serialized expressions.
+"""
+
+from __future__ import absolute_import
+
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+
+MYPY = False
+if MYPY:
+    from typing import List, Any, Dict, Optional, Tuple
+
+from .compat import string_type, text_type, intern
+from .errors import ExpressionError
+from .nodes import intern_variable
+from .parsed import ParsedExpression, ExpressionCache, LITERAL, VARIABLE, \
+                    FUNCTION, UNARY, BINARY
+from .backends import GRAMMAR_VERSION
+
+__all__ = [
+        "dumps",
+        "loads",
+        "PersistentCache",
+        "FORMAT_VERSION",
+    ]
+
+
+# Version of the binary format
+FORMAT_VERSION = 1
+
+_MAGIC = b"EXPR"
+_CACHE_MAGIC = b"EXPC"
+
+_HEADER = struct.Struct("<4sHHI")
+_COUNTS = struct.Struct("<III")
+_RECORD = struct.Struct("<BBIII")
+_INDEX_ENTRY = struct.Struct("<20sII")
+
+# Literal tags
+_INT = 0
+_FLOAT = 1
+_STRING = 2
+
+
+def _encode(parsed):
+    # type: (ParsedExpression) -> bytes
+    strings = [parsed.text]  # type: List[str]
+    string_indexes = {}  # type: Dict[Any, int]
+
+    def string(value):
+        # type: (str) -> int
+        index = string_indexes.get(value)
+        if index is None:
+            index = string_indexes[value] = len(strings)
+            strings.append(value)
+        return index
+
+    records = []  # type: List[bytes]
+    args = []  # type: List[int]
+
+    for instruction in parsed.instructions:
+        code = instruction[0]
+        if code == LITERAL:
+            value = instruction[1]
+            if isinstance(value, bool):
+                raise ExpressionError("Can not serialize literal {!r}"
+                                      .format(value))
+            elif isinstance(value, string_type):
+                tag, value = _STRING, text_type(value)
+            elif isinstance(value, float):
+                tag, value = _FLOAT, repr(value)
+            elif isinstance(value, int):
+                tag, value = _INT, str(value)
+            else:
+                raise ExpressionError("Can not serialize literal {!r}"
+                                      .format(value))
+            # Strings and numbers can have the same text
+            record = (code, tag, len(strings), 0, 0)
+            strings.append(value)
+        elif code == VARIABLE:
+            record = (code, 0, string(instruction[1].name), 0, 0)
+        elif code == FUNCTION:
+            record = (code, 0, string(instruction[1].name), len(args),
+                      len(instruction[2]))
+            args += instruction[2]
+        elif code == UNARY:
+            record = (code, 0, string(instruction[1]), instruction[2], 0)
+        else:
+            record = (code, 0, string(instruction[1]), instruction[2],
+                      instruction[3])
+        records.append(_RECORD.pack(*record))
+
+    encoded = [string.encode("utf-8") for string in strings]
+
+    parts = [_COUNTS.pack(len(strings), len(records), len(args)),
+             struct.pack("<{}I".format(len(encoded)),
+                         *[len(string) for string in encoded])]
+    parts += encoded
+    parts += records
+    parts.append(struct.pack("<{}I".format(len(args)), *args))
+
+    return b"".join(parts)
+
+
+def _decode(data, offset=0):
+    # type: (Any, int) -> ParsedExpression
+    string_count, record_count, arg_count = _COUNTS.unpack_from(data, offset)
+    offset += _COUNTS.size
+
+    lengths = struct.unpack_from("<{}I".format(string_count), data, offset)
+    offset += 4 * string_count
+
+    strings = []  # type: List[str]
+    append = strings.append
+    for length in lengths:
+        end = offset + length
+        append(data[offset:end].decode("utf-8"))
+        offset = end
+
+    end = offset + _RECORD.size * record_count
+    records = _RECORD.iter_unpack(data[offset:end])
+    args = struct.unpack_from("<{}I".format(arg_count), data, end)
+
+    instructions = []  # type: List[Tuple]
+    append = instructions.append
+
+    for code, tag, a, b, c in records:
+        if code == BINARY:
+            append((BINARY, intern(strings[a]), b, c))
+        elif code == VARIABLE:
+            append((VARIABLE, intern_variable(strings[a].split("."))))
+        elif code == LITERAL:
+            value = strings[a]  # type: Any
+            if tag == _INT:
+                value = int(value)
+            elif tag == _FLOAT:
+                value = float(value)
+            append((LITERAL, value))
+        elif code == UNARY:
+            append((UNARY, intern(strings[a]), b))
+        elif code == FUNCTION:
+            append((FUNCTION, intern_variable(strings[a].split(".")),
+                    args[b:b + c]))
+        else:
+            raise ExpressionError("Invalid serialized expression")
+
+    return ParsedExpression(strings[0], instructions)
+
+
+def dumps(parsed):
+    # type: (ParsedExpression) -> bytes
+    """Return `parsed` expression serialized into bytes."""
+    header = _HEADER.pack(_MAGIC, FORMAT_VERSION, GRAMMAR_VERSION, 0)
+    return header + _encode(parsed)
+
+
+def loads(data):
+    # type: (bytes) -> ParsedExpression
+    """Return parsed expression from `data` serialized by `dumps()`. Raises
+    `ExpressionError` if the data were serialized by an incompatible
+    version."""
+    try:
+        magic, version, grammar, _ = _HEADER.unpack_from(data)
+    except struct.error:
+        raise ExpressionError("Invalid serialized expression")
+
+    if magic != _MAGIC:
+        raise ExpressionError("Invalid serialized expression")
+    elif version != FORMAT_VERSION or grammar != GRAMMAR_VERSION:
+        raise ExpressionError("Serialized expression version {}.{} is not "
+                              "supported".format(version, grammar))
+
+    try:
+        return _decode(data, _HEADER.size)
+    except (struct.error, IndexError, UnicodeDecodeError, ValueError):
+        raise ExpressionError("Invalid serialized expression")
+
+
+# Atomic rename over an existing file
+_replace = getattr(os, "replace", os.rename)
+
+
+def _entry(data, index):
+    # type: (Any, int) -> Tuple[bytes, int, int]
+    return _INDEX_ENTRY.unpack_from(data, _HEADER.size
+                                    + index * _INDEX_ENTRY.size)
+
+
+def _find(data, count, key):
+    # type: (Any, int, bytes) -> Optional[Tuple[int, int]]
+    """Return (`offset`, `length`) of `key` in the cache file `data` with
+    `count` entries."""
+    low, high = 0, count
+    while low < high:
+        middle = (low + high) // 2
+        entry = _entry(data, middle)
+        if entry[0] < key:
+            low = middle + 1
+        else:
+            high = middle
+
+    if low < count:
+        entry = _entry(data, low)
+        if entry[0] == key:
+            return (entry[1], entry[2])
+    return None
+
+
+def _key(text):
+    # type: (str) -> bytes
+    return hashlib.sha1(text_type(text).encode("utf-8")).digest()
+
+
+class PersistentCache(ExpressionCache):
+    def __init__(self, path, maxsize=1024):
+        # type: (str, int) -> None
+        """Expression cache backed by the file `path`. Expressions not found
+        in the in-memory LRU cache are looked up in the memory-mapped file
+        before they are parsed. Newly parsed expressions are written to the
+        file by `save()`.
+
+        A file written by a different format or grammar version is ignored
+        and replaced on save."""
+        super(PersistentCache, self).__init__(maxsize)
+        self.path = path
+        self.loaded = 0
+        self._pending = {}  # type: Dict[bytes, bytes]
+        # Tuple (`map`, `count`) replaced as a whole, readers in other threads
+        # keep using the snapshot they got
+        self._mapped = self._open()  # type: Optional[Tuple[Any, int]]
+
+    def _open(self):
+        # type: () -> Optional[Tuple[Any, int]]
+        try:
+            handle = open(self.path, "rb")
+        except (IOError, OSError):
+            return None
+
+        # The map keeps its own file descriptor
+        with handle:
+            try:
+                mapped = mmap.mmap(handle.fileno(), 0,
+                                   access=mmap.ACCESS_READ)
+            except (ValueError, mmap.error):
+                # Empty file
+                return None
+
+        try:
+            magic, version, grammar, count = _HEADER.unpack_from(mapped)
+        except struct.error:
+            magic = None
+
+        if magic != _CACHE_MAGIC or version != FORMAT_VERSION \
+                or grammar != GRAMMAR_VERSION:
+            mapped.close()
+            return None
+
+        return (mapped, count)
+
+    def close(self):
+        # type: () -> None
+        """Unmap the cache file. Unsaved expressions are kept. Should not be
+        called while other threads use the cache."""
+        with self._lock:
+            mapped, self._mapped = self._mapped, None
+        if mapped is not None:
+            mapped[0].close()
+
+    def __enter__(self):
+        # type: () -> PersistentCache
+        return self
+
+    def __exit__(self, *args):
+        # type: (Any) -> None
+        self.close()
+
+    def _load(self, text):
+        # type: (str) -> Optional[ParsedExpression]
+        mapped = self._mapped
+        if mapped is None:
+            return None
+
+        data, count = mapped
+        try:
+            found = _find(data, count, _key(text))
+            if found is None:
+                return None
+            parsed = _decode(data, found[0])
+        except (struct.error, IndexError, UnicodeDecodeError, ValueError,
+                ExpressionError):
+            # Damaged or closed file, parse the text again
+            return None
+
+        if parsed.text != text:
+            # Hash collision
+            return None
+        return parsed
+
+    def lookup(self, text, parser=None):
+        # type: (str, Optional[str]) -> Tuple[ParsedExpression, bool]
+        """Return tuple (`parsed`, `hit`) of expression `text` from the
+        memory cache, from the file or parsed. `hit` is true if the text was
+        not parsed. The file keeps expressions parsed by the native parser
+        only."""
+        key = (parser or "native", text)
+        items = self._items
+
+        with self._lock:
+            parsed = items.pop(key, None)
+            if parsed is not None:
+                items[key] = parsed
+                self.hits += 1
+                return (parsed, True)
+
+        if key[0] != "native":
+            return super(PersistentCache, self).lookup(text, parser)
+
+        parsed = self._load(text)
+        if parsed is not None:
+            with self._lock:
+                self.loaded += 1
+                self._remember(key, parsed)
+            return (parsed, True)
+
+        parsed, hit = super(PersistentCache, self).lookup(text, parser)
+
+        with self._lock:
+            self._pending[_key(text)] = _encode(parsed)
+
+        return (parsed, hit)
+
+    def save(self):
+        # type: () -> None
+        """Write the expressions from the file together with the newly
+        parsed expressions into the file. The file is replaced atomically,
+        processes and threads that have it mapped keep reading the old
+        version."""
+        with self._lock:
+            entries = dict(self._pending)
+            mapped = self._mapped
+
+        if not entries and mapped is not None:
+            return
+
+        if mapped is not None:
+            data, count = mapped
+            for index in range(count):
+                key, offset, length = _entry(data, index)
+                if key not in entries:
+                    entries[key] = data[offset:offset + length]
+
+        keys = sorted(entries)
+        offset = _HEADER.size + len(keys) * _INDEX_ENTRY.size
+        index = []  # type: List[bytes]
+        for key in keys:
+            index.append(_INDEX_ENTRY.pack(key, offset, len(entries[key])))
+            offset += len(entries[key])
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        handle, temporary = tempfile.mkstemp(dir=directory,
+                                             prefix=".expressions-")
+        try:
+            with os.fdopen(handle, "wb") as output:
+                output.write(_HEADER.pack(_CACHE_MAGIC, FORMAT_VERSION,
+                                          GRAMMAR_VERSION, len(keys)))
+                output.write(b"".join(index))
+                for key in keys:
+                    output.write(entries[key])
+            _replace(temporary, self.path)
+        except Exception:
+            os.remove(temporary)
+            raise
+
+        # The previous map is released when no thread reads it
+        mapped = self._open()
+        with self._lock:
+            self._mapped = mapped
+            for key in entries:
+                self._pending.pop(key, None)
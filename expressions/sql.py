@@ -0,0 +1,348 @@
+# -*- encoding: utf-8 -*-
+"""Compilation of expressions into SQL text with bind parameters.
+
+`SQLCompiler` translates an expression into an SQL expression of a dialect –
+SQLite or PostgreSQL – and returns an `SQLExpression` with the SQL text and
+the bind parameters. Literals are never written into the SQL text, they are
+passed as parameters: expressions which differ only in their literals, such
+as ``price * 1.2`` and ``price * 1.5``, have the same SQL text. The SQL text
+is cached by the structure of the expression, the database can reuse its
+prepared statement.
+"""
+
+from __future__ import absolute_import
+
+import threading
+from collections import OrderedDict
+
+MYPY = False
+if MYPY:
+    from typing import List, Any, Dict, Optional, Tuple, Union
+
+from .compiler import Compiler
+from .errors import ExpressionError
+from .parsed import LITERAL, CacheInfo
+
+__all__ = [
+        "SQLCompiler",
+        "SQLExpression",
+        "SQLDialect",
+        "sql_dialects",
+    ]
+
+
+# Operators with the same meaning in all the dialects
+_BINARY_OPERATORS = {
+    "+": "({0} + {1})",
+    "-": "({0} - {1})",
+    "*": "({0} * {1})",
+    "<": "({0} < {1})",
+    "<=": "({0} <= {1})",
+    ">": "({0} > {1})",
+    ">=": "({0} >= {1})",
+    "==": "({0} = {1})",
+    "!=": "({0} <> {1})",
+    "and": "({0} AND {1})",
+    "or": "({0} OR {1})",
+    "|": "({0} | {1})",
+    "&": "({0} & {1})",
+    "<<": "({0} << {1})",
+    ">>": "({0} >> {1})",
+    "^": "power({0}, {1})",
+}  # type: Dict[str, str]
+
+_UNARY_OPERATORS = {
+    "-": "(-{0})",
+    "+": "(+{0})",
+    "~": "(~{0})",
+    "not": "(NOT {0})",
+}  # type: Dict[str, str]
+
+
+class SQLDialect(object):
+    def __init__(self, name, binary, functions, placeholder, named=False):
+        # type: (str, Dict[str, str], Dict[str, str], str, bool) -> None
+        """SQL dialect `name`. `binary` are templates of binary operators
+        which differ from the common ones, `functions` maps names of the
+        expression functions to SQL functions. `placeholder` is a template
+        of a bind parameter with the 1-based parameter number. Parameters
+        are passed in a dictionary keyed by ``p<number>`` if `named` is
+        true, otherwise in a tuple."""
+        self.name = name
+        self.binary = dict(_BINARY_OPERATORS)
+        self.binary.update(binary)
+        self.unary = dict(_UNARY_OPERATORS)
+        self.functions = functions
+        self.placeholder = placeholder
+        self.named = named
+
+    def quote(self, reference):
+        # type: (List[str]) -> str
+        """Return quoted, dot-separated identifier of the `reference`
+        parts."""
+        quoted = ".".join('"{}"'.format(part.replace('"', '""'))
+                          for part in reference)
+        if self.named:
+            # Percent sign starts a parameter in the `pyformat` style
+            quoted = quoted.replace("%", "%%")
+        return quoted
+
+    def bind(self, values):
+        # type: (List[Any]) -> Union[Tuple, Dict[str, Any]]
+        """Return parameters of the SQL expression from the literal
+        `values`."""
+        if self.named:
+            return dict(("p{}".format(i + 1), value)
+                        for i, value in enumerate(values))
+        return tuple(values)
+
+    def __repr__(self):
+        # type: () -> str
+        return "SQLDialect({!r})".format(self.name)
+
+
+sql_dialects = {
+    # Numbered `qmark` parameters, `//`, `^` and most of the functions
+    # require SQLite 3.35 or newer compiled with the math functions
+    "sqlite": SQLDialect(
+        "sqlite",
+        binary={
+            "/": "(CAST({0} AS REAL) / {1})",
+            "//": "CAST(floor(CAST({0} AS REAL) / {1}) AS INTEGER)",
+            "%": "({0} % {1})",
+            "in": "(instr({1}, {0}) > 0)",
+            "is": "({0} IS {1})",
+        },
+        functions={
+            "abs": "abs",
+            "min": "min",
+            "max": "max",
+            "round": "round",
+            "sqrt": "sqrt",
+            "exp": "exp",
+            "log": "ln",
+            "log10": "log10",
+            "floor": "floor",
+            "ceil": "ceil",
+            "coalesce": "coalesce",
+        },
+        placeholder="?{}"),
+    # `pyformat` parameters of psycopg
+    "postgresql": SQLDialect(
+        "postgresql",
+        binary={
+            "/": "(CAST({0} AS DOUBLE PRECISION) / {1})",
+            "//": "CAST(floor(CAST({0} AS DOUBLE PRECISION) / {1}) "
+                  "AS BIGINT)",
+            "%": "mod({0}, {1})",
+            "in": "(strpos({1}, {0}) > 0)",
+            "is": "({0} IS NOT DISTINCT FROM {1})",
+        },
+        functions={
+            "abs": "abs",
+            "min": "least",
+            "max": "greatest",
+            "round": "round",
+            "sqrt": "sqrt",
+            "exp": "exp",
+            "log": "ln",
+            "log10": "log",
+            "floor": "floor",
+            "ceil": "ceil",
+            "coalesce": "coalesce",
+        },
+        placeholder="%(p{})s",
+        named=True),
+}  # type: Dict[str, SQLDialect]
+
+
+class SQLExpression(object):
+    __slots__ = ("sql", "params")
+
+    def __init__(self, sql, params):
+        # type: (str, Union[Tuple, Dict[str, Any]]) -> None
+        """Compiled SQL expression: `sql` is the SQL text and `params` are
+        the bind parameters in the style of the dialect."""
+        self.sql = sql
+        self.params = params
+
+    def __eq__(self, other):
+        # type: (Any) -> bool
+        return isinstance(other, SQLExpression) and self.sql == other.sql \
+            and self.params == other.params
+
+    def __ne__(self, other):
+        # type: (Any) -> bool
+        return not self == other
+
+    __hash__ = None  # type: ignore
+
+    def __repr__(self):
+        # type: () -> str
+        return "SQLExpression({!r}, {!r})".format(self.sql, self.params)
+
+
+class _SQLContext(object):
+    """Compilation state of a single expression."""
+
+    def __init__(self, schema, dialect):
+        # type: (Any, SQLDialect) -> None
+        # Values of the bind parameters
+        self.literals = []  # type: List[Any]
+
+        if schema is None:
+            self.columns = None  # type: Optional[Dict[str, str]]
+        elif hasattr(schema, "keys"):
+            self.columns = dict(schema)
+        else:
+            self.columns = dict((name, dialect.quote(name.split(".")))
+                                for name in schema)
+
+
+_LITERAL_SHAPE = (LITERAL, )
+
+
+class SQLCompiler(Compiler):
+    def __init__(self, dialect="sqlite", functions=None,
+                 statement_cache_size=1024, **kwargs):
+        # type: (Union[str, SQLDialect], Optional[Dict[str, str]], int, Any) -> None
+        """Creates a compiler of expressions into SQL expressions of the
+        `dialect` – ``sqlite``, ``postgresql`` or an `SQLDialect`.
+        `functions` maps names of functions that the expressions may call to
+        SQL functions, the functions of the dialect are used if not
+        specified.
+
+        The compilation context is a schema: ``None`` if the variables are
+        column names – dotted variables are qualified names, a list of
+        allowed column names or a dictionary mapping variable names to SQL
+        expressions of the columns.
+
+        SQL texts of at most `statement_cache_size` expression structures
+        are cached. The cache is used when the expressions are compiled
+        within the compiler's own context."""
+
+        super(SQLCompiler, self).__init__(**kwargs)
+
+        if not isinstance(dialect, SQLDialect):
+            try:
+                dialect = sql_dialects[dialect]
+            except KeyError:
+                raise ExpressionError("Unknown SQL dialect '{}'"
+                                      .format(dialect))
+
+        self.dialect = dialect
+        if functions is None:
+            functions = dialect.functions
+        self.functions = dict(functions)
+
+        self.statement_cache_size = statement_cache_size
+        self._statements = OrderedDict()  # type: OrderedDict
+        self._statement_hits = 0
+        self._statement_misses = 0
+        self._lock = threading.Lock()
+
+    def compile(self, text, context=None):
+        # type: (str, Any) -> SQLExpression
+        """Compile the `text` expression into an `SQLExpression`. `context`
+        is the schema."""
+        if context is None:
+            context = self.context
+
+        if self.instrumentation is not None or context is not self.context \
+                or self.statement_cache_size <= 0:
+            return super(SQLCompiler, self).compile(
+                text, _SQLContext(context, self.dialect))
+
+        parsed = self.parse(text)
+
+        # Expressions differing only in literals share the SQL text
+        literals = []  # type: List[Any]
+        shape = []  # type: List[Tuple]
+        for instruction in parsed.instructions:
+            if instruction[0] == LITERAL:
+                literals.append(instruction[1])
+                shape.append(_LITERAL_SHAPE)
+            else:
+                shape.append(instruction)
+        key = tuple(shape)
+
+        statements = self._statements
+        with self._lock:
+            sql = statements.pop(key, None)
+            if sql is not None:
+                statements[key] = sql
+                self._statement_hits += 1
+            else:
+                self._statement_misses += 1
+
+        sql_context = _SQLContext(context, self.dialect)
+        if sql is None:
+            sql = parsed.replay(self, sql_context, finalize=False)
+            with self._lock:
+                statements[key] = sql
+                while len(statements) > self.statement_cache_size:
+                    statements.popitem(last=False)
+        else:
+            sql_context.literals = literals
+
+        return self.finalize(sql_context, sql)
+
+    def compile_many(self, texts, context=None):
+        # type: (List[str], Any) -> List[SQLExpression]
+        """Compile a list of expressions `texts`. Every expression is
+        compiled separately with its own bind parameters, SQL has no
+        temporary variables to share the common subexpressions."""
+        return [self.compile(text, context) for text in texts]
+
+    def statement_cache_info(self):
+        # type: () -> CacheInfo
+        """Return statistics of the SQL text cache as a named tuple (`hits`,
+        `misses`, `maxsize`, `currsize`)."""
+        return CacheInfo(self._statement_hits, self._statement_misses,
+                         self.statement_cache_size, len(self._statements))
+
+    def compile_literal(self, context, literal):
+        # type: (_SQLContext, Any) -> str
+        context.literals.append(literal)
+        return self.dialect.placeholder.format(len(context.literals))
+
+    def compile_variable(self, context, variable):
+        # type: (_SQLContext, Any) -> str
+        if context.columns is None:
+            return self.dialect.quote(variable.reference)
+        try:
+            return context.columns[variable.name]
+        except KeyError:
+            raise ExpressionError("Unknown variable '{}'"
+                                  .format(variable.name))
+
+    def compile_binary(self, context, operator, left, right):
+        # type: (_SQLContext, str, str, str) -> str
+        try:
+            template = self.dialect.binary[operator]
+        except KeyError:
+            raise ExpressionError("Operator '{}' is not supported in {}"
+                                  .format(operator, self.dialect.name))
+        return template.format(left, right)
+
+    def compile_unary(self, context, operator, operand):
+        # type: (_SQLContext, str, str) -> str
+        try:
+            template = self.dialect.unary[operator]
+        except KeyError:
+            raise ExpressionError("Operator '{}' is not supported in {}"
+                                  .format(operator, self.dialect.name))
+        return template.format(operand)
+
+    def compile_function(self, context, function, args):
+        # type: (_SQLContext, Any, List[str]) -> str
+        name = function.name
+        try:
+            sql_name = self.functions[name]
+        except KeyError:
+            raise ExpressionError("Unknown function '{}'".format(name))
+        return "{}({})".format(sql_name, ", ".join(args))
+
+    def finalize(self, context, obj):
+        # type: (_SQLContext, str) -> SQLExpression
+        return SQLExpression(obj, self.dialect.bind(context.literals))
@@ -0,0 +1,157 @@
+# -*- encoding: utf-8 -*-
+"""Lazy evaluation of expressions over streams of rows.
+
+`evaluate_stream()` compiles the expressions once with `PythonCodeCompiler`
+and returns a generator. Variables are resolved to row keys or tuple indexes
+at compilation time, the rows are consumed one at a time and nothing is
+kept in memory between them.
+"""
+
+from __future__ import absolute_import
+
+from operator import itemgetter
+
+MYPY = False
+if MYPY:
+    from typing import List, Any, Dict, Optional, Callable, Iterable, Iterator
+
+from .compat import string_type
+from .evaluator import PythonCodeCompiler
+
+__all__ = [
+        "evaluate_stream",
+    ]
+
+
+def _converters(convert, names):
+    # type: (Any, List[str]) -> List[Optional[Callable]]
+    """Return list of value converters for variables `names`. `convert` is
+    a callable or a dictionary of callables by variable name."""
+    if convert is None:
+        return [None] * len(names)
+    elif hasattr(convert, "keys"):
+        return [convert.get(name) for name in names]
+    else:
+        return [convert] * len(names)
+
+
+def evaluate_stream(expressions, rows, schema=None, header=False,
+                    convert=None, functions=None):
+    # type: (Any, Iterable, Any, bool, Any, Optional[Dict[str, Callable]]) -> Iterator
+    """Evaluate `expressions` for every row in `rows` and return an iterator
+    of results. The rows are read lazily.
+
+    `expressions` is one of:
+
+    * an expression string – the results are values of the expression
+    * a list of expression strings – the results are tuples of values, all
+      the expressions are evaluated in one pass
+    * a dictionary of field names and expression strings – the results are
+      the rows augmented with the fields: dictionary rows are copied with the
+      new keys, tuple rows are extended with the values
+
+    `schema` is ``None`` for rows that are mappings keyed by variable names
+    or a list of column names for rows that are sequences. If `header` is
+    true the first row is the list of column names, as from `csv.reader()`.
+
+    `convert` is a function, or a dictionary of functions by column name,
+    applied to the values of the columns before the evaluation, for example
+    ``float`` for CSV rows. Only the columns referenced by the expressions
+    are converted; sequence rows are projected to those columns first.
+    `functions` are passed to the `PythonCodeCompiler`."""
+
+    rows = iter(rows)
+
+    if header:
+        try:
+            schema = list(next(rows))
+        except StopIteration:
+            return iter([])
+
+    fields = None  # type: Optional[List[str]]
+    if isinstance(expressions, string_type):
+        texts = [expressions]
+    elif hasattr(expressions, "keys"):
+        fields = list(expressions.keys())
+        texts = [expressions[field] for field in fields]
+    else:
+        texts = list(expressions)
+
+    compiler = PythonCodeCompiler(functions)
+    single = fields is None and isinstance(expressions, string_type)
+
+    def build(context):
+        # type: (Any) -> Any
+        if single:
+            return compiler.compile(texts[0], context)
+        else:
+            return compiler.compile_many(texts, context)
+
+    if convert is not None:
+        # Compile for a projected tuple of the referenced variables only
+        referenced = build(schema).variables
+        converters = _converters(convert, referenced)
+        evaluator = build(referenced)
+
+        if schema is None:
+            keys = referenced  # type: List[Any]
+        else:
+            positions = dict((name, i) for i, name in enumerate(schema))
+            keys = [positions[name] for name in referenced]
+
+        project = _projection(keys, converters)
+    else:
+        evaluator = build(schema)
+        project = None
+
+    evaluate = evaluator.function
+    if project is not None:
+        function = evaluate
+        evaluate = lambda row: function(project(row))
+
+    if fields is not None:
+        if schema is None:
+            return _augment_mappings(evaluate, fields, rows)
+        else:
+            return _augment_sequences(evaluate, rows)
+    else:
+        return map(evaluate, rows)
+
+
+def _projection(keys, converters):
+    # type: (List[Any], List[Optional[Callable]]) -> Callable
+    """Return function which projects a row to a tuple of values under
+    `keys` converted with `converters`."""
+    if not keys:
+        return lambda row: ()
+
+    getter = itemgetter(*keys)
+
+    if all(converter is None for converter in converters):
+        if len(keys) == 1:
+            return lambda row: (getter(row), )
+        return lambda row: tuple(getter(row))
+
+    identity = lambda value: value
+    converters = [converter or identity for converter in converters]
+
+    if len(keys) == 1:
+        converter = converters[0]
+        return lambda row: (converter(getter(row)), )
+
+    return lambda row: tuple(converter(value) for converter, value
+                             in zip(converters, getter(row)))
+
+
+def _augment_mappings(evaluate, fields, rows):
+    # type: (Callable, List[str], Iterator) -> Iterator
+    for row in rows:
+        augmented = dict(row)
+        augmented.update(zip(fields, evaluate(row)))
+        yield augmented
+
+
+def _augment_sequences(evaluate, rows):
+    # type: (Callable, Iterator) -> Iterator
+    for row in rows:
+        yield tuple(row) + evaluate(row)
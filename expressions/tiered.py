@@ -0,0 +1,319 @@
+# -*- encoding: utf-8 -*-
+"""Tiered execution of expressions.
+
+`Interpreter` compiles an expression into a tree of small Python closures.
+Building the tree costs much less than generating and compiling Python code,
+evaluation is slower. `TieredExecutor` starts every expression on the
+interpreter, counts its evaluations and compiles the expression with
+`PythonCodeCompiler` once it is evaluated `threshold` times. Expressions
+which are evaluated only a few times are never compiled.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+
+import operator
+import threading
+from operator import itemgetter
+
+MYPY = False
+if MYPY:
+    from typing import List, Any, Dict, Optional, Callable, Iterable, Iterator
+    from .limits import Limits
+
+from .compiler import Compiler
+from .errors import ExpressionError
+from .evaluator import PythonCodeCompiler, Evaluator, default_functions, \
+                       _CodeContext, _evaluate_limited
+
+__all__ = [
+        "Interpreter",
+        "TieredExecutor",
+        "TieredExpression",
+        "DEFAULT_THRESHOLD",
+        "INTERPRETED",
+        "COMPILED",
+    ]
+
+
+# Number of evaluations after which an expression is compiled
+DEFAULT_THRESHOLD = 1000
+
+# Names of the tiers
+INTERPRETED = "interpreted"
+COMPILED = "compiled"
+
+
+def _contains(item, container):
+    # type: (Any, Any) -> bool
+    return item in container
+
+
+# Same operations as the code generated by `PythonCodeCompiler`
+_BINARY_OPERATORS = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": operator.truediv,
+    "//": operator.floordiv,
+    "%": operator.mod,
+    "^": operator.pow,
+    "<<": operator.lshift,
+    ">>": operator.rshift,
+    "&": operator.and_,
+    "|": operator.or_,
+    "==": operator.eq,
+    # There is no identity in the expression language, `is` compares values
+    "is": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "in": _contains,
+}  # type: Dict[str, Callable]
+
+_UNARY_OPERATORS = {
+    "-": operator.neg,
+    "+": operator.pos,
+    "~": operator.invert,
+    "not": operator.not_,
+}  # type: Dict[str, Callable]
+
+
+class Interpreter(Compiler):
+    def __init__(self, functions=None, **kwargs):
+        # type: (Optional[Dict[str, Callable]], Any) -> None
+        """Creates a compiler of expressions into interpreted functions of
+        one argument – the row. `functions` and the compilation context – the
+        row schema – are the same as of `PythonCodeCompiler`, the results of
+        the evaluation are the same as well.
+
+        The returned function evaluates a tree of closures, one per node of
+        the expression. Very deeply nested expressions may exceed the Python
+        recursion limit when evaluated."""
+
+        super(Interpreter, self).__init__(**kwargs)
+
+        if functions is None:
+            functions = default_functions
+        self.functions = dict(functions)
+
+    def compile(self, text, context=None):
+        # type: (str, Any) -> Callable
+        """Compile the `text` expression into a function of a row. `context`
+        is the row schema."""
+        if context is None:
+            context = self.context
+        return super(Interpreter, self).compile(text, _CodeContext(context))
+
+    def compile_literal(self, context, literal):
+        # type: (_CodeContext, Any) -> Callable
+        return lambda row: literal
+
+    def compile_variable(self, context, variable):
+        # type: (_CodeContext, Any) -> Callable
+        name = variable.name
+        if context.keys is None:
+            return itemgetter(name)
+        try:
+            return itemgetter(context.keys[name])
+        except KeyError:
+            raise ExpressionError("Unknown variable '{}'".format(name))
+
+    def compile_binary(self, context, operator, left, right):
+        # type: (_CodeContext, str, Callable, Callable) -> Callable
+        # Logical operators evaluate the right operand only if needed
+        if operator == "and":
+            return lambda row: left(row) and right(row)
+        elif operator == "or":
+            return lambda row: left(row) or right(row)
+
+        try:
+            function = _BINARY_OPERATORS[operator]
+        except KeyError:
+            raise ExpressionError("Unsupported operator '{}'"
+                                  .format(operator))
+        return lambda row: function(left(row), right(row))
+
+    def compile_unary(self, context, operator, operand):
+        # type: (_CodeContext, str, Callable) -> Callable
+        try:
+            function = _UNARY_OPERATORS[operator]
+        except KeyError:
+            raise ExpressionError("Unsupported operator '{}'"
+                                  .format(operator))
+        return lambda row: function(operand(row))
+
+    def compile_function(self, context, function, args):
+        # type: (_CodeContext, Any, List[Callable]) -> Callable
+        name = function.name
+        try:
+            callable_ = self.functions[name]
+        except KeyError:
+            raise ExpressionError("Unknown function '{}'".format(name))
+
+        if len(args) == 1:
+            arg = args[0]
+            return lambda row: callable_(arg(row))
+        return lambda row: callable_(*[arg(row) for arg in args])
+
+    def finalize(self, context, obj):
+        # type: (_CodeContext, Callable) -> Callable
+        return obj
+
+
+class TieredExpression(object):
+    __slots__ = ("text", "size", "calls", "tier", "function", "_executor")
+
+    def __init__(self, text, function, executor, size=1):
+        # type: (str, Callable, TieredExecutor, int) -> None
+        """Expression `text` evaluated by the `executor`. `calls` is the
+        number of evaluations, `tier` is ``interpreted`` or ``compiled``
+        and `function` the current function of the row. `size` is the
+        number of nodes of the expression."""
+        self.text = text
+        self.size = max(size, 1)
+        self.calls = 0
+        self.tier = INTERPRETED
+        self.function = function
+        self._executor = executor
+
+    def __call__(self, row):
+        # type: (Any) -> Any
+        self.calls += 1
+        if self.calls == self._executor.threshold:
+            self._executor._promote(self)
+        return self.function(row)
+
+    def evaluate(self, rows):
+        # type: (Iterable[Any]) -> Iterator[Any]
+        """Return an iterator of results for every row in `rows`. The
+        expression is promoted as soon as it reaches the threshold. The
+        `max_steps` and `max_time` limits of the executor are checked as by
+        `Evaluator.evaluate()`."""
+        limits = self._executor.limits
+        if limits is None or (limits.max_steps is None
+                              and limits.max_time is None):
+            return map(self, rows)
+        return _evaluate_limited(self, rows, self.size, limits)
+
+    def __repr__(self):
+        # type: () -> str
+        return "TieredExpression({!r}, {}, calls={})".format(self.text,
+                                                             self.tier,
+                                                             self.calls)
+
+
+class TieredExecutor(object):
+    def __init__(self, threshold=DEFAULT_THRESHOLD, functions=None,
+                 schema=None, compiler=None, cache=None, limits=None):
+        # type: (int, Optional[Dict[str, Callable]], Any, Optional[Compiler], Any, Optional[Limits]) -> None
+        """Creates an executor which interprets expressions and compiles
+        those evaluated at least `threshold` times. `functions` are the
+        functions the expressions may call and `schema` the row schema, see
+        `PythonCodeCompiler`. `compiler` compiles the hot expressions into
+        functions of a row, a `PythonCodeCompiler` with the `functions` by
+        default. `cache` is the `ExpressionCache` of the interpreter and of
+        the default compiler. `limits` are the `Limits` of compilation and of
+        `evaluate()` on both tiers.
+
+        The call counters are not synchronized, with many threads some
+        evaluations may not be counted."""
+        if threshold < 1:
+            raise ExpressionError("Threshold must be positive")
+
+        self.threshold = threshold
+        self.schema = schema
+        self.limits = limits
+        self.interpreter = Interpreter(functions, cache=cache, limits=limits)
+        self.compiler = compiler or PythonCodeCompiler(functions, cache=cache,
+                                                       limits=limits)
+        self.promotions = 0
+        self.failures = 0
+        self._expressions = {}  # type: Dict[str, TieredExpression]
+        self._lock = threading.Lock()
+
+    def get(self, text):
+        # type: (str) -> TieredExpression
+        """Return the `TieredExpression` of `text`, interpret it if it is
+        new."""
+        try:
+            return self._expressions[text]
+        except KeyError:
+            pass
+
+        interpreter = self.interpreter
+        parsed = interpreter.parse(text)
+        function = parsed.replay(interpreter, _CodeContext(self.schema))
+        with self._lock:
+            return self._expressions.setdefault(
+                text, TieredExpression(text, function, self, len(parsed)))
+
+    def __call__(self, text, row):
+        # type: (str, Any) -> Any
+        """Evaluate expression `text` for the `row`."""
+        return self.get(text)(row)
+
+    def evaluate(self, text, rows):
+        # type: (str, Iterable[Any]) -> Iterator[Any]
+        """Return an iterator of results of expression `text` for every row
+        in `rows`."""
+        return self.get(text).evaluate(rows)
+
+    def _promote(self, expression):
+        # type: (TieredExpression) -> None
+        if expression.tier == COMPILED:
+            return
+        try:
+            function = self.compiler.compile(expression.text, self.schema)
+        except ExpressionError:
+            # Python can not compile too deeply nested code, keep
+            # interpreting the expression
+            with self._lock:
+                self.failures += 1
+            return
+
+        if isinstance(function, Evaluator):
+            # Call the compiled function directly, without the wrapper
+            function = function.function
+        expression.function = function
+        expression.tier = COMPILED
+        with self._lock:
+            self.promotions += 1
+
+    def tiers(self):
+        # type: () -> Dict[str, Dict[str, Any]]
+        """Return a dictionary of evaluated expressions with their tier and
+        number of evaluations."""
+        return dict((text, {"tier": expression.tier,
+                            "calls": expression.calls})
+                    for text, expression in list(self._expressions.items()))
+
+    def counters(self):
+        # type: () -> Dict[str, int]
+        """Return numbers of interpreted and compiled expressions, of
+        evaluations on each tier, of promotions and of failed
+        promotions."""
+        counters = {
+            INTERPRETED: 0,
+            COMPILED: 0,
+            INTERPRETED + "_calls": 0,
+            COMPILED + "_calls": 0,
+            "promotions": self.promotions,
+            "failures": self.failures,
+        }
+        threshold = self.threshold
+        for expression in list(self._expressions.values()):
+            counters[expression.tier] += 1
+            if expression.tier == COMPILED:
+                counters[INTERPRETED + "_calls"] += threshold - 1
+                counters[COMPILED + "_calls"] += expression.calls \
+                    - threshold + 1
+            else:
+                counters[INTERPRETED + "_calls"] += expression.calls
+        return counters
+
+    def __len__(self):
+        # type: () -> int
+        return len(self._expressions)
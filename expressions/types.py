@@ -0,0 +1,276 @@
+# -*- encoding: utf-8 -*-
+"""Static type inference of expressions.
+
+`TypeChecker` computes the type of every node of an expression from the
+types of its variables – the schema – and the signatures of the functions,
+and raises `ExpressionTypeError` for operations that would fail at
+evaluation time, such as subtraction of strings. The types follow the
+Python semantics of the expression language:
+
+* ``bool``, ``int``, ``float`` and ``str``
+* ``any`` – the type is not known, no checks are made
+
+Compilers given a schema check the types while compiling the expression
+and backends use the types to select specialized operations.
+`infer_types()` returns the types of all nodes of a parsed expression.
+"""
+
+from __future__ import absolute_import
+
+MYPY = False
+if MYPY:
+    from typing import List, Any, Dict, Optional, Tuple, Union
+
+from .compat import string_type, text_type, integer_types
+from .errors import ExpressionTypeError
+from .parsed import ParsedExpression, LITERAL, VARIABLE, UNARY, BINARY
+
+__all__ = [
+        "TypeChecker",
+        "infer_types",
+        "default_signatures",
+        "BOOL",
+        "INT",
+        "FLOAT",
+        "STR",
+        "ANY",
+        "NUMBER",
+    ]
+
+
+BOOL = "bool"
+INT = "int"
+FLOAT = "float"
+STR = "str"
+ANY = "any"
+# Any of `bool`, `int` and `float`, used only in function signatures
+NUMBER = "number"
+
+# Numeric types ordered by promotion
+_NUMERIC = {BOOL: 0, INT: 1, FLOAT: 2}
+
+_PYTHON_TYPES = {
+    bool: BOOL,
+    int: INT,
+    float: FLOAT,
+    str: STR,
+    text_type: STR,
+}  # type: Dict[Any, str]
+
+_TYPES = frozenset([BOOL, INT, FLOAT, STR, ANY])
+
+_ARITHMETIC = frozenset(["+", "-", "*", "/", "//", "%", "^"])
+_BITWISE = frozenset(["&", "|", "<<", ">>"])
+_ORDERING = frozenset(["<", "<=", ">", ">="])
+_EQUALITY = frozenset(["==", "!=", "is", "in"])
+_LOGICAL = frozenset(["and", "or"])
+
+
+# Signatures of `default_functions`: (argument types, result type). A single
+# argument type means any number of arguments of the type, result `None`
+# the widest type of the arguments.
+default_signatures = {
+    "abs": ((NUMBER, ), None),
+    "min": (NUMBER, None),
+    "max": (NUMBER, None),
+    # Integers in Python, floats in NumPy
+    "round": (NUMBER, ANY),
+    "floor": ((NUMBER, ), ANY),
+    "ceil": ((NUMBER, ), ANY),
+    "sqrt": ((NUMBER, ), FLOAT),
+    "exp": ((NUMBER, ), FLOAT),
+    "log": ((NUMBER, ), FLOAT),
+    "log10": ((NUMBER, ), FLOAT),
+}  # type: Dict[str, Tuple[Union[str, Tuple[str, ...]], Optional[str]]]
+
+
+def _type_name(type_):
+    # type: (Any) -> str
+    """Return name of a type given as a name or as a Python type."""
+    if isinstance(type_, string_type) and type_ in _TYPES:
+        return type_
+    try:
+        return _PYTHON_TYPES[type_]
+    except (KeyError, TypeError):
+        raise ExpressionTypeError("Unknown type '{}'".format(type_))
+
+
+def _accepts(expected, actual):
+    # type: (str, str) -> bool
+    """`True` if value of the `actual` type can be passed as an argument
+    of the `expected` type."""
+    if actual == ANY or expected == ANY or expected == actual:
+        return True
+    if expected == NUMBER:
+        return actual in _NUMERIC
+    # Booleans are integers and integers are accepted as floats
+    return expected in _NUMERIC and actual in _NUMERIC \
+        and _NUMERIC[actual] <= _NUMERIC[expected]
+
+
+def _promote(types):
+    # type: (List[str]) -> str
+    """Return the widest numeric type of `types`, booleans are promoted to
+    integers."""
+    if ANY in types:
+        return ANY
+    return FLOAT if FLOAT in types else INT
+
+
+class TypeChecker(object):
+    def __init__(self, types=None, signatures=None):
+        # type: (Optional[Dict[str, Any]], Optional[Dict[str, Any]]) -> None
+        """Creates a type checker. `types` maps variable names to their types
+        – type names or the Python types `bool`, `int`, `float` and `str`.
+        Variables not in `types` are of type ``any``. `signatures` maps
+        function names to pairs (`arguments`, `result`), `default_signatures`
+        are used if not specified.
+
+        `arguments` is a tuple of argument types or a single type for any
+        number of arguments, ``number`` is any numeric type. `result` is the
+        result type or `None` for the widest of the argument types.
+        Functions without a signature return ``any``."""
+        self.types = dict((name, _type_name(type_))
+                          for name, type_ in (types or {}).items())
+        if signatures is None:
+            signatures = default_signatures
+        self.signatures = dict(signatures)
+
+    def literal(self, value):
+        # type: (Any) -> str
+        """Return type of a literal `value`."""
+        if isinstance(value, bool):
+            return BOOL
+        elif isinstance(value, float):
+            return FLOAT
+        elif isinstance(value, string_type):
+            return STR
+        elif isinstance(value, integer_types):
+            return INT
+        return ANY
+
+    def variable(self, name):
+        # type: (str) -> str
+        """Return type of the variable `name`."""
+        return self.types.get(name, ANY)
+
+    def binary(self, operator, left, right):
+        # type: (str, str, str) -> str
+        """Return result type of the binary `operator` applied to operands
+        of the `left` and `right` types."""
+        if operator in _EQUALITY:
+            return BOOL
+
+        if operator in _ORDERING:
+            if left == ANY or right == ANY or (left == right == STR) \
+                    or (left in _NUMERIC and right in _NUMERIC):
+                return BOOL
+            self._fail(operator, left, right)
+
+        if operator in _LOGICAL:
+            # Python returns one of the operands
+            return left if left == right else ANY
+
+        if operator in _BITWISE:
+            if left in (INT, BOOL, ANY) and right in (INT, BOOL, ANY):
+                if left == right == BOOL and operator in ("&", "|"):
+                    return BOOL
+                return _promote([left, right])
+            self._fail(operator, left, right)
+
+        if operator in _ARITHMETIC:
+            if STR in (left, right):
+                if operator == "+" and left in (STR, ANY) \
+                        and right in (STR, ANY):
+                    return STR
+                if operator == "*" and set([left, right]) <= \
+                        set([STR, INT, BOOL, ANY]) and left != right:
+                    return STR
+                if operator == "%" and left == STR:
+                    return STR
+                self._fail(operator, left, right)
+            if ANY in (left, right):
+                return ANY
+            if operator == "/":
+                return FLOAT
+            if operator == "^" and FLOAT not in (left, right):
+                # Integer power with a negative exponent is a float
+                return ANY
+            return _promote([left, right])
+
+        raise ExpressionTypeError("Unknown operator '{}'".format(operator))
+
+    def unary(self, operator, operand):
+        # type: (str, str) -> str
+        """Return result type of the unary `operator` applied to an operand
+        of the `operand` type."""
+        if operator == "not":
+            return BOOL
+        if operand == ANY:
+            return ANY
+        if operator in ("-", "+") and operand in _NUMERIC:
+            return _promote([operand])
+        if operator == "~" and operand in (INT, BOOL):
+            return INT
+        raise ExpressionTypeError("Operator '{}' can not be applied to {}"
+                                  .format(operator, operand))
+
+    def function(self, name, args):
+        # type: (str, List[str]) -> str
+        """Return result type of the function `name` called with arguments
+        of the `args` types."""
+        try:
+            arguments, result = self.signatures[name]
+        except KeyError:
+            return ANY
+
+        if isinstance(arguments, string_type):
+            arguments = (arguments, ) * len(args)
+        elif len(arguments) != len(args):
+            raise ExpressionTypeError("Function '{}' expects {} arguments, "
+                                      "{} given".format(name, len(arguments),
+                                                        len(args)))
+
+        for i, (expected, actual) in enumerate(zip(arguments, args)):
+            if not _accepts(expected, actual):
+                raise ExpressionTypeError("Argument {} of function '{}' "
+                                          "must be {}, not {}"
+                                          .format(i + 1, name, expected,
+                                                  actual))
+
+        if result is None:
+            return _promote(list(args))
+        return result
+
+    def _fail(self, operator, left, right):
+        # type: (str, str, str) -> None
+        raise ExpressionTypeError("Operator '{}' can not be applied to {} "
+                                  "and {}".format(operator, left, right))
+
+
+def infer_types(parsed, types=None, signatures=None):
+    # type: (ParsedExpression, Optional[Dict[str, Any]], Optional[Dict[str, Any]]) -> List[str]
+    """Return list of types of the instructions of the `parsed` expression,
+    the last one is the type of the expression. `types` and `signatures` are
+    the same as of `TypeChecker`. Raises `ExpressionTypeError` if an
+    operation can not be applied to its operands."""
+    checker = TypeChecker(types, signatures)
+    result = []  # type: List[str]
+    append = result.append
+
+    for instruction in parsed.instructions:
+        code = instruction[0]
+        if code == BINARY:
+            append(checker.binary(instruction[1], result[instruction[2]],
+                                  result[instruction[3]]))
+        elif code == VARIABLE:
+            append(checker.variable(instruction[1].name))
+        elif code == LITERAL:
+            append(checker.literal(instruction[1]))
+        elif code == UNARY:
+            append(checker.unary(instruction[1], result[instruction[2]]))
+        else:
+            append(checker.function(instruction[1].name,
+                                    [result[i] for i in instruction[2]]))
+
+    return result
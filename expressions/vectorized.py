@@ -0,0 +1,552 @@
+# -*- encoding: utf-8 -*-
+"""Vectorized evaluation of expressions over columns of NumPy arrays.
+
+`NumpyCompiler` compiles an expression into a `NumpyPlan` – a flat list of
+NumPy function calls. The plan is compiled once and can be executed against
+many batches of columns. NumPy is an optional dependency, it is imported only
+when a `NumpyCompiler` is created.
+"""
+
+from __future__ import absolute_import
+
+import functools
+
+MYPY = False
+if MYPY:
+    from typing import List, Any, Dict, Optional, Tuple, Callable
+    from .limits import Limits
+
+from .compiler import Compiler
+from .errors import ExpressionError
+from .types import TypeChecker, BOOL
+
+__all__ = [
+        "NumpyCompiler",
+        "NumpyPlan",
+        "default_numpy_functions",
+        "DEFAULT_BLOCK_SIZE",
+    ]
+
+
+# Number of rows evaluated at once by `NumpyPlan.execute_blocked()`. Scratch
+# buffers of this size should fit into the CPU cache.
+DEFAULT_BLOCK_SIZE = 16384
+
+
+# Functions are names of NumPy functions or callables
+default_numpy_functions = {
+    "abs": "absolute",
+    "min": "minimum",
+    "max": "maximum",
+    "round": "rint",
+    "sqrt": "sqrt",
+    "exp": "exp",
+    "log": "log",
+    "log10": "log10",
+    "floor": "floor",
+    "ceil": "ceil",
+}  # type: Dict[str, Any]
+
+BINARY_OPERATORS = {
+    "+": "add",
+    "-": "subtract",
+    "*": "multiply",
+    "/": "true_divide",
+    "//": "floor_divide",
+    "%": "remainder",
+    "^": "power",
+    "<<": "left_shift",
+    ">>": "right_shift",
+    "&": "bitwise_and",
+    "|": "bitwise_or",
+    "==": "equal",
+    # There is no identity in the expression language, `is` compares values
+    "is": "equal",
+    "!=": "not_equal",
+    "<": "less",
+    "<=": "less_equal",
+    ">": "greater",
+    ">=": "greater_equal",
+    "and": "logical_and",
+    "or": "logical_or",
+    "in": "isin",
+}
+
+UNARY_OPERATORS = {
+    "-": "negative",
+    "+": "positive",
+    "~": "invert",
+    "not": "logical_not",
+}
+
+# Operators which NumPy evaluates differently than Python for booleans or not
+# at all, such as `True + True`. They are evaluated as integer operations when
+# the operands are known to be booleans.
+_INTEGER_BINARY_OPERATORS = frozenset(["+", "-", "*", "//", "%", "^", "<<",
+                                       ">>"])
+_INTEGER_UNARY_OPERATORS = frozenset(["-", "+", "~"])
+
+
+def _import_numpy():
+    # type: () -> Any
+    try:
+        import numpy
+    except ImportError:
+        raise ExpressionError("NumPy is required for vectorized evaluation")
+    return numpy
+
+
+def _resolve(numpy, name):
+    # type: (Any, Any) -> Callable
+    """Return NumPy function `name` or `name` itself if it is a callable."""
+    if callable(name):
+        return name
+    try:
+        return getattr(numpy, name)
+    except AttributeError:
+        raise ExpressionError("Unknown NumPy function '{}'".format(name))
+
+
+def resolve_column(columns, name, reference):
+    # type: (Any, str, List[str]) -> Any
+    """Return column for variable `name` with `reference` from `columns`.
+    The full dotted name is tried first, then the reference components are
+    looked up in nested mappings."""
+    try:
+        return columns[name]
+    except KeyError:
+        pass
+
+    value = columns
+    try:
+        for part in reference:
+            value = value[part]
+    except (KeyError, TypeError, IndexError):
+        raise ExpressionError("Unknown column '{}'".format(name))
+    return value
+
+
+class NumpyPlan(object):
+    def __init__(self, inputs, constants, steps, limits=None):
+        # type: (List[Tuple[str, List[str]]], List[Any], List[Tuple[Callable, Tuple[int, ...]]], Optional[Limits]) -> None
+        """Compiled vectorized expression. The plan works on a list of
+        registers: first registers are the `inputs` – variables as tuples
+        (`name`, `reference`), followed by the `constants` and then by
+        results of the `steps`. Step is a tuple (`function`, `arguments`)
+        where arguments are register indexes. The last register is the
+        result.
+
+        With `limits` the execution raises `ExpressionLimitError` if the
+        number of rows times the number of steps exceeds `max_steps` –
+        before anything is evaluated – or if it takes longer than
+        `max_time` seconds. The time is checked after every step or block
+        of rows."""
+        self.inputs = inputs
+        self.constants = constants
+        self.steps = steps
+        self.limits = limits
+
+    @property
+    def variables(self):
+        # type: () -> List[str]
+        """List of names of variables used in the expression."""
+        return [name for name, _ in self.inputs]
+
+    def __len__(self):
+        # type: () -> int
+        return len(self.steps)
+
+    def __call__(self, columns):
+        # type: (Any) -> Any
+        return self.execute(columns)
+
+    def execute(self, columns):
+        # type: (Any) -> Any
+        """Evaluate the plan for `columns` – a mapping of variable names to
+        arrays (or a nested mappings for dotted variables). Returns an
+        array or a scalar if the expression does not use any variable."""
+        registers = [resolve_column(columns, name, reference)
+                     for name, reference in self.inputs]
+
+        limits = self.limits
+        if limits is not None:
+            numpy = _import_numpy()
+            rows = max([numpy.size(register) for register in registers]
+                       or [1])
+            limits.check_steps(rows * len(self.steps))
+            start = limits.start()
+
+        registers += self.constants
+        append = registers.append
+
+        for function, arguments in self.steps:
+            append(function(*[registers[i] for i in arguments]))
+            if limits is not None:
+                limits.check_time(start)
+
+        return registers[-1]
+
+    def execute_blocked(self, columns, out=None, block_size=None):
+        # type: (Any, Any, Optional[int]) -> Any
+        """Evaluate the plan for `columns` in blocks of `block_size` rows
+        (default `DEFAULT_BLOCK_SIZE`) and write the result into the `out`
+        array. The array is created if not provided.
+
+        Intermediate results are written into a small pool of scratch
+        buffers of the block size which are reused once their values are no
+        longer needed, therefore the memory used does not depend on the
+        number of rows. Results of steps that do not depend on any column
+        are computed only once."""
+
+        numpy = _import_numpy()
+
+        block_size = block_size or DEFAULT_BLOCK_SIZE
+        if block_size < 1:
+            raise ExpressionError("Block size must be positive")
+
+        inputs = [numpy.asarray(resolve_column(columns, name, reference))
+                  for name, reference in self.inputs]
+        first_step = len(inputs) + len(self.constants)
+        last = first_step + len(self.steps) - 1
+
+        # Steps as (function, arguments, whole) where `whole` tells for
+        # every argument whether it is an input column needed whole – the
+        # set of values of `in` – instead of a block of the column.
+        steps = []  # type: List[Tuple[Callable, Tuple[int, ...], Tuple[bool, ...]]]
+        sliced = set()
+        for function, arguments in self.steps:
+            whole = [False] * len(arguments)
+            if function is numpy.isin:
+                if arguments[1] >= first_step:
+                    raise ExpressionError("Right operand of 'in' must be a "
+                                          "variable or a constant in blocked "
+                                          "execution")
+                whole[1] = True
+            sliced.update(i for i, is_whole in zip(arguments, whole)
+                          if i < len(inputs) and not is_whole)
+            steps.append((function, arguments, tuple(whole)))
+
+        if not sliced:
+            # The result does not depend on any row
+            result = self.execute(columns)
+            if out is not None:
+                out[...] = result
+                return out
+            return result
+
+        length = len(inputs[min(sliced)])
+
+        limits = self.limits
+        if limits is not None:
+            limits.check_steps(length * len(steps))
+            start = limits.start()
+
+        def arguments_of(registers, arguments, whole):
+            return [inputs[i] if is_whole else registers[i]
+                    for i, is_whole in zip(arguments, whole)]
+
+        # Infer result types from the first row
+        sample = [array[:1] for array in inputs] + list(self.constants)
+        for function, arguments, whole in steps:
+            sample.append(function(*arguments_of(sample, arguments, whole)))
+        dtypes = [numpy.asarray(value).dtype for value in sample]
+
+        if out is None:
+            out = numpy.empty(length, dtype=dtypes[last])
+        elif len(out) != length:
+            raise ExpressionError("Output array has length {}, expected {}"
+                                  .format(len(out), length))
+
+        # Registers that vary with the block. Other step results are
+        # constant and computed once.
+        varying = [i in sliced for i in range(len(inputs))]
+        varying += [False] * len(self.constants)
+        registers = [None] * len(inputs) + list(self.constants)
+        for function, arguments, whole in steps:
+            is_varying = any(varying[i] for i, is_whole
+                             in zip(arguments, whole) if not is_whole)
+            varying.append(is_varying)
+            if is_varying:
+                registers.append(None)
+            else:
+                registers.append(function(*arguments_of(registers, arguments,
+                                                        whole)))
+
+        if not varying[last]:
+            out[...] = registers[last]
+            return out
+
+        # Assign scratch buffers to the block-varying step results. A buffer
+        # is returned to the pool after the last use of its register.
+        last_use = {}  # type: Dict[int, int]
+        for register, (_, arguments, _) in enumerate(steps, first_step):
+            for i in arguments:
+                last_use[i] = register
+
+        pool = {}  # type: Dict[Any, List[Any]]
+        buffers = {}  # type: Dict[int, Any]
+        schedule = []  # type: List[Tuple]
+
+        for register, (function, arguments, whole) in enumerate(steps,
+                                                                 first_step):
+            if not varying[register]:
+                continue
+
+            use_out = isinstance(function, numpy.ufunc) \
+                    and function.nout == 1
+            if use_out and register != last:
+                dtype = dtypes[register]
+                free = pool.get(dtype)
+                if free:
+                    buffers[register] = free.pop()
+                else:
+                    buffers[register] = numpy.empty(block_size, dtype=dtype)
+
+            schedule.append((register, function, arguments, whole, use_out))
+
+            for i in set(arguments):
+                if last_use.get(i) == register and i in buffers:
+                    buffer = buffers[i]
+                    pool.setdefault(buffer.dtype, []).append(buffer)
+
+        for offset in range(0, length, block_size):
+            if limits is not None:
+                limits.check_time(start)
+
+            stop = min(offset + block_size, length)
+            size = stop - offset
+
+            for i in sliced:
+                registers[i] = inputs[i][offset:stop]
+
+            for register, function, arguments, whole, use_out in schedule:
+                args = arguments_of(registers, arguments, whole)
+                if register == last:
+                    target = out[offset:stop]
+                elif use_out:
+                    target = buffers[register][:size]
+                else:
+                    registers[register] = function(*args)
+                    continue
+
+                if use_out:
+                    registers[register] = function(*args, out=target)
+                else:
+                    target[...] = function(*args)
+
+        return out
+
+    def __repr__(self):
+        # type: () -> str
+        return "NumpyPlan({} inputs, {} steps)".format(len(self.inputs),
+                                                      len(self.steps))
+
+
+class _PlanContext(object):
+    """Compilation state of a single expression. Compilation methods return
+    operand descriptors: (`kind`, `index`) where kind is `input`, `constant`
+    or `step`."""
+
+    def __init__(self, columns):
+        # type: (Any) -> None
+        self.columns = columns
+        self.inputs = []  # type: List[Tuple[str, List[str]]]
+        self.input_indexes = {}  # type: Dict[str, int]
+        self.constants = []  # type: List[Any]
+        self.steps = []  # type: List[Tuple[Callable, Tuple]]
+        # Types of the operands if the compiler checks types
+        self.types = {}  # type: Dict[Tuple[str, int], str]
+
+    def add_step(self, function, operands):
+        # type: (Callable, List[Tuple[str, int]]) -> Tuple[str, int]
+        self.steps.append((function, tuple(operands)))
+        return ("step", len(self.steps) - 1)
+
+    def plan(self, result, limits=None):
+        # type: (Tuple[str, int], Optional[Limits]) -> NumpyPlan
+        """Return the plan with operand descriptors translated into register
+        indexes."""
+        offsets = {
+            "input": 0,
+            "constant": len(self.inputs),
+            "step": len(self.inputs) + len(self.constants),
+        }
+
+        steps = [(function, tuple(offsets[kind] + index
+                                  for kind, index in operands))
+                 for function, operands in self.steps]
+
+        kind, index = result
+        if kind != "step" or index != len(steps) - 1:
+            # The result is not the last step – a single variable or a
+            # constant
+            numpy = _import_numpy()
+            steps.append((numpy.asarray, (offsets[kind] + index, )))
+
+        return NumpyPlan(self.inputs, self.constants, steps, limits)
+
+
+class NumpyCompiler(Compiler):
+    def __init__(self, functions=None, types=None, signatures=None,
+                 **kwargs):
+        # type: (Optional[Dict[str, Any]], Optional[Dict[str, Any]], Optional[Dict[str, Any]], Any) -> None
+        """Creates a compiler of expressions into vectorized `NumpyPlan`s.
+        `functions` is a dictionary of functions that the expressions may
+        call – NumPy function names or callables. `default_numpy_functions`
+        are used if not specified. Binary NumPy ufuncs, such as `minimum`,
+        accept any number of arguments greater than one.
+
+        If `types` – a mapping of variable names to types – is given, the
+        types of the expression are checked during the compilation, see
+        `TypeChecker`, and arithmetic of booleans is evaluated with integer
+        operations as in Python. `signatures` are signatures of the
+        functions.
+
+        The compilation context is an optional collection of available
+        column names. If provided, only those variables are allowed."""
+
+        super(NumpyCompiler, self).__init__(**kwargs)
+
+        numpy = _import_numpy()
+
+        self.type_checker = None  # type: Optional[TypeChecker]
+        if types is not None:
+            self.type_checker = TypeChecker(types, signatures)
+
+        if functions is None:
+            functions = default_numpy_functions
+
+        self.functions = dict((name, _resolve(numpy, function))
+                              for name, function in functions.items())
+        self.binary_operators = dict(
+            (operator, _resolve(numpy, function))
+            for operator, function in BINARY_OPERATORS.items())
+        self.unary_operators = dict(
+            (operator, _resolve(numpy, function))
+            for operator, function in UNARY_OPERATORS.items())
+
+    def compile(self, text, context=None):
+        # type: (str, Any) -> NumpyPlan
+        """Compile the `text` expression into a `NumpyPlan`. `context` is an
+        optional collection of available column names."""
+        if context is None:
+            context = self.context
+        return super(NumpyCompiler, self).compile(text,
+                                                  _PlanContext(context))
+
+    def compile_many(self, texts, context=None):
+        # type: (List[str], Any) -> List[NumpyPlan]
+        """Compile a list of expressions into a list of independent
+        `NumpyPlan`s."""
+        return [self.compile(text, context) for text in texts]
+
+    def compile_literal(self, context, literal):
+        # type: (_PlanContext, Any) -> Tuple[str, int]
+        context.constants.append(literal)
+        result = ("constant", len(context.constants) - 1)
+        if self.type_checker is not None:
+            context.types[result] = self.type_checker.literal(literal)
+        return result
+
+    def compile_variable(self, context, variable):
+        # type: (_PlanContext, Any) -> Tuple[str, int]
+        name = variable.name
+
+        if context.columns is not None and name not in context.columns:
+            raise ExpressionError("Unknown column '{}'".format(name))
+
+        try:
+            index = context.input_indexes[name]
+        except KeyError:
+            index = len(context.inputs)
+            context.inputs.append((name, list(variable.reference)))
+            context.input_indexes[name] = index
+
+        result = ("input", index)
+        if self.type_checker is not None:
+            context.types[result] = self.type_checker.variable(name)
+        return result
+
+    def compile_binary(self, context, operator, left, right):
+        # type: (_PlanContext, str, Tuple[str, int], Tuple[str, int]) -> Tuple[str, int]
+        try:
+            function = self.binary_operators[operator]
+        except KeyError:
+            raise ExpressionError("Unsupported operator '{}'"
+                                  .format(operator))
+
+        if self.type_checker is None:
+            return context.add_step(function, [left, right])
+
+        types = context.types
+        type_ = self.type_checker.binary(operator, types[left], types[right])
+        if operator in _INTEGER_BINARY_OPERATORS \
+                and types[left] == types[right] == BOOL:
+            function = self._integer(function)
+        result = context.add_step(function, [left, right])
+        types[result] = type_
+        return result
+
+    def compile_unary(self, context, operator, operand):
+        # type: (_PlanContext, str, Tuple[str, int]) -> Tuple[str, int]
+        try:
+            function = self.unary_operators[operator]
+        except KeyError:
+            raise ExpressionError("Unsupported operator '{}'"
+                                  .format(operator))
+
+        if self.type_checker is None:
+            return context.add_step(function, [operand])
+
+        types = context.types
+        type_ = self.type_checker.unary(operator, types[operand])
+        if operator in _INTEGER_UNARY_OPERATORS and types[operand] == BOOL:
+            function = self._integer(function)
+        result = context.add_step(function, [operand])
+        types[result] = type_
+        return result
+
+    def _integer(self, function):
+        # type: (Any) -> Any
+        """Return `function` evaluated in 64-bit integers."""
+        numpy = _import_numpy()
+        return functools.partial(function, dtype=numpy.int64)
+
+    def compile_function(self, context, function, args):
+        # type: (_PlanContext, Any, List[Tuple[str, int]]) -> Tuple[str, int]
+        name = function.name
+        try:
+            callable_ = self.functions[name]
+        except KeyError:
+            raise ExpressionError("Unknown function '{}'".format(name))
+
+        if self.type_checker is not None:
+            types = context.types
+            type_ = self.type_checker.function(name,
+                                               [types[arg] for arg in args])
+            result = self._compile_call(context, name, callable_, args)
+            types[result] = type_
+            return result
+
+        return self._compile_call(context, name, callable_, args)
+
+    def _compile_call(self, context, name, callable_, args):
+        # type: (_PlanContext, str, Any, List[Tuple[str, int]]) -> Tuple[str, int]
+        nin = getattr(callable_, "nin", None)
+
+        if nin == 2 and len(args) > 2:
+            # Fold variadic calls of binary ufuncs such as min and max
+            result = context.add_step(callable_, args[:2])
+            for arg in args[2:]:
+                result = context.add_step(callable_, [result, arg])
+            return result
+
+        if nin is not None and nin != len(args):
+            raise ExpressionError("Function '{}' expects {} arguments, "
+                                  "{} given".format(name, nin, len(args)))
+
+        return context.add_step(callable_, args)
+
+    def finalize(self, context, obj):
+        # type: (_PlanContext, Tuple[str, int]) -> NumpyPlan
+        return context.plan(obj, self.limits)
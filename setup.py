@@ -1,7 +1,7 @@
 import sys
 from setuptools import setup, find_packages
 
-requirements = ['grako>=3.9.3']
+requirements = []
 
 setup(
     name = "expressions",
@@ -25,6 +25,11 @@ setup(
 
     install_requires = requirements,
 
+    extras_require = {
+        'numpy': ['numpy'],
+        'grako': ['grako>=3.9.3'],
+    },
+
     test_suite = "tests",
 
     # metadata for upload to PyPI
@@ -0,0 +1,70 @@
+# -*- encoding: utf8 -*-
+import unittest
+from expressions import ExpressionError
+from expressions.catalogue import inspect_catalogue
+
+
+TEXTS = [
+    "a + b",
+    "f(a, c.d)",
+    "a +",
+    "a + b",
+    "g(x) * 2",
+    "a $ b",
+]
+
+
+class CatalogueTestCase(unittest.TestCase):
+    def test_inspect(self):
+        report = inspect_catalogue(TEXTS, workers=1)
+
+        self.assertEqual(len(report), 6)
+        self.assertEqual(report.distinct, 5)
+        self.assertIs(report[0], report[3])
+
+        self.assertEqual(report[1].variables, set(["a", "c.d"]))
+        self.assertEqual(report[1].functions, set(["f"]))
+        self.assertEqual(report.variables, set(["a", "b", "c.d", "x"]))
+        self.assertEqual(report.functions, set(["f", "g"]))
+
+        self.assertEqual(report.invalid, [2, 5])
+        self.assertFalse(report.valid)
+        self.assertEqual(report[2].error, "Unexpected end of expression")
+        self.assertEqual(report[2].position, 3)
+        self.assertEqual(report[5].position, 2)
+
+    def test_allowed_names(self):
+        report = inspect_catalogue(TEXTS, variables=["a", "b", "x"],
+                                   functions=["f"], workers=1)
+
+        self.assertEqual(report.invalid, [1, 2, 4, 5])
+        self.assertEqual(report[1].unknown_variables, set(["c.d"]))
+        self.assertEqual(report[1].messages,
+                         ["Variable 'c.d' is not allowed"])
+        self.assertEqual(report[4].messages,
+                         ["Function 'g' is not allowed"])
+        self.assertEqual(report[2].messages,
+                         ["Unexpected end of expression (at position 3)"])
+        self.assertTrue(report[0].valid)
+
+    def test_workers(self):
+        texts = ["v{} + f(w{})".format(i % 50, i) for i in range(200)]
+        texts.append("bad +")
+
+        expected = inspect_catalogue(texts, workers=1)
+        report = inspect_catalogue(texts, workers=2, chunk_size=30)
+
+        self.assertEqual(report.distinct, expected.distinct)
+        self.assertEqual(report.invalid, [200])
+        for result, other in zip(report, expected):
+            self.assertEqual(result.text, other.text)
+            self.assertEqual(result.variables, other.variables)
+            self.assertEqual(result.functions, other.functions)
+
+    def test_empty(self):
+        report = inspect_catalogue([])
+        self.assertEqual(len(report), 0)
+        self.assertTrue(report.valid)
+
+        with self.assertRaises(ExpressionError):
+            inspect_catalogue(TEXTS, chunk_size=0)
@@ -0,0 +1,84 @@
+# -*- encoding: utf8 -*-
+import unittest
+from expressions import ExpressionError
+from expressions.evaluator import PythonCodeCompiler, Evaluator
+
+
+class PythonCodeCompilerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.compiler = PythonCodeCompiler()
+
+    def evaluate(self, text, row=None):
+        return self.compiler.compile(text)(row or {})
+
+    def test_arithmetic(self):
+        self.assertEqual(self.evaluate("1 + 2 * 3"), 7)
+        self.assertEqual(self.evaluate("7 / 2"), 3.5)
+        self.assertEqual(self.evaluate("7 // 2"), 3)
+        self.assertEqual(self.evaluate("7 % 4"), 3)
+        self.assertEqual(self.evaluate("2 ^ 3 ^ 2"), 512)
+        self.assertEqual(self.evaluate("-2 ^ 2"), -4)
+        self.assertEqual(self.evaluate("~1 & 7 | 8 << 1 >> 1"), 14)
+
+    def test_logical(self):
+        self.assertEqual(self.evaluate("1 < 2 and not 2 < 1"), True)
+        self.assertEqual(self.evaluate("0 or 'x'"), "x")
+        self.assertEqual(self.evaluate("1 is 1.0"), True)
+        self.assertEqual(self.evaluate("'a' in 'abc'"), True)
+
+    def test_variables(self):
+        evaluator = self.compiler.compile("(amount / transactions) * 2")
+        self.assertIsInstance(evaluator, Evaluator)
+        self.assertEqual(evaluator.variables, ["amount", "transactions"])
+        self.assertEqual(evaluator({"amount": 10, "transactions": 4}), 5.0)
+
+        rows = [{"amount": 1, "transactions": 1},
+                {"amount": 3, "transactions": 2}]
+        self.assertEqual(list(evaluator.evaluate(rows)), [2.0, 3.0])
+
+        self.assertEqual(self.evaluate("foo.bar + 1", {"foo.bar": 1}), 2)
+
+    def test_schema(self):
+        evaluator = self.compiler.compile("b - a", ["a", "b"])
+        self.assertEqual(evaluator((1, 10)), 9)
+
+        evaluator = self.compiler.compile("b - a", {"a": "x", "b": "y"})
+        self.assertEqual(evaluator({"x": 1, "y": 10}), 9)
+
+        with self.assertRaises(ExpressionError):
+            self.compiler.compile("c", ["a", "b"])
+
+    def test_functions(self):
+        self.assertEqual(self.evaluate("max(1, 3, 2)"), 3)
+        self.assertEqual(self.evaluate("sqrt(16)"), 4.0)
+
+        compiler = PythonCodeCompiler(functions={"twice": lambda x: 2 * x})
+        self.assertEqual(compiler.compile("twice(2)")({}), 4)
+
+        with self.assertRaises(ExpressionError):
+            compiler.compile("max(1, 2)")
+
+    def test_no_builtins(self):
+        with self.assertRaises(ExpressionError):
+            self.compiler.compile("open('/etc/passwd')")
+
+        evaluator = self.compiler.compile("1")
+        self.assertEqual(evaluator.function.__globals__["__builtins__"], {})
+
+    def test_too_deep(self):
+        with self.assertRaises(ExpressionError):
+            self.compiler.compile("-" * 5000 + "a")
+
+    def test_common_subexpressions(self):
+        evaluator = self.compiler.compile_many(["revenue - cost",
+                                                "(revenue - cost) / revenue",
+                                                "(revenue - cost) * fx.rate"])
+        self.assertEqual(evaluator.source.count("-"), 1)
+
+        row = {"revenue": 10, "cost": 4, "fx.rate": 2}
+        self.assertEqual(evaluator(row), (6, 0.6, 12))
+
+        # Not evaluated unless the condition holds
+        evaluator = self.compiler.compile_many(["x != 0 and y / x",
+                                                "x == 0 or y / x"])
+        self.assertEqual(evaluator({"x": 0, "y": 1}), (False, True))
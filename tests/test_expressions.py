@@ -1,4 +1,5 @@
 # -*- encoding: utf8 -*-
+import pickle
 import unittest
 from expressions import Compiler, ExpressionInspector
 from expressions import Variable, Function, UnaryOperator, BinaryOperator
@@ -111,6 +112,72 @@ class CompilerTestCase(unittest.TestCase):
         result = compiler.compile("f(x, y)")
         self.assertEqual("CALL f(x, y)", result)
 
+    def test_structural_equality(self):
+        compiler = Compiler()
+        left = compiler.compile("(a - b) * f(x, 1) + -c")
+        right = compiler.compile("(a-b) * f(x,1) + - c")
+
+        self.assertEqual(left, right)
+        self.assertEqual(hash(left), hash(right))
+        self.assertNotEqual(left, compiler.compile("(a - b) * f(x, 2) + -c"))
+        self.assertNotEqual(left, compiler.compile("(a - b) * g(x, 1) + -c"))
+        self.assertNotEqual(left.left, left.right)
+
+        # Literals of different types give different results
+        self.assertNotEqual(compiler.compile("x // 2"),
+                            compiler.compile("x // 2.0"))
+        self.assertNotEqual(hash(compiler.compile("x // 2")),
+                            hash(compiler.compile("x // 2.0")))
+
+    def test_unhashable_operands(self):
+        class ListCompiler(Compiler):
+            def compile_variable(self, context, variable):
+                return [variable.name]
+
+        compiler = ListCompiler()
+        left = compiler.compile("f(a) + -b")
+        self.assertEqual(left, compiler.compile("f(a) + -b"))
+        self.assertNotEqual(left, compiler.compile("f(a) + -c"))
+        with self.assertRaises(TypeError):
+            hash(left)
+
+    def test_deep_equality(self):
+        compiler = Compiler()
+        text = "a" + " + a" * 10000
+        left = compiler.compile(text)
+        right = compiler.compile(text)
+
+        self.assertIsNot(left, right)
+        self.assertEqual(left, right)
+        self.assertEqual(hash(left), hash(right))
+        self.assertNotEqual(left, compiler.compile(text + " + b"))
+        self.assertNotEqual(left, compiler.compile("b" + " + a" * 10000))
+        self.assertIn(left, set([right]))
+
+    def test_compact_nodes(self):
+        compiler = Compiler()
+        node = compiler.compile("f(a.b) + -a.b")
+
+        self.assertFalse(hasattr(node, "__dict__"))
+        with self.assertRaises(AttributeError):
+            node.operator = "-"
+        with self.assertRaises(AttributeError):
+            node.right.operand.name = "c"
+
+        # Variables are interned and keep the public attributes
+        self.assertIs(node.left.args[0], node.right.operand)
+        self.assertIs(compiler.compile("a.b"), node.right.operand)
+        self.assertEqual(node.right.operand.reference, ["a", "b"])
+        self.assertEqual(node.left.reference, ["f"])
+        self.assertEqual(node.left.name, "f")
+        node.left.args.append(1)
+        self.assertEqual(node.left.args, [node.right.operand])
+
+        copy = pickle.loads(pickle.dumps(node))
+        self.assertEqual(copy, node)
+        self.assertIs(copy.right.operand, node.right.operand)
+
+
 class CustomCompilersTestCase(unittest.TestCase):
     def test_preprocessor(self):
         pp = ExpressionInspector()
@@ -0,0 +1,82 @@
+# -*- encoding: utf8 -*-
+import pickle
+import unittest
+from expressions import ExpressionError, ExpressionCycleError
+from expressions.fields import FieldGraph
+
+
+FIELDS = [
+    ("sales.margin_pct", "sales.margin / sales.revenue"),
+    ("sales.margin", "sales.revenue - sales.cost"),
+    ("sales.flag", "sales.margin_pct > 0.5"),
+    ("tax", "round(sales.revenue * rate)"),
+]
+
+
+class FieldGraphTestCase(unittest.TestCase):
+    def test_graph(self):
+        graph = FieldGraph(FIELDS)
+        self.assertEqual(graph.order, ["sales.margin", "sales.margin_pct",
+                                       "sales.flag", "tax"])
+        self.assertEqual(graph.inputs, set(["sales.revenue", "sales.cost",
+                                            "rate"]))
+        self.assertEqual(graph.downstream(["sales.cost"]),
+                         ["sales.margin", "sales.margin_pct", "sales.flag"])
+        self.assertEqual(graph.downstream(["rate"]), ["tax"])
+
+        values = graph.evaluate({"sales.revenue": 10, "sales.cost": 4,
+                                 "rate": 0.2})
+        self.assertEqual(values["sales.margin"], 6)
+        self.assertEqual(values["sales.flag"], True)
+        self.assertEqual(values["tax"], 2)
+
+    def test_errors(self):
+        with self.assertRaises(ExpressionCycleError) as cm:
+            FieldGraph({"a": "b + 1", "b": "c * a", "c": "1"})
+        self.assertIn(cm.exception.cycle, [["a", "b", "a"],
+                                           ["b", "a", "b"]])
+        with self.assertRaises(ExpressionCycleError):
+            FieldGraph({"a": "a + 1"})
+
+        error = pickle.loads(pickle.dumps(ExpressionCycleError(["a", "a"])))
+        self.assertEqual(error.cycle, ["a", "a"])
+
+        graph = FieldGraph(FIELDS)
+        with self.assertRaises(ExpressionError):
+            graph.evaluate({"sales.revenue": 10, "sales.cost": 4})
+        with self.assertRaises(ExpressionError):
+            graph.evaluate({"sales.revenue": 10, "sales.cost": 4,
+                            "rate": 0.2, "tax": 1})
+
+    def test_update(self):
+        graph = FieldGraph(FIELDS)
+        values = graph.values({"sales.revenue": 10, "sales.cost": 4,
+                               "rate": 0.2})
+
+        self.assertEqual(values.update({"rate": 0.3}), {"tax": 3})
+        self.assertEqual(values.evaluations, 1)
+
+        changes = values.update({"sales.cost": 5})
+        self.assertEqual(changes, {"sales.margin": 5,
+                                   "sales.margin_pct": 0.5,
+                                   "sales.flag": False})
+        self.assertEqual(values.evaluations, 4)
+
+        # Unchanged values are not propagated
+        self.assertEqual(values.update({"sales.cost": 5}), {})
+        self.assertEqual(values.update({"sales.cost": 5, "rate": 0.31}), {})
+        self.assertEqual(values.evaluations, 5)
+
+        full = graph.evaluate({"sales.revenue": 10, "sales.cost": 5,
+                               "rate": 0.31})
+        self.assertEqual(values.values, full)
+
+    def test_failed_update(self):
+        graph = FieldGraph(FIELDS)
+        values = graph.values({"sales.revenue": 10, "sales.cost": 4,
+                               "rate": 0.2})
+        before = dict(values.values)
+
+        with self.assertRaises(ZeroDivisionError):
+            values.update({"sales.revenue": 0})
+        self.assertEqual(values.values, before)
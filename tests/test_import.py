@@ -0,0 +1,34 @@
+# -*- encoding: utf8 -*-
+import subprocess
+import sys
+import unittest
+
+
+MODULES = "import sys; print(' '.join(sorted(sys.modules)))"
+
+# Modules which must not be loaded by `import expressions`
+LAZY = ["grako", "expressions.grammar", "expressions.semantics",
+        "expressions.parser", "expressions.optimizer",
+        "expressions.instrumentation", "typing", "re"]
+
+
+def loaded_modules(code):
+    output = subprocess.check_output([sys.executable, "-c",
+                                      code + "; " + MODULES])
+    return set(output.decode("ascii").split())
+
+
+class ImportTestCase(unittest.TestCase):
+    def test_lazy_import(self):
+        interpreter = loaded_modules("pass")
+        package = loaded_modules("import expressions") - interpreter
+
+        self.assertIn("expressions", package)
+        for module in LAZY:
+            self.assertNotIn(module, package)
+
+    def test_parser_loaded_on_parse(self):
+        modules = loaded_modules("import expressions; "
+                                 "expressions.inspect_variables('a + b')")
+        self.assertIn("expressions.parser", modules)
+        self.assertNotIn("expressions.grammar", modules)
@@ -0,0 +1,73 @@
+# -*- encoding: utf8 -*-
+import unittest
+from expressions import Compiler, ExpressionCache, parse_expression
+from expressions.instrumentation import Instrumentation, expression_depth
+
+
+class InstrumentationTestCase(unittest.TestCase):
+    def test_record(self):
+        records = []
+        instrumentation = Instrumentation(records.append)
+        compiler = Compiler(cache=ExpressionCache(),
+                            instrumentation=instrumentation)
+
+        result = compiler.compile("f(a.b, 1) + -c")
+        self.assertEqual(str(result), "(f(a.b, 1) + (- c))")
+        compiler.compile("f(a.b, 1) + -c")
+
+        self.assertEqual(len(records), 2)
+        stats = records[0]
+        self.assertEqual(stats["nodes"], {"literal": 1, "variable": 2,
+                                          "function": 1, "unary": 1,
+                                          "binary": 1})
+        self.assertEqual(stats["size"], 6)
+        self.assertEqual(stats["depth"], 3)
+        self.assertEqual(stats["tokens"], 9)
+        self.assertEqual(set(stats["times"]),
+                         set(["parse", "compile", "finalize"]))
+        self.assertFalse(stats["cached"])
+        self.assertTrue(records[1]["cached"])
+
+        totals = instrumentation.as_dict()
+        self.assertEqual(totals["compilations"], 2)
+        self.assertEqual(totals["cache_hits"], 1)
+        self.assertEqual(totals["nodes"]["variable"], 4)
+        self.assertEqual(totals["max_depth"], 3)
+        self.assertGreater(totals["times"]["parse"], 0)
+
+        # Uncached compilation counts the tokens of the single parse
+        compiler = Compiler(cache=False, instrumentation=Instrumentation())
+        compiler.compile("a + 1")
+        self.assertEqual(compiler.instrumentation.tokens, 3)
+        self.assertEqual(parse_expression("f(a.b, 1) + -c").tokens, 9)
+
+    def test_context_manager(self):
+        compiler = Compiler(optimize=True)
+        with compiler.instrument() as stats:
+            compiler.compile("1 + 2")
+        compiler.compile("3 + 4")
+
+        self.assertIsNone(compiler.instrumentation)
+        self.assertEqual(stats.compilations, 1)
+        self.assertEqual(stats.nodes["literal"], 1)
+        self.assertGreater(stats.times["optimize"], 0)
+
+    def test_lookup(self):
+        compiler = Compiler(cache=ExpressionCache(), optimize=True)
+        times = {}
+        parsed, cached = compiler.lookup("a + 1 * 2", times)
+        self.assertFalse(cached)
+        self.assertEqual(len(parsed), 3)
+        self.assertEqual(parsed.tokens, 5)
+        self.assertEqual(set(times), set(["parse", "optimize"]))
+
+        parsed, cached = compiler.lookup("a + 1 * 2")
+        self.assertTrue(cached)
+        self.assertEqual(compiler.parse("a + 1 * 2").instructions,
+                         parsed.instructions)
+
+    def test_depth(self):
+        self.assertEqual(expression_depth(parse_expression("a")), 1)
+        self.assertEqual(expression_depth(parse_expression("f()")), 1)
+        self.assertEqual(expression_depth(parse_expression("((a)) + b * c")),
+                         3)
@@ -0,0 +1,107 @@
+# -*- encoding: utf8 -*-
+import pickle
+import unittest
+from expressions import Compiler, ExpressionInspector, ExpressionLimitError, \
+                        Limits
+from expressions.evaluator import PythonCodeCompiler
+from expressions.instrumentation import Instrumentation
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+else:
+    from expressions.vectorized import NumpyCompiler
+
+
+class CompilationLimitsTestCase(unittest.TestCase):
+    def assertExceeds(self, limit, compiler, text):
+        with self.assertRaises(ExpressionLimitError) as cm:
+            compiler.compile(text)
+        self.assertEqual(cm.exception.limit, limit)
+        return cm.exception
+
+    def test_limits(self):
+        compiler = Compiler(limits=Limits(max_length=20, max_depth=4,
+                                          max_nodes=7, max_arguments=2,
+                                          max_string=3))
+        compiler.compile("f(a, 'abc') + b")
+
+        error = self.assertExceeds("max_length", compiler, "a" * 21)
+        self.assertEqual((error.value, error.maximum), (21, 20))
+        self.assertExceeds("max_depth", compiler, "-(-(-(-a)))")
+        self.assertExceeds("max_nodes", compiler, "a+a+a+a+a")
+        self.assertExceeds("max_arguments", compiler, "f(a, b, c)")
+        self.assertExceeds("max_string", compiler, "'abcd'")
+
+    def test_cached(self):
+        text = "a + b + c"
+        Compiler().compile(text)
+        compiler = Compiler(limits=Limits(max_nodes=3))
+        self.assertExceeds("max_nodes", compiler, text)
+
+        compiler = Compiler(cache=False, limits=Limits(max_nodes=3))
+        self.assertExceeds("max_nodes", compiler, text)
+
+        compiler = Compiler(limits=Limits(max_nodes=3),
+                            instrumentation=Instrumentation())
+        self.assertExceeds("max_nodes", compiler, text)
+
+    def test_inspector(self):
+        for validate in [True, False]:
+            inspector = ExpressionInspector(validate=validate,
+                                            limits=Limits(max_length=5))
+            self.assertEqual(inspector.compile("a + b")[0], set(["a", "b"]))
+            self.assertExceeds("max_length", inspector, "a + bc")
+
+    def test_pickle(self):
+        error = pickle.loads(pickle.dumps(ExpressionLimitError("max_depth",
+                                                               5, 4)))
+        self.assertEqual((error.limit, error.value, error.maximum),
+                         ("max_depth", 5, 4))
+
+
+class EvaluationLimitsTestCase(unittest.TestCase):
+    def test_evaluator_steps(self):
+        compiler = PythonCodeCompiler(limits=Limits(max_steps=30))
+        evaluator = compiler.compile("a + 1")
+        self.assertEqual(evaluator.size, 3)
+
+        rows = [{"a": i} for i in range(20)]
+        self.assertEqual(list(evaluator.evaluate(rows[:10])),
+                         list(range(1, 11)))
+
+        results = evaluator.evaluate(rows)
+        with self.assertRaises(ExpressionLimitError):
+            list(results)
+
+        copy = pickle.loads(pickle.dumps(evaluator))
+        with self.assertRaises(ExpressionLimitError):
+            list(copy.evaluate(rows))
+
+    def test_evaluator_time(self):
+        compiler = PythonCodeCompiler(limits=Limits(max_time=0.01))
+        evaluator = compiler.compile("a + 1")
+
+        def rows():
+            while True:
+                yield {"a": 1}
+
+        with self.assertRaises(ExpressionLimitError) as cm:
+            for _ in evaluator.evaluate(rows()):
+                pass
+        self.assertEqual(cm.exception.limit, "max_time")
+
+    @unittest.skipIf(numpy is None, "NumPy is not available")
+    def test_numpy_plan(self):
+        plan = NumpyCompiler(limits=Limits(max_steps=1000)).compile("a * 2")
+        columns = {"a": numpy.arange(100)}
+        self.assertEqual(plan.execute(columns)[-1], 198)
+        self.assertEqual(plan.execute_blocked(columns, block_size=7)[-1],
+                         198)
+
+        columns = {"a": numpy.arange(2000)}
+        with self.assertRaises(ExpressionLimitError):
+            plan.execute(columns)
+        with self.assertRaises(ExpressionLimitError):
+            plan.execute_blocked(columns)
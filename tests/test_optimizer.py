@@ -0,0 +1,102 @@
+# -*- encoding: utf8 -*-
+import unittest
+from expressions import parse_expression, ExpressionError
+from expressions.optimizer import optimize_expression
+from expressions.evaluator import PythonCodeCompiler
+from expressions.sql import SQLCompiler
+
+from .test_parser import TracingCompiler
+
+
+class OptimizerTestCase(unittest.TestCase):
+    def optimize(self, text):
+        compiler = TracingCompiler(cache=False)
+        compiler.optimize = True
+        return compiler.compile(text)
+
+    def test_folding(self):
+        self.assertEqual(self.optimize("price * (1 + 0.2)"), "(price * 1.2)")
+        self.assertEqual(self.optimize("2 ^ 10"), "1024")
+        self.assertEqual(self.optimize("-2 ^ 2"), "-4")
+        self.assertEqual(self.optimize("'a' + 'b'"), "'ab'")
+        self.assertEqual(self.optimize("7 // 2 + (1 << 4)"), "19")
+        self.assertEqual(self.optimize("f(1 + 1)"), "f(2)")
+
+    def test_identities(self):
+        self.assertEqual(self.optimize("(x - y) * 1"), "(x - y)")
+        self.assertEqual(self.optimize("0 + x / y"), "(x / y)")
+        self.assertEqual(self.optimize("(x ^ 2 + 1.5) - 0"),
+                         "((x ^ 2) + 1.5)")
+        self.assertEqual(self.optimize("- - (x // 2)"), "(x // 2)")
+        self.assertEqual(self.optimize("x / 4.0"), "(x * 0.25)")
+
+        # Variables may be booleans or strings: `True + 0` is 1
+        for text in ["x * 1", "0 + y", "x - 0", "- - x", "x ^ 1", "x ^ 2",
+                     "(x + y) * 1"]:
+            parsed = parse_expression(text)
+            self.assertEqual(len(optimize_expression(parsed)), len(parsed),
+                             text)
+
+    def test_functions(self):
+        # Only functions of the compiler are folded
+        self.assertEqual(self.optimize("sqrt(16) * x"), "(sqrt(16) * x)")
+
+        compiler = PythonCodeCompiler(optimize=True)
+        self.assertEqual(len(compiler.parse("sqrt(16) * x")), 3)
+        compiler = PythonCodeCompiler({"sqrt": lambda x: -x},
+                                      optimize=True)
+        self.assertEqual(compiler.compile("sqrt(16)")({}), -16)
+        compiler = PythonCodeCompiler({}, optimize=True)
+        with self.assertRaises(ExpressionError):
+            compiler.compile("sqrt(16)")
+        self.assertEqual(SQLCompiler(optimize=True).compile("sqrt(16)").sql,
+                         "sqrt(?1)")
+
+    def test_preserved(self):
+        # Not folded: semantics differ between backends, errors, logic
+        for text in ["7 / 2", "1 / 0",
+                     "1 and x", "0 or x", "x / 3.0", "x * 1.0", "x * 0",
+                     "1 < 2", "2 ^ 100", "(a + b) ^ 2", "rand()"]:
+            parsed = parse_expression(text)
+            self.assertEqual(len(optimize_expression(parsed)), len(parsed),
+                             text)
+
+        self.assertEqual(self.optimize("-7 // 2"), "(-7 // 2)")
+        self.assertEqual(self.optimize("7 % -2"), "(7 % -2)")
+        self.assertEqual(self.optimize("sqrt(-1)"), "sqrt(-1)")
+
+    def test_callback_order(self):
+        compiler = TracingCompiler(cache=False)
+        compiler.optimize = True
+        compiler.compile("a + (2 * 3) - b")
+        self.assertEqual(compiler.trace, [
+            ("variable", "a"),
+            ("literal", 6),
+            ("variable", "b"),
+            ("binary", "+"),
+            ("binary", "-"),
+        ])
+
+    def test_same_results(self):
+        texts = ["price * (1 + 0.2) - 2 ^ 3", "x ^ 2 + x / 2.0 + - - (x - 1)",
+                 "max(1, 2) * x + 0", "7 // 2 * x % 5"]
+        plain = PythonCodeCompiler()
+        optimizing = PythonCodeCompiler(optimize=True)
+        row = {"price": 10, "x": 3}
+
+        for text in texts:
+            self.assertEqual(plain.compile(text)(row),
+                             optimizing.compile(text)(row), text)
+            self.assertLess(len(optimizing.parse(text)),
+                            len(plain.parse(text)), text)
+
+    def test_negative_literals(self):
+        plain = PythonCodeCompiler()
+        optimizing = PythonCodeCompiler(optimize=True)
+
+        for x in [-2, -1, 0, 1, 2, 3]:
+            self.assertEqual(optimizing.compile("(-2) ^ x")({"x": x}),
+                             plain.compile("(-2) ^ x")({"x": x}), x)
+        self.assertEqual(optimizing.compile("-3 * 0.5")({}), -1.5)
+        self.assertEqual(optimizing.compile("-3 * 0.5 ^ x")({"x": 2}),
+                         plain.compile("-3 * 0.5 ^ x")({"x": 2}))
@@ -0,0 +1,75 @@
+# -*- encoding: utf8 -*-
+import unittest
+from expressions import ExpressionError
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+else:
+    from expressions.evaluator import PythonCodeCompiler
+    from expressions.vectorized import NumpyCompiler
+    from expressions.parallel import ParallelExecutor
+
+
+@unittest.skipIf(numpy is None, "NumPy or shared memory is not available")
+class ParallelExecutorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.columns = {
+            "a": numpy.arange(1000, dtype=numpy.float64),
+            "b": numpy.arange(1000, dtype=numpy.int64) % 7,
+        }
+
+    def test_numpy_plan(self):
+        plan = NumpyCompiler().compile("a * b + sqrt(a) - 1")
+        expected = plan.execute(self.columns)
+
+        with ParallelExecutor(plan, workers=2, chunk_size=99) as executor:
+            result = executor.execute(self.columns)
+            self.assertTrue(numpy.allclose(result, expected))
+
+            # The pool is reused
+            out = numpy.zeros(1000)
+            executor.execute(self.columns, out=out)
+            self.assertTrue(numpy.allclose(out, expected))
+
+    def test_evaluator(self):
+        evaluator = PythonCodeCompiler().compile("a > 500 and b == 3",
+                                                 ["a", "b"])
+        with ParallelExecutor(evaluator, workers=2,
+                              chunk_size=300) as executor:
+            result = executor.execute(self.columns)
+
+        expected = [evaluator((a, b)) for a, b
+                    in zip(self.columns["a"], self.columns["b"])]
+        self.assertEqual(result.dtype, numpy.bool_)
+        self.assertEqual(list(result), expected)
+
+    def test_evaluator_dtype(self):
+        evaluator = PythonCodeCompiler().compile("a ^ b")
+        columns = {"a": numpy.array([2, 2, 2, 2]),
+                   "b": numpy.array([1, -1, 2, -2])}
+
+        # Type of the first result would truncate the later ones
+        with ParallelExecutor(evaluator, workers=1) as executor:
+            with self.assertRaises(ExpressionError):
+                executor.execute(columns)
+            out = numpy.zeros(4)
+            executor.execute(columns, out=out)
+            self.assertEqual(list(out), [2, 0.5, 4, 0.25])
+
+        with ParallelExecutor(evaluator, workers=1,
+                              dtype=numpy.float64) as executor:
+            self.assertEqual(list(executor.execute(columns)),
+                             [2, 0.5, 4, 0.25])
+
+    def test_errors(self):
+        with self.assertRaises(ExpressionError):
+            ParallelExecutor("a + b")
+
+        plan = NumpyCompiler().compile("a + b")
+        with ParallelExecutor(plan, workers=1) as executor:
+            with self.assertRaises(ExpressionError):
+                executor.execute({"a": numpy.zeros(3), "b": numpy.zeros(2)})
+            with self.assertRaises(ExpressionError):
+                executor.execute(self.columns, out=numpy.zeros(3))
@@ -0,0 +1,137 @@
+# -*- encoding: utf8 -*-
+import unittest
+from expressions import Compiler, ExpressionCache, ExpressionInspector
+from expressions import ExpressionSyntaxError, parse_expression
+from expressions import merge_expressions
+from expressions import BinaryOperator
+
+from .test_parser import TracingCompiler, EXPRESSIONS, grako
+
+
+class ParsedExpressionTestCase(unittest.TestCase):
+    def test_replay_same_as_compile(self):
+        for text in EXPRESSIONS:
+            compiler = TracingCompiler()
+            expected = compiler.compile(text)
+
+            replayed = TracingCompiler()
+            parsed = parse_expression(text)
+            self.assertEqual(parsed.replay(replayed), expected)
+            self.assertEqual(replayed.trace, compiler.trace)
+
+    def test_replay_into_different_compilers(self):
+        parsed = parse_expression("foo(a + b) * bar(b + c)")
+
+        result = parsed.replay(Compiler())
+        self.assertIsInstance(result, BinaryOperator)
+        self.assertEqual(result.operator, "*")
+
+        variables, functions = parsed.replay(ExpressionInspector())
+        self.assertEqual(variables, set(["a", "b", "c"]))
+        self.assertEqual(functions, set(["foo", "bar"]))
+
+    def test_replay_context(self):
+        class ContextCompiler(Compiler):
+            def compile_variable(self, context, variable):
+                return context[variable.name]
+
+        parsed = parse_expression("a")
+        compiler = ContextCompiler()
+        self.assertEqual(parsed.replay(compiler, {"a": 1}), 1)
+        self.assertEqual(parsed.replay(compiler, {"a": 2}), 2)
+
+
+class ExpressionCacheTestCase(unittest.TestCase):
+    def test_hits_and_misses(self):
+        cache = ExpressionCache()
+        compiler = Compiler(cache=cache)
+
+        compiler.compile("a + b")
+        compiler.compile("a + b")
+        compiler.compile("a - b")
+
+        info = cache.info()
+        self.assertEqual(info.hits, 1)
+        self.assertEqual(info.misses, 2)
+        self.assertEqual(info.currsize, 2)
+
+        cache.clear()
+        self.assertEqual(cache.info(), (0, 0, 1024, 0))
+
+    def test_lookup(self):
+        cache = ExpressionCache()
+        parsed, hit = cache.lookup("a + b")
+        self.assertFalse(hit)
+        self.assertEqual(cache.lookup("a + b"), (parsed, True))
+
+    @unittest.skipIf(grako is None, "Grako is not available")
+    def test_parsers_are_cached_separately(self):
+        cache = ExpressionCache()
+        native = cache.parse("a + b")
+        generated = cache.parse("a + b", "grako")
+        self.assertIsNot(native, generated)
+        self.assertEqual(cache.info().misses, 2)
+        self.assertIs(cache.parse("a + b", "grako"), generated)
+
+    def test_least_recently_used(self):
+        cache = ExpressionCache(maxsize=2)
+        cache.parse("a")
+        cache.parse("b")
+        cache.parse("a")
+        cache.parse("c")
+
+        self.assertIn("a", cache)
+        self.assertIn("c", cache)
+        self.assertNotIn("b", cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_errors_are_not_cached(self):
+        cache = ExpressionCache()
+        compiler = Compiler(cache=cache)
+
+        with self.assertRaises(ExpressionSyntaxError):
+            compiler.compile("a +")
+        self.assertEqual(len(cache), 0)
+
+    def test_no_cache(self):
+        compiler = Compiler(cache=False)
+        self.assertIsNone(compiler.cache)
+        self.assertEqual(compiler.compile("1"), 1)
+
+
+class ExpressionBatchTestCase(unittest.TestCase):
+    def test_merge(self):
+        texts = ["revenue - cost", "(revenue - cost) / revenue",
+                 "(revenue-cost) * fx.rate"]
+        batch = merge_expressions([parse_expression(text) for text in texts])
+
+        # revenue, cost, -, /, fx.rate, *
+        self.assertEqual(len(batch), 6)
+        self.assertEqual(batch.roots, [2, 3, 5])
+        self.assertEqual([i for i, shared in enumerate(batch.shared)
+                          if shared], [2])
+
+    def test_literals_are_typed(self):
+        batch = merge_expressions([parse_expression("1 + 1.0")])
+        self.assertEqual(len(batch), 3)
+
+    def test_conditional_not_shared(self):
+        texts = ["x != 0 and y / x", "x == 0 or y / x"]
+        batch = merge_expressions([parse_expression(text) for text in texts])
+        self.assertEqual(batch.shared, [False] * len(batch))
+
+        texts.append("y / x + 1")
+        batch = merge_expressions([parse_expression(text) for text in texts])
+        self.assertEqual(sum(batch.shared), 1)
+
+    def test_compile_many(self):
+        compiler = TracingCompiler()
+        results = compiler.compile_many(["a + b * c", "(a + b * c) - b * c"])
+
+        self.assertEqual(results, ["(a + (b * c))",
+                                   "((a + (b * c)) - (b * c))"])
+        self.assertEqual(compiler.trace.count(("binary", "*")), 1)
+        self.assertEqual(compiler.trace.count(("variable", "b")), 1)
+
+        results = Compiler().compile_many(["a + b", "a + b"])
+        self.assertIs(results[0], results[1])
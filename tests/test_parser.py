@@ -0,0 +1,298 @@
+# -*- encoding: utf8 -*-
+import random
+import unittest
+from expressions import Compiler, ExpressionSyntaxError, ExpressionError, \
+                        ExpressionInspector, inspect_variables
+from expressions.parser import scan_names
+
+
+try:
+    import grako
+except ImportError:
+    grako = None
+
+
+class TracingCompiler(Compiler):
+    """Compiler that records all the compilation calls and returns string
+    representation of the expression."""
+
+    def __init__(self, parser=None, cache=False):
+        super(TracingCompiler, self).__init__(parser=parser, cache=cache)
+        self.trace = []
+
+    def compile_literal(self, context, literal):
+        self.trace.append(("literal", literal))
+        return repr(literal)
+
+    def compile_variable(self, context, variable):
+        self.trace.append(("variable", variable.name))
+        return variable.name
+
+    def compile_binary(self, context, operator, left, right):
+        self.trace.append(("binary", operator))
+        return "({} {} {})".format(left, operator, right)
+
+    def compile_unary(self, context, operator, operand):
+        self.trace.append(("unary", operator))
+        return "({} {})".format(operator, operand)
+
+    def compile_function(self, context, function, args):
+        self.trace.append(("function", function.name))
+        return "{}({})".format(function.name, ", ".join(args))
+
+
+EXPRESSIONS = [
+    "1",
+    "a + b * c - d",
+    "a or b and not c",
+    "not not a == b",
+    "-a ^ 2",
+    "a ^ -b ^ c",
+    "~a & b | c << 2 >> 1",
+    "a // b % c / d",
+    "a <= b and c >= d or e != f",
+    "x in y is z",
+    "f(a, g.h(b + 1), 'x') * (c - 1)",
+    "foo.bar.baz # comment",
+    "f()",
+]
+
+
+class ParserTestCase(unittest.TestCase):
+    def compile(self, text):
+        return TracingCompiler().compile(text)
+
+    def test_precedence(self):
+        self.assertEqual(self.compile("a + b * c"), "(a + (b * c))")
+        self.assertEqual(self.compile("(a + b) * c"), "((a + b) * c)")
+        self.assertEqual(self.compile("a - b - c"), "((a - b) - c)")
+        self.assertEqual(self.compile("a or b and c"), "(a or (b and c))")
+        self.assertEqual(self.compile("not a == b"), "(not (a == b))")
+        self.assertEqual(self.compile("not a and b"), "((not a) and b)")
+        self.assertEqual(self.compile("a | b & c"), "(a | (b & c))")
+        self.assertEqual(self.compile("a < b + 1"), "(a < (b + 1))")
+
+    def test_power(self):
+        self.assertEqual(self.compile("a ^ b"), "(a ^ b)")
+        self.assertEqual(self.compile("a ^ b ^ c"), "(a ^ (b ^ c))")
+        self.assertEqual(self.compile("-a ^ 2"), "(- (a ^ 2))")
+        self.assertEqual(self.compile("2 ^ -a"), "(2 ^ (- a))")
+
+    def test_comparison_operators(self):
+        for operator in ["==", "!=", "<", "<=", ">", ">=", "in", "is"]:
+            self.assertEqual(self.compile("a {} b".format(operator)),
+                             "(a {} b)".format(operator))
+        self.assertEqual(self.compile("a // b"), "(a // b)")
+
+    def test_callback_order(self):
+        compiler = TracingCompiler()
+        compiler.compile("a + b * c - d")
+        self.assertEqual(compiler.trace, [
+            ("variable", "a"),
+            ("variable", "b"),
+            ("variable", "c"),
+            ("binary", "*"),
+            ("variable", "d"),
+            ("binary", "+"),
+            ("binary", "-"),
+        ])
+
+        compiler = TracingCompiler()
+        compiler.compile("f(x, 1)")
+        self.assertEqual(compiler.trace, [
+            ("variable", "x"),
+            ("literal", 1),
+            ("function", "f"),
+        ])
+
+    def test_references(self):
+        self.assertEqual(self.compile("a .b"), "a.b")
+        self.assertEqual(self.compile("a.5"), "a.5")
+        self.assertEqual(self.compile("not .5"), "(not 0.5)")
+        self.assertEqual(self.compile("a.b (1)"), "a.b(1)")
+
+    def test_syntax_errors(self):
+        invalid = ["", "a +", "(a", "a b", "f(a,)", "a = b", "a == not b",
+                   "AND", "a.or", "1a", "'unterminated", "a $ b", "f(a)(b)"]
+
+        for text in invalid:
+            with self.assertRaises(ExpressionSyntaxError):
+                self.compile(text)
+
+        with self.assertRaises(ExpressionError):
+            self.compile("a +")
+
+    def test_error_position(self):
+        with self.assertRaises(ExpressionSyntaxError) as cm:
+            self.compile("a + * b")
+        self.assertEqual(cm.exception.position, 4)
+
+    def test_unknown_parser(self):
+        with self.assertRaises(ExpressionError):
+            Compiler(parser="unknown")
+
+    @unittest.skipIf(grako is None, "Grako is not available")
+    def test_same_as_grako(self):
+        for text in EXPRESSIONS:
+            native = TracingCompiler(parser="native")
+            generated = TracingCompiler(parser="grako")
+
+            self.assertEqual(native.compile(text), generated.compile(text))
+            self.assertEqual(native.trace, generated.trace)
+
+    @unittest.skipIf(grako is None, "Grako is not available")
+    def test_grako_syntax_errors(self):
+        invalid = ["", "a +", "(a", "a b", "f(a,)", "a = b", "a == not b",
+                   "AND", "a.or", "1a", "'unterminated", "a $ b"]
+
+        for parser in ["native", "grako"]:
+            compiler = Compiler(parser=parser, cache=False)
+            for text in invalid:
+                with self.assertRaises(ExpressionSyntaxError) as cm:
+                    compiler.compile(text)
+                self.assertEqual(cm.exception.text, text)
+
+        with self.assertRaises(ExpressionSyntaxError) as cm:
+            Compiler(parser="grako", cache=False).compile("a + * b")
+        self.assertIsNotNone(cm.exception.position)
+
+    @unittest.skipIf(grako is None, "Grako is not available")
+    def test_grako_nested_compile(self):
+        class NestedCompiler(Compiler):
+            def compile_variable(self, context, variable):
+                if variable.name == "total":
+                    return Compiler(parser="grako",
+                                    cache=False).compile("price * amount")
+                return variable
+
+        compiler = NestedCompiler(parser="grako", cache=False)
+        self.assertEqual(compiler.compile("total - discount"),
+                         Compiler().compile("(price * amount) - discount"))
+
+
+NAMES = ["a", "b", "a.b", "a .b", "a.5", "x.y.z", "order.customer .region",
+         "a #comment\n.b", "\u010das", "in_stock", "nota", "IS_SET"]
+FUNCTIONS = ["f", "round", "a.f", "fx.rate", "coalesce"]
+LITERALS = ["1", ".5", "1e3", "2.5E-3", "'x'", "'f(x)'", "'a # b'",
+            r"'it\'s (a)'", "''"]
+OPERATORS = ["+", "-", "*", "/", "//", "%", "^", "<", "<=", "==", "!=",
+             "and", "or", "in", "is", "&", "|", "<<"]
+
+
+def random_expression(depth):
+    choice = random.random()
+    if depth == 0 or choice < 0.25:
+        if random.random() < 0.6:
+            return random.choice(NAMES)
+        return random.choice(LITERALS)
+    elif choice < 0.45:
+        args = [random_expression(depth - 1)
+                for _ in range(random.randint(0, 3))]
+        space = random.choice(["", " ", " # (\n"])
+        return "{}{}({})".format(random.choice(FUNCTIONS), space,
+                                 ", ".join(args))
+    elif choice < 0.55:
+        operator = random.choice(["-", "+", "~", "not ", "not"])
+        if operator == "not":
+            # `not` directly followed by a dot
+            return "(not .5)"
+        return "({}{})".format(operator, random_expression(depth - 1))
+    elif choice < 0.65:
+        return "({})".format(random_expression(depth - 1))
+    else:
+        return "{} {} {}".format(random_expression(depth - 1),
+                                 random.choice(OPERATORS),
+                                 random_expression(depth - 1))
+
+
+class ScanNamesTestCase(unittest.TestCase):
+    def test_names(self):
+        self.assertEqual(scan_names("f(a, b.c) + g (d) * a"),
+                         (set(["a", "b.c", "d"]), set(["f", "g"])))
+        self.assertEqual(scan_names("a .b + 'f(x)' # g(y)"),
+                         (set(["a.b"]), set()))
+        self.assertEqual(scan_names("not .5 or x"), (set(["x"]), set()))
+        self.assertEqual(scan_names("1"), (set(), set()))
+
+    def test_errors(self):
+        for text in ["a $ b", "a.or", "AND", "'unterminated"]:
+            with self.assertRaises(ExpressionSyntaxError):
+                scan_names(text)
+
+    def test_same_as_inspector(self):
+        state = random.getstate()
+        random.seed(16)
+        try:
+            texts = [random_expression(6) for _ in range(2000)]
+        finally:
+            random.setstate(state)
+
+        # Parentheses and dots inside comments
+        texts += ["a # total (gross)\n", "a # total (gross)", "f # x (\n(b)",
+                  "a # x.b\n - c", "a #c\n.b # (\n(1) + d", "a # x ( .b"]
+
+        for text in texts:
+            expected = ExpressionInspector().compile(text)
+            self.assertEqual(scan_names(text), expected, text)
+            self.assertEqual(ExpressionInspector(validate=False)
+                             .compile(text), expected)
+
+    def test_inspect_variables_validates(self):
+        self.assertEqual(inspect_variables("a + b.c"), set(["a", "b.c"]))
+        for text in ["a +", "a b c", ")))x"]:
+            with self.assertRaises(ExpressionSyntaxError):
+                inspect_variables(text)
+
+
+class DepthCompiler(Compiler):
+    """Compiler that returns depth of the compiled expression tree."""
+
+    def __init__(self):
+        super(DepthCompiler, self).__init__(cache=False)
+
+    def compile_literal(self, context, literal):
+        return 1
+
+    def compile_variable(self, context, variable):
+        return 1
+
+    def compile_binary(self, context, operator, left, right):
+        return max(left, right) + 1
+
+    def compile_unary(self, context, operator, operand):
+        return operand + 1
+
+    def compile_function(self, context, function, args):
+        return max(args or [0]) + 1
+
+
+class DeepExpressionsTestCase(unittest.TestCase):
+    depth = 10000
+
+    def compile(self, text):
+        return DepthCompiler().compile(text)
+
+    def test_nesting(self):
+        depth = self.depth
+        self.assertEqual(self.compile("(" * depth + "a" + ")" * depth), 1)
+        self.assertEqual(self.compile("-" * depth + "a"), depth + 1)
+        self.assertEqual(self.compile("not " * depth + "a"), depth + 1)
+        self.assertEqual(self.compile("f(" * depth + "a" + ")" * depth),
+                         depth + 1)
+        self.assertEqual(self.compile("^".join(["a"] * depth)), depth)
+        self.assertEqual(self.compile("(a + " * depth + "b" + ")" * depth),
+                         depth + 1)
+        self.assertEqual(self.compile("a < (not " * depth + "b"
+                                      + ")" * depth), 2 * depth + 1)
+
+    def test_flat_chain(self):
+        text = " + ".join(["a"] * 100000)
+        self.assertEqual(self.compile(text), 100000)
+
+        variables, _ = ExpressionInspector().compile(text)
+        self.assertEqual(variables, set(["a"]))
+
+    def test_errors(self):
+        with self.assertRaises(ExpressionSyntaxError) as cm:
+            self.compile("(" * self.depth + "a" + ")" * (self.depth - 1))
+        self.assertEqual(cm.exception.position, 2 * self.depth)
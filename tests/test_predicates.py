@@ -0,0 +1,124 @@
+# -*- encoding: utf8 -*-
+import unittest
+from expressions import ExpressionError
+from expressions.predicates import analyze_predicate, Constraint, \
+                                   PredicateFilter, SortedIndex
+
+
+class PredicateAnalysisTestCase(unittest.TestCase):
+    def test_constraints(self):
+        predicate = analyze_predicate("region == 'EU' and amount >= 100 "
+                                      "and amount < 500")
+        self.assertTrue(predicate.sargable)
+        self.assertEqual(len(predicate.conjunctions), 1)
+        self.assertEqual(predicate.conjunctions[0].constraints,
+                         {"region": Constraint(values=["EU"]),
+                          "amount": Constraint(low=100, high=500,
+                                               high_inclusive=False)})
+
+        # Swapped operands, negated inequality, intersection of ranges
+        predicate = analyze_predicate("100 < amount and not (code != 3) "
+                                      "and amount <= 200 and amount < 300")
+        self.assertEqual(predicate.conjunctions[0].constraints,
+                         {"code": Constraint(values=[3]),
+                          "amount": Constraint(low=100, high=200,
+                                               low_inclusive=False)})
+
+    def test_negative_literals(self):
+        predicate = analyze_predicate("amount >= -100 and -5.5 > delta "
+                                      "and - - 3 == code")
+        self.assertTrue(predicate.sargable)
+        self.assertEqual(predicate.conjunctions[0].constraints,
+                         {"amount": Constraint(low=-100),
+                          "delta": Constraint(high=-5.5,
+                                              high_inclusive=False),
+                          "code": Constraint(values=[3])})
+        self.assertFalse(predicate.may_match({"amount": (-200, -101)}))
+
+    def test_normalization(self):
+        predicate = analyze_predicate("region == 'EU' or region is 'US'")
+        self.assertEqual([c.constraints for c in predicate.conjunctions],
+                         [{"region": Constraint(values=["EU", "US"])}])
+
+        predicate = analyze_predicate("(a == 1 or b == 2) and c > 0")
+        self.assertEqual([c.constraints for c in predicate.conjunctions],
+                         [{"a": Constraint(values=[1]),
+                           "c": Constraint(low=0, low_inclusive=False)},
+                          {"b": Constraint(values=[2]),
+                           "c": Constraint(low=0, low_inclusive=False)}])
+
+        # Contradictions are removed
+        self.assertEqual(analyze_predicate("a > 5 and a < 3").conjunctions,
+                         [])
+        self.assertEqual(analyze_predicate("a == 1 and a == 2 or a == 3")
+                         .variables, set(["a"]))
+
+    def test_residual(self):
+        predicate = analyze_predicate("a + 1 > 2 and b >= 1 "
+                                      "and 'x' in name")
+        self.assertFalse(predicate.sargable)
+        conjunction = predicate.conjunctions[0]
+        self.assertEqual(conjunction.constraints,
+                         {"b": Constraint(low=1)})
+        self.assertEqual([str(node) for node in conjunction.residual],
+                         ["((a + 1) > 2)", "(x in name)"])
+
+        # Negated ranges are not sargable: NaN satisfies neither
+        predicate = analyze_predicate("not (a < 3)")
+        self.assertEqual(predicate.conjunctions[0].constraints, {})
+
+        # Too many conjunctions
+        predicate = analyze_predicate("(a == 1 or b == 1) and "
+                                      "(c == 1 or d == 1)", max_terms=2)
+        self.assertEqual(len(predicate.conjunctions), 1)
+        self.assertFalse(predicate.sargable)
+
+    def test_partitions(self):
+        predicate = analyze_predicate("region == 'EU' and amount >= 100 "
+                                      "or amount > 1000")
+        self.assertFalse(predicate.may_match({"amount": (0, 99)}))
+        self.assertTrue(predicate.may_match({"amount": (0, 100)}))
+        self.assertTrue(predicate.may_match({"amount": (0, 2000),
+                                             "region": ("CZ", "DE")}))
+        self.assertFalse(predicate.may_match({"amount": (0, 500),
+                                              "region": ("CZ", "DE")}))
+        self.assertTrue(predicate.may_match({}))
+
+
+class PredicateFilterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.rows = [{"region": region, "amount": amount, "code": code}
+                     for region, amount, code in [("EU", 50, 1),
+                                                  ("US", 150, 2),
+                                                  ("EU", 250, 3),
+                                                  ("EU", float("nan"), 4),
+                                                  ("DE", 150, 5),
+                                                  (None, 300, 6)]]
+        self.filter = PredicateFilter(self.rows, ["region", "amount"])
+
+    def test_filter(self):
+        cases = [
+            ("region == 'EU' and amount >= 100 and amount < 500", [2]),
+            ("region == 'EU' or region == 'DE'", [0, 2, 3, 4]),
+            ("amount > 100 and code != 2", [2, 4, 5]),
+            ("amount > 100 and code < 5", [1, 2]),
+            ("region != 'EU'", [1, 4, 5]),
+            ("amount > -100 and code <= 2", [0, 1]),
+            ("amount > 500 and amount < 100", []),
+        ]
+        for text, expected in cases:
+            self.assertEqual(self.filter.positions(text), expected, text)
+
+        self.assertEqual(self.filter.filter("code == 3"), [self.rows[2]])
+
+    def test_evaluations(self):
+        self.filter.positions("region == 'EU' and amount >= 100")
+        self.assertEqual(self.filter.evaluations, 0)
+        self.filter.positions("region == 'EU' and code > 1")
+        self.assertEqual(self.filter.evaluations, 3)
+
+    def test_index(self):
+        index = SortedIndex([3, None, 1, 2, float("nan"), 2])
+        self.assertEqual(len(index), 4)
+        with self.assertRaises(ExpressionError):
+            SortedIndex([1, "a"])
@@ -0,0 +1,79 @@
+# -*- encoding: utf8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+from expressions import Compiler, ExpressionError, parse_expression
+from expressions.serialization import dumps, loads, PersistentCache
+
+from .test_parser import TracingCompiler, EXPRESSIONS
+
+
+class SerializationTestCase(unittest.TestCase):
+    def test_round_trip(self):
+        texts = EXPRESSIONS + [u"'žluť' + 'x' + 1.5e300 + 2 ^ 70",
+                               "f(a, a, g(b.c, 1)) - 1.0 + 1"]
+        for text in texts:
+            parsed = parse_expression(text)
+            loaded = loads(dumps(parsed))
+
+            self.assertEqual(loaded.text, parsed.text)
+            self.assertEqual(loaded.instructions, parsed.instructions)
+
+            literals = [i[1] for i in loaded.instructions if i[0] == 0]
+            self.assertEqual([type(v) for v in literals],
+                             [type(i[1]) for i in parsed.instructions
+                              if i[0] == 0])
+
+            self.assertEqual(loaded.replay(TracingCompiler()),
+                             TracingCompiler().compile(text))
+
+    def test_invalid(self):
+        data = dumps(parse_expression("a + 1"))
+        for invalid in [b"", b"EXPR", data[:-6], b"XXXX" + data[4:],
+                        data[:4] + b"\x09" + data[5:]]:
+            with self.assertRaises(ExpressionError):
+                loads(invalid)
+
+
+class PersistentCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "cache")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_persistence(self):
+        with PersistentCache(self.path) as cache:
+            compiler = Compiler(cache=cache)
+            result = compiler.compile("a + b * 2")
+            compiler.compile("f(x)")
+            self.assertEqual(cache.misses, 2)
+            cache.save()
+
+        with PersistentCache(self.path) as cache:
+            compiler = Compiler(cache=cache)
+            self.assertEqual(compiler.compile("a + b * 2"), result)
+            compiler.compile("a + b * 2")
+            compiler.compile("new")
+            self.assertEqual((cache.loaded, cache.hits, cache.misses),
+                             (1, 1, 1))
+            cache.save()
+
+        with PersistentCache(self.path) as cache:
+            for text in ["a + b * 2", "f(x)", "new"]:
+                cache.parse(text)
+            self.assertEqual((cache.loaded, cache.misses), (3, 0))
+
+    def test_invalid_file(self):
+        with open(self.path, "wb") as f:
+            f.write(b"garbage")
+
+        with PersistentCache(self.path) as cache:
+            self.assertEqual(len(cache.parse("a + 1")), 3)
+            cache.save()
+
+        with PersistentCache(self.path) as cache:
+            cache.parse("a + 1")
+            self.assertEqual(cache.loaded, 1)
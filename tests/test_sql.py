@@ -0,0 +1,130 @@
+# -*- encoding: utf8 -*-
+import sqlite3
+import unittest
+from expressions import ExpressionError
+from expressions.evaluator import PythonCodeCompiler
+from expressions.instrumentation import Instrumentation
+from expressions.sql import SQLCompiler, SQLExpression
+
+
+def _math_functions():
+    try:
+        sqlite3.connect(":memory:").execute("SELECT floor(1.5), power(2, 3)")
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+
+ROWS = [(7, 2, "abc"), (-7, 3, "xbz"), (3.5, -2, "b")]
+
+
+class SQLiteTestCase(unittest.TestCase):
+    def setUp(self):
+        self.db = sqlite3.connect(":memory:")
+        self.db.execute("CREATE TABLE data (a, b, name)")
+        self.db.executemany("INSERT INTO data VALUES (?, ?, ?)", ROWS)
+        self.rows = [dict(zip(["a", "b", "name"], row)) for row in ROWS]
+
+    def assertSameResults(self, text):
+        expression = SQLCompiler().compile(text)
+        cursor = self.db.execute("SELECT {} FROM data".format(expression.sql),
+                                 expression.params)
+        evaluator = PythonCodeCompiler().compile(text)
+        self.assertEqual([row[0] for row in cursor],
+                         [evaluator(row) for row in self.rows], text)
+
+    def test_operators(self):
+        texts = [
+            "a + b * 2 - 1",
+            "a / b",
+            "-a + ~2",
+            "a < b and not b > 1",
+            "a <= 3 or b >= 3",
+            "a == 7 or b != 2",
+            "'b' in name",
+            "a is 7",
+            "1 << 3 | b & 2 >> 1",
+            "max(a, b, 1) + min(a, 0) + abs(b)",
+            "round(a / 3, 2)",
+        ]
+        for text in texts:
+            self.assertSameResults(text)
+
+    @unittest.skipIf(not _math_functions(),
+                     "SQLite without math functions")
+    def test_math(self):
+        for text in ["a // b", "a ^ 2", "sqrt(abs(a)) + log(abs(b))",
+                     "floor(a / 3) + ceil(b / 3)", "exp(b) + log10(100)"]:
+            self.assertSameResults(text)
+
+    def test_parameters(self):
+        compiler = SQLCompiler()
+        first = compiler.compile("price * 1.2 + 'x'")
+        self.assertEqual(first, SQLExpression('(("price" * ?1) + ?2)',
+                                              (1.2, "x")))
+        second = compiler.compile("price*1.5+'y'")
+        self.assertEqual(second.sql, first.sql)
+        self.assertEqual(second.params, (1.5, "y"))
+        self.assertEqual(compiler.statement_cache_info().hits, 1)
+
+        # Operands of `in` are swapped, the parameters are numbered
+        expression = compiler.compile("'a' in 'abc'")
+        self.assertEqual(expression.sql, "(instr(?2, ?1) > 0)")
+        cursor = self.db.execute("SELECT " + expression.sql,
+                                 expression.params)
+        self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_schema(self):
+        compiler = SQLCompiler()
+        self.assertEqual(compiler.compile("sales.amount").sql,
+                         '"sales"."amount"')
+        self.assertEqual(compiler.compile("a + b", ["a", "b"]).sql,
+                         '("a" + "b")')
+        self.assertEqual(compiler.compile("a", {"a": "t.amount"}).sql,
+                         "t.amount")
+        with self.assertRaises(ExpressionError):
+            compiler.compile("c", ["a", "b"])
+        with self.assertRaises(ExpressionError):
+            compiler.compile("unknown(a)")
+
+        compiler = SQLCompiler(statement_cache_size=0,
+                               instrumentation=Instrumentation())
+        self.assertEqual(compiler.compile("a + 1").params, (1, ))
+
+    def test_compile_many(self):
+        compiler = SQLCompiler()
+        self.assertEqual(compiler.compile_many(["a + 1", "(a + 1) * 2"]),
+                         [SQLExpression('("a" + ?1)', (1, )),
+                          SQLExpression('(("a" + ?1) * ?2)', (1, 2))])
+
+    def test_finalize(self):
+        class WrappingCompiler(SQLCompiler):
+            def finalize(self, context, obj):
+                expression = super(WrappingCompiler, self).finalize(context,
+                                                                    obj)
+                return ("wrapped", expression)
+
+        compiler = WrappingCompiler()
+        # Compiled and taken from the SQL text cache
+        self.assertEqual(compiler.compile("a + 1"),
+                         ("wrapped", SQLExpression('("a" + ?1)', (1, ))))
+        self.assertEqual(compiler.compile("a + 2"),
+                         ("wrapped", SQLExpression('("a" + ?1)', (2, ))))
+        self.assertEqual(compiler.statement_cache_info().hits, 1)
+
+
+class PostgreSQLTestCase(unittest.TestCase):
+    def test_compile(self):
+        compiler = SQLCompiler("postgresql")
+        expression = compiler.compile("max(a, 1) % 2 + b // 2")
+        self.assertEqual(expression.sql,
+                         "(mod(greatest(\"a\", %(p1)s), %(p2)s) + "
+                         "CAST(floor(CAST(\"b\" AS DOUBLE PRECISION) / "
+                         "%(p3)s) AS BIGINT))")
+        self.assertEqual(expression.params, {"p1": 1, "p2": 2, "p3": 2})
+        self.assertEqual(compiler.compile("a is 'x'").sql,
+                         '("a" IS NOT DISTINCT FROM %(p1)s)')
+        self.assertEqual(compiler.dialect.quote(["t", "b%"]), '"t"."b%%"')
+
+        with self.assertRaises(ExpressionError):
+            SQLCompiler("oracle")
@@ -0,0 +1,62 @@
+# -*- encoding: utf8 -*-
+import csv
+import io
+import unittest
+from expressions import ExpressionError
+from expressions.evaluator import PythonCodeCompiler
+from expressions.streaming import evaluate_stream
+
+
+CSV = u"id,price,quantity,note\n1,2.5,4,a\n2,1.0,3,b\n"
+
+
+class StreamingTestCase(unittest.TestCase):
+    def test_mappings(self):
+        rows = [{"a": 1, "b": 2}, {"a": 3, "b": 4}]
+        self.assertEqual(list(evaluate_stream("a + b", rows)), [3, 7])
+        self.assertEqual(list(evaluate_stream(["a + b", "a * b"], rows)),
+                         [(3, 2), (7, 12)])
+        self.assertEqual(list(evaluate_stream({"c": "a + b"}, rows)),
+                         [{"a": 1, "b": 2, "c": 3}, {"a": 3, "b": 4, "c": 7}])
+        # Rows are not modified
+        self.assertEqual(rows[0], {"a": 1, "b": 2})
+
+    def test_tuples(self):
+        rows = [(1, 2), (3, 4)]
+        self.assertEqual(list(evaluate_stream("b - a", rows, ["a", "b"])),
+                         [1, 1])
+        self.assertEqual(list(evaluate_stream({"c": "b - a"}, rows,
+                                              ["a", "b"])),
+                         [(1, 2, 1), (3, 4, 1)])
+
+    def test_lazy(self):
+        def rows():
+            yield {"a": 1}
+            raise RuntimeError("Read too far")
+
+        results = evaluate_stream("a * 2", rows())
+        self.assertEqual(next(results), 2)
+
+    def test_csv(self):
+        reader = csv.reader(io.StringIO(CSV))
+        results = evaluate_stream("price * quantity", reader, header=True,
+                                  convert=float)
+        self.assertEqual(list(results), [10.0, 3.0])
+
+        reader = csv.reader(io.StringIO(CSV))
+        results = evaluate_stream({"total": "price * quantity"}, reader,
+                                  header=True,
+                                  convert={"price": float, "quantity": int})
+        self.assertEqual(list(results), [("1", "2.5", "4", "a", 10.0),
+                                         ("2", "1.0", "3", "b", 3.0)])
+
+    def test_unknown_column(self):
+        with self.assertRaises(ExpressionError):
+            evaluate_stream("price * amount", csv.reader(io.StringIO(CSV)),
+                            header=True, convert=float)
+
+    def test_compile_many(self):
+        evaluator = PythonCodeCompiler().compile_many(["a + 1", "b", "a"],
+                                                      ["a", "b"])
+        self.assertEqual(evaluator.variables, ["a", "b"])
+        self.assertEqual(evaluator((1, 2)), (2, 2, 1))
@@ -0,0 +1,147 @@
+# -*- encoding: utf8 -*-
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+from expressions import Compiler, ExpressionCache, ExpressionInspector
+from expressions.evaluator import PythonCodeCompiler
+from expressions.instrumentation import Instrumentation
+from expressions.serialization import PersistentCache
+
+
+THREADS = 16
+TEXTS = ["a{0} + b * {0} - f(c{0}, d.e)".format(i) for i in range(50)] \
+        + ["(x - y{0}) / (x - y{0}) + g(z)".format(i) for i in range(50)]
+
+
+def run_threads(function, count=THREADS):
+    """Call `function(number)` from `count` threads started together, return
+    list of results ordered by the thread number."""
+    results = [None] * count
+    errors = []
+    barrier = threading.Event()
+
+    def target(number):
+        barrier.wait()
+        try:
+            results[number] = function(number)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=target, args=(i, ))
+               for i in range(count)]
+    for thread in threads:
+        thread.start()
+    barrier.set()
+    for thread in threads:
+        thread.join()
+
+    if errors:
+        raise errors[0]
+    return results
+
+
+class ThreadSafetyTestCase(unittest.TestCase):
+    def setUp(self):
+        # Switch threads as often as possible
+        self.interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+
+    def tearDown(self):
+        sys.setswitchinterval(self.interval)
+
+    def shifted(self, number):
+        # Every thread compiles the texts in a different order
+        return TEXTS[number:] + TEXTS[:number]
+
+    def test_compiler(self):
+        compiler = Compiler(cache=ExpressionCache(10))
+        expected = dict((text, Compiler(cache=False).compile(text))
+                        for text in TEXTS)
+
+        def compile(number):
+            texts = self.shifted(number)
+            return texts, [compiler.compile(text) for text in texts]
+
+        for texts, results in run_threads(compile):
+            self.assertEqual(results, [expected[text] for text in texts])
+
+    def test_code_compiler(self):
+        compiler = PythonCodeCompiler(functions={"f": max, "g": abs})
+        row = dict((name, 3) for name in
+                   ["b", "c", "x", "z", "d.e"]
+                   + ["a{}".format(i) for i in range(50)]
+                   + ["c{}".format(i) for i in range(50)]
+                   + ["y{}".format(i) for i in range(50)])
+
+        def evaluate(number):
+            texts = self.shifted(number)
+            results = []
+            for text in texts:
+                evaluator = compiler.compile(text)
+                try:
+                    results.append(evaluator(row))
+                except ZeroDivisionError:
+                    results.append(None)
+            return texts, results
+
+        expected = dict(zip(*evaluate(0)))
+        for texts, results in run_threads(evaluate):
+            self.assertEqual(results, [expected[text] for text in texts])
+
+    def test_inspector(self):
+        inspector = ExpressionInspector()
+
+        def inspect(number):
+            return [inspector.compile(text) for text in self.shifted(number)]
+
+        for number, results in enumerate(run_threads(inspect)):
+            for text, (variables, functions) in zip(self.shifted(number),
+                                                    results):
+                expected = ExpressionInspector().compile(text)
+                self.assertEqual((variables, functions), expected)
+
+        self.assertEqual(inspector.functions, set(["f", "g"]))
+        self.assertIn("d.e", inspector.variables)
+        self.assertEqual(len(inspector.variables), 154)
+
+    def test_instrumentation(self):
+        instrumentation = Instrumentation()
+        compiler = Compiler(instrumentation=instrumentation)
+
+        run_threads(lambda number: [compiler.compile(text)
+                                    for text in self.shifted(number)])
+
+        self.assertEqual(instrumentation.as_dict()["compilations"],
+                         THREADS * len(TEXTS))
+
+    def test_persistent_cache(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, "expressions.cache")
+
+        with PersistentCache(path) as cache:
+            for text in TEXTS[:50]:
+                cache.parse(text)
+            cache.save()
+
+        cache = PersistentCache(path, maxsize=0)
+        self.addCleanup(cache.close)
+        expected = dict((text, Compiler(cache=False).compile(text))
+                        for text in TEXTS)
+
+        def compile(number):
+            compiler = Compiler(cache=cache)
+            texts = self.shifted(number)
+            results = []
+            for i, text in enumerate(texts):
+                results.append(compiler.compile(text))
+                if number % 4 == 0 and i % 25 == 0:
+                    cache.save()
+            return texts, results
+
+        for texts, results in run_threads(compile):
+            self.assertEqual(results, [expected[text] for text in texts])
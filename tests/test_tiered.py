@@ -0,0 +1,72 @@
+# -*- encoding: utf8 -*-
+import unittest
+from expressions import ExpressionError, ExpressionLimitError, Limits
+from expressions.evaluator import PythonCodeCompiler, Evaluator
+from expressions.tiered import Interpreter, TieredExecutor
+
+
+class InterpreterTestCase(unittest.TestCase):
+    def test_same_as_compiled(self):
+        row = {"a": 3, "b": 0, "s": "text"}
+        texts = ["a + b * 2", "a / 2", "a // 2", "a ^ 2", "-a % 2",
+                 "a << 1 | 1", "not b", "b != 0 and a / b > 1",
+                 "b or a", "'ex' in s", "a is 3", "max(a, b, 7)",
+                 "abs(-a)", "a >= 3 and s == 'text'"]
+        interpreter = Interpreter()
+        compiler = PythonCodeCompiler()
+        for text in texts:
+            self.assertEqual(interpreter.compile(text)(row),
+                             compiler.compile(text)(row), text)
+
+    def test_schema(self):
+        function = Interpreter().compile("a - b", ["a", "b"])
+        self.assertEqual(function((5, 2)), 3)
+        with self.assertRaises(ExpressionError):
+            Interpreter().compile("c", ["a", "b"])
+        with self.assertRaises(ExpressionError):
+            Interpreter().compile("nothing(a)")
+
+
+class TieredExecutorTestCase(unittest.TestCase):
+    def test_promotion(self):
+        executor = TieredExecutor(threshold=3)
+        self.assertEqual([executor("a * 2", {"a": i}) for i in range(5)],
+                         [0, 2, 4, 6, 8])
+        self.assertEqual(list(executor.evaluate("a + 1", [{"a": 1}])), [2])
+
+        self.assertEqual(executor.tiers(),
+                         {"a * 2": {"tier": "compiled", "calls": 5},
+                          "a + 1": {"tier": "interpreted", "calls": 1}})
+        self.assertEqual(executor.counters(),
+                         {"interpreted": 1, "compiled": 1,
+                          "interpreted_calls": 3, "compiled_calls": 3,
+                          "promotions": 1, "failures": 0})
+        self.assertEqual(len(executor), 2)
+
+    def test_schema(self):
+        executor = TieredExecutor(threshold=1, schema=["a", "b"])
+        self.assertEqual(executor("a - b", (5, 2)), 3)
+        self.assertEqual(executor.get("a - b").tier, "compiled")
+
+        with self.assertRaises(ExpressionError):
+            TieredExecutor(threshold=0)
+
+    def test_limits(self):
+        executor = TieredExecutor(threshold=5, limits=Limits(max_steps=30,
+                                                             max_nodes=10))
+        rows = [{"a": i} for i in range(20)]
+        # Three nodes, ten rows within the budget on both tiers
+        self.assertEqual(list(executor.evaluate("a + 1", rows[:10])),
+                         list(range(1, 11)))
+        self.assertEqual(executor.get("a + 1").tier, "compiled")
+        with self.assertRaises(ExpressionLimitError):
+            list(executor.evaluate("a + 1", rows))
+        with self.assertRaises(ExpressionLimitError):
+            list(executor.evaluate("a * 2", rows))
+        with self.assertRaises(ExpressionLimitError):
+            executor.get("a + a + a + a + a + a")
+
+    def test_compiled_function(self):
+        executor = TieredExecutor(threshold=1)
+        self.assertEqual(executor("a + 1", {"a": 1}), 2)
+        self.assertNotIsInstance(executor.get("a + 1").function, Evaluator)
@@ -0,0 +1,107 @@
+# -*- encoding: utf8 -*-
+import unittest
+from expressions import parse_expression, ExpressionTypeError
+from expressions.evaluator import PythonCodeCompiler
+from expressions.types import infer_types, TypeChecker
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+else:
+    from expressions.vectorized import NumpyCompiler
+
+
+TYPES = {"flag": bool, "count": int, "price": float, "name": str,
+         "rate": "float"}
+
+
+def result_type(text, types=TYPES):
+    return infer_types(parse_expression(text), types)[-1]
+
+
+class TypeInferenceTestCase(unittest.TestCase):
+    def test_types(self):
+        cases = [
+            ("count + 1", "int"),
+            ("count / 2", "float"),
+            ("count // 2 + price", "float"),
+            ("flag + flag", "int"),
+            ("-flag", "int"),
+            ("flag & flag", "bool"),
+            ("count << 2", "int"),
+            ("price < count and flag", "bool"),
+            ("count and count", "int"),
+            ("name + 'x'", "str"),
+            ("name * 2", "str"),
+            ("'a' in name", "bool"),
+            ("not name", "bool"),
+            ("rate ^ 2", "float"),
+            ("count ^ 2", "any"),
+            ("unknown + 1", "any"),
+            ("sqrt(count)", "float"),
+            ("max(count, flag, 1)", "int"),
+            ("f(count)", "any"),
+        ]
+        for text, expected in cases:
+            self.assertEqual(result_type(text), expected, text)
+
+        self.assertEqual(infer_types(parse_expression("count * 1.5"),
+                                     TYPES),
+                         ["int", "float", "float"])
+
+    def test_errors(self):
+        for text in ["name - 1", "name < count", "price & 1", "~price",
+                     "-name", "sqrt(name)", "sqrt(1, 2)", "name * name"]:
+            with self.assertRaises(ExpressionTypeError):
+                result_type(text)
+
+        with self.assertRaises(ExpressionTypeError):
+            TypeChecker({"a": list})
+
+    def test_signatures(self):
+        checker = TypeChecker(TYPES, {"upper": (("str", ), "str"),
+                                      "total": ("number", "float")})
+        self.assertEqual(checker.function("upper", ["str"]), "str")
+        self.assertEqual(checker.function("total", ["int", "float"]),
+                         "float")
+        with self.assertRaises(ExpressionTypeError):
+            checker.function("upper", ["int"])
+        with self.assertRaises(ExpressionTypeError):
+            checker.function("total", ["str"])
+
+
+class TypedCompilersTestCase(unittest.TestCase):
+    def test_python(self):
+        compiler = PythonCodeCompiler(types=TYPES)
+        self.assertEqual(compiler.compile("flag + count")({"flag": True,
+                                                           "count": 2}), 3)
+        evaluator = compiler.compile_many(["count * 2 + 1",
+                                           "(count * 2 + 1) / 2"])
+        self.assertEqual(evaluator({"count": 1}), (3, 1.5))
+
+        with self.assertRaises(ExpressionTypeError):
+            compiler.compile("name - 1")
+        # Without types the error is found only by evaluation
+        PythonCodeCompiler().compile("name - 1")
+
+    @unittest.skipIf(numpy is None, "NumPy is not available")
+    def test_numpy(self):
+        compiler = NumpyCompiler(types=TYPES)
+        flags = numpy.array([True, False, True])
+        columns = {"flag": flags, "count": numpy.array([1, 2, 3])}
+
+        # Booleans are added and negated as integers, as in Python
+        for text, expected in [("flag + flag", [2, 0, 2]),
+                               ("-flag", [-1, 0, -1]),
+                               ("flag - flag", [0, 0, 0]),
+                               ("flag & flag", [True, False, True]),
+                               ("flag * count", [1, 0, 3])]:
+            plan = compiler.compile(text)
+            self.assertEqual(plan.execute(columns).tolist(), expected)
+            self.assertEqual(plan.execute_blocked(columns,
+                                                  block_size=2).tolist(),
+                             expected)
+
+        with self.assertRaises(ExpressionTypeError):
+            compiler.compile("name - 1")
@@ -0,0 +1,129 @@
+# -*- encoding: utf8 -*-
+import pickle
+import unittest
+from expressions import ExpressionError
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+else:
+    from expressions.vectorized import NumpyCompiler, NumpyPlan
+
+
+@unittest.skipIf(numpy is None, "NumPy is not available")
+class NumpyCompilerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.compiler = NumpyCompiler()
+        self.columns = {
+            "a": numpy.array([1, 2, 3, 4]),
+            "b": numpy.array([4, 3, 2, 1]),
+            "x": numpy.array([0.25, 1.0, 4.0, 9.0]),
+        }
+
+    def evaluate(self, text):
+        return self.compiler.compile(text).execute(self.columns)
+
+    def assertArrayEqual(self, result, expected):
+        self.assertEqual(list(result), list(expected))
+
+    def test_arithmetic(self):
+        self.assertArrayEqual(self.evaluate("a + b * 2"), [9, 8, 7, 6])
+        self.assertArrayEqual(self.evaluate("a / 2"), [0.5, 1.0, 1.5, 2.0])
+        self.assertArrayEqual(self.evaluate("a // 2"), [0, 1, 1, 2])
+        self.assertArrayEqual(self.evaluate("a % 3"), [1, 2, 0, 1])
+        self.assertArrayEqual(self.evaluate("a ^ 2"), [1, 4, 9, 16])
+        self.assertArrayEqual(self.evaluate("-a"), [-1, -2, -3, -4])
+
+    def test_bitwise(self):
+        self.assertArrayEqual(self.evaluate("a << 1"), [2, 4, 6, 8])
+        self.assertArrayEqual(self.evaluate("a & 1 | 8"), [9, 8, 9, 8])
+        self.assertArrayEqual(self.evaluate("~a"), [-2, -3, -4, -5])
+
+    def test_logical(self):
+        self.assertArrayEqual(self.evaluate("a < b"),
+                              [True, True, False, False])
+        self.assertArrayEqual(self.evaluate("a > 1 and not b == 1"),
+                              [False, True, True, False])
+        self.assertArrayEqual(self.evaluate("a == 1 or b == 1"),
+                              [True, False, False, True])
+        self.assertArrayEqual(self.evaluate("a in b"),
+                              [True, True, True, True])
+
+    def test_functions(self):
+        self.assertArrayEqual(self.evaluate("sqrt(x)"), [0.5, 1, 2, 3])
+        self.assertArrayEqual(self.evaluate("max(a, b)"), [4, 3, 3, 4])
+        self.assertArrayEqual(self.evaluate("min(a, b, 2)"), [1, 2, 2, 1])
+        self.assertArrayEqual(self.evaluate("abs(a - b)"), [3, 1, 1, 3])
+
+        with self.assertRaises(ExpressionError):
+            self.evaluate("sqrt(a, b)")
+        with self.assertRaises(ExpressionError):
+            self.evaluate("unknown(a)")
+
+    def test_dotted_variables(self):
+        plan = self.compiler.compile("sales.amount * 2")
+        self.assertEqual(plan.variables, ["sales.amount"])
+
+        columns = {"sales": {"amount": numpy.array([1, 2])}}
+        self.assertArrayEqual(plan.execute(columns), [2, 4])
+
+        columns = {"sales.amount": numpy.array([3])}
+        self.assertArrayEqual(plan.execute(columns), [6])
+
+        with self.assertRaises(ExpressionError):
+            plan.execute({"sales": {}})
+
+    def test_reusable_plan(self):
+        plan = self.compiler.compile("a * a + a")
+        self.assertIsInstance(plan, NumpyPlan)
+        self.assertEqual(plan.variables, ["a"])
+
+        self.assertArrayEqual(plan({"a": numpy.arange(3)}), [0, 2, 6])
+        self.assertArrayEqual(plan({"a": numpy.arange(2)}), [0, 2])
+
+        plan = pickle.loads(pickle.dumps(plan))
+        self.assertArrayEqual(plan({"a": numpy.arange(3)}), [0, 2, 6])
+
+    def test_allowed_columns(self):
+        self.compiler.compile("a + b", ["a", "b"])
+        with self.assertRaises(ExpressionError):
+            self.compiler.compile("a + c", ["a", "b"])
+
+    def test_single_operand(self):
+        self.assertArrayEqual(self.evaluate("a"), [1, 2, 3, 4])
+        self.assertEqual(self.evaluate("1 + 2"), 3)
+
+    def test_blocked(self):
+        columns = {
+            "a": numpy.arange(1000),
+            "b": numpy.arange(1000) * 0.5,
+            "s": numpy.array([3, 5, 7]),
+        }
+        expressions = ["a * b + a * 2 - b", "max(a, b, 10) // 3",
+                       "a in s or b > 400", "a", "1 + 2 + a"]
+
+        for text in expressions:
+            plan = self.compiler.compile(text)
+            expected = plan.execute(columns)
+
+            result = plan.execute_blocked(columns, block_size=64)
+            self.assertEqual(result.dtype, expected.dtype)
+            self.assertArrayEqual(result, expected)
+
+            out = numpy.empty(1000, dtype=expected.dtype)
+            result = plan.execute_blocked(columns, out=out, block_size=300)
+            self.assertIs(result, out)
+            self.assertArrayEqual(out, expected)
+
+    def test_blocked_constant(self):
+        plan = self.compiler.compile("1 + 2")
+        self.assertEqual(plan.execute_blocked({}), 3)
+
+        plan = self.compiler.compile("a * 0 + 2 ^ 3")
+        out = numpy.zeros(4, dtype=int)
+        plan.execute_blocked(self.columns, out=out)
+        self.assertArrayEqual(out, [8, 8, 8, 8])
+
+        with self.assertRaises(ExpressionError):
+            plan.execute_blocked(self.columns, out=numpy.zeros(3))